@@ -0,0 +1,54 @@
+"""
+Lookup benchmark for the IP ban list.
+
+Compares the compiled IPBanList against the linear scan over a list of
+ip_address objects the old ban_ips middleware did.
+
+    python -m benchmarks.bench_ip_ban --entries 100000
+"""
+import argparse
+import random
+import timeit
+from ipaddress import IPv4Address, ip_address
+
+from src.middleware.ban import IPBanList
+
+
+def random_networks(count: int, seed: int = 13) -> list[str]:
+    rnd = random.Random(seed)
+    networks = []
+    for _ in range(count):
+        prefix = rnd.choice((32, 32, 32, 28, 24, 16))
+        address = IPv4Address(rnd.getrandbits(32))
+        networks.append(f"{address}/{prefix}")
+    return networks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    networks = random_networks(args.entries)
+    rnd = random.Random(42)
+    hosts = [str(IPv4Address(rnd.getrandbits(32))) for _ in range(1000)]
+
+    build = timeit.timeit(lambda: IPBanList(networks), number=1)
+    ban_list = IPBanList(networks)
+    compiled = timeit.timeit(lambda: [h in ban_list for h in hosts], number=args.lookups // len(hosts))
+    per_lookup = compiled / args.lookups * 1e6
+
+    banned_ips = [ip_address(n.split("/")[0]) for n in networks]
+    scan_hosts = hosts[:20]
+    scan = timeit.timeit(lambda: [ip_address(h) in banned_ips for h in scan_hosts], number=1)
+    per_scan = scan / len(scan_hosts) * 1e6
+
+    print(f"entries:            {args.entries}")
+    print(f"compile:            {build * 1000:.1f} ms")
+    print(f"IPBanList lookup:   {per_lookup:.2f} us")
+    print(f"list scan lookup:   {per_scan:.2f} us (addresses only, no ranges)")
+
+
+if __name__ == "__main__":
+    main()
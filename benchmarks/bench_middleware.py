@@ -0,0 +1,120 @@
+"""
+Latency benchmark of the middleware stack on the bare routes.
+
+Calls the ASGI app directly (no sockets) for "/" and "/api/healthchecker"
+and compares the current pure ASGI stack with the old one, where the ban
+check ran through @app.middleware("http") (BaseHTTPMiddleware). The
+database session is replaced with a stub so only framework overhead is
+measured.
+
+    python -m benchmarks.bench_middleware --requests 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from ipaddress import ip_address
+
+from fastapi import FastAPI, Request, status
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+import main
+from src.database.db import get_db
+
+
+class StubResult:
+    def fetchone(self):
+        return (1,)
+
+
+class StubSession:
+    async def execute(self, *args, **kwargs):
+        return StubResult()
+
+
+async def stub_db():
+    yield StubSession()
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI()
+    app.router.routes.extend(main.app.router.routes)
+    banned_ips = [ip_address("192.168.1.1"), ip_address("192.168.1.2")]
+    app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True,
+                       allow_methods=["*"], allow_headers=["*"])
+
+    @app.middleware("http")
+    async def ban_ips(request: Request, call_next):
+        ip = ip_address(request.client.host)
+        if ip in banned_ips:
+            return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
+        return await call_next(request)
+
+    return app
+
+
+async def call(app, path: str) -> None:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("10.0.0.1", 50000), "server": ("bench", 80),
+    }
+
+    request_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"{path} answered {message['status']}")
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_done.set()
+
+    await app(scope, receive, send)
+
+
+async def measure(app, path: str, requests: int) -> list[float]:
+    for _ in range(min(200, requests)):
+        await call(app, path)
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await call(app, path)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summary(timings: list[float]) -> str:
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1e6
+    return f"mean {statistics.fmean(timings) * 1e6:8.1f} us   p50 {p50:8.1f} us   p99 {p99:8.1f} us"
+
+
+async def run(requests: int) -> None:
+    stacks = {"current": main.app, "legacy": legacy_app()}
+    for app in stacks.values():
+        app.dependency_overrides[get_db] = stub_db
+    for path in ("/", "/api/healthchecker"):
+        for name, app in stacks.items():
+            timings = await measure(app, path, requests)
+            print(f"{path:20} {name:8} {summary(timings)}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,142 @@
+"""
+Per-user query benchmark for the hash-partitioned contacts table.
+
+Builds a plain and a hash-partitioned copy of the contacts layout in a
+scratch schema of the database from DB_URL, fills both with the same
+generated rows (--users users with --contacts contacts each) and times the
+per-user queries of the API: the user's contacts ordered by updated_at, one
+contact by id and user, and the user's birthdays in a week. Also prints how
+many relations (partitions) the plan of each query touches. The schema is
+dropped at the end.
+
+    python -m benchmarks.bench_partitioning --users 1000 --contacts 1000
+    python -m benchmarks.bench_partitioning --users 100,1000,5000 --partitions 16
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.conf.config import config
+
+
+SCHEMA = "bench_partitioning"
+QUERIES = {
+    "list by user": "SELECT * FROM {table} WHERE user_id = :user_id ORDER BY updated_at DESC LIMIT 50",
+    "get by id+user": "SELECT * FROM {table} WHERE user_id = :user_id AND id = :id",
+    "birthdays": "SELECT * FROM {table} WHERE user_id = :user_id "
+                 "AND birthday BETWEEN date '1990-01-01' AND date '1990-01-07'",
+}
+
+
+def table_ddl(name: str, partitions: int) -> list[str]:
+    partitioned = partitions > 0
+    statements = [f"""
+        CREATE TABLE {SCHEMA}.{name} (
+            id integer NOT NULL,
+            email varchar(100) NOT NULL,
+            phone varchar(25) NOT NULL,
+            birthday date NOT NULL,
+            f_name varchar(50) NOT NULL,
+            l_name varchar(50) NOT NULL,
+            additional_data varchar NOT NULL,
+            created_at timestamp,
+            updated_at timestamp,
+            user_id integer NOT NULL,
+            PRIMARY KEY ({"user_id, id" if partitioned else "id"})
+        ) {"PARTITION BY HASH (user_id)" if partitioned else ""}
+    """]
+    statements += [f"CREATE TABLE {SCHEMA}.{name}_p{remainder:02d} PARTITION OF {SCHEMA}.{name} "
+                   f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                   for remainder in range(partitions)]
+    statements.append(f"CREATE INDEX ON {SCHEMA}.{name} (user_id, updated_at)")
+    return statements
+
+
+async def build(conn, users: int, contacts: int, partitions: int):
+    await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    for statement in table_ddl("plain", 0) + table_ddl("partitioned", partitions):
+        await conn.execute(text(statement))
+    # contacts of a user are spread over the id space, as they are when users add them over time
+    await conn.execute(text(f"""
+        INSERT INTO {SCHEMA}.plain
+        SELECT n, 'contact' || n || '@example.com', '+380' || lpad((n % 1000000000)::text, 9, '0'),
+               date '1970-01-01' + (n % 12775), 'Name' || n, 'Koval', 'bench',
+               now() - (n % 100000) * interval '1 minute', now() - (n % 100000) * interval '1 minute',
+               n % :users + 1
+        FROM generate_series(1, :rows) AS n
+    """), {"users": users, "rows": users * contacts})
+    await conn.execute(text(f"INSERT INTO {SCHEMA}.partitioned SELECT * FROM {SCHEMA}.plain"))
+    await conn.execute(text(f"ANALYZE {SCHEMA}.plain"))
+    await conn.execute(text(f"ANALYZE {SCHEMA}.partitioned"))
+
+
+async def partitions_scanned(conn, table: str, query: str, params: dict) -> int:
+    plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {query.format(table=f'{SCHEMA}.{table}')}"),
+                               params)).scalar()
+
+    def relations(node: dict) -> set[str]:
+        found = {node["Relation Name"]} if "Relation Name" in node else set()
+        for child in node.get("Plans", []):
+            found |= relations(child)
+        return found
+
+    return len(relations(plan[0]["Plan"]))
+
+
+async def measure(conn, table: str, query: str, samples: list[dict]) -> list[float]:
+    statement = text(query.format(table=f"{SCHEMA}.{table}"))
+    timings = []
+    for params in samples:
+        started = time.perf_counter()
+        (await conn.execute(statement, params)).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def run(users_list: list[int], contacts: int, partitions: int, lookups: int):
+    engine = create_async_engine(config.DB_URL)
+    rnd = random.Random(42)
+    try:
+        for users in users_list:
+            async with engine.begin() as conn:
+                started = time.perf_counter()
+                await build(conn, users, contacts, partitions)
+                print(f"\n{users} users x {contacts} contacts ({users * contacts} rows, {partitions} partitions), "
+                      f"built in {time.perf_counter() - started:.1f} s")
+            samples = []
+            for _ in range(lookups):
+                user_id = rnd.randrange(users) + 1
+                # ids of user u are u - 1 + k * users
+                samples.append({"user_id": user_id, "id": user_id - 1 + rnd.randrange(contacts) * users or users})
+            async with engine.connect() as conn:
+                for name, query in QUERIES.items():
+                    for table in ("plain", "partitioned"):
+                        await measure(conn, table, query, samples[:50])
+                        timings = sorted(await measure(conn, table, query, samples))
+                        scanned = await partitions_scanned(conn, table, query, samples[0])
+                        print(f"{name:16} {table:12} p50 {statistics.median(timings):7.3f} ms   "
+                              f"p95 {timings[int(len(timings) * 0.95)]:7.3f} ms   relations scanned {scanned}")
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="100,1000", help="comma separated user counts, one run each")
+    parser.add_argument("--contacts", type=int, default=200, help="contacts per user")
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run([int(users) for users in args.users.split(",")], args.contacts, args.partitions, args.lookups))
+
+
+if __name__ == "__main__":
+    main()
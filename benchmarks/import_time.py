@@ -0,0 +1,60 @@
+"""
+Import-time profile of the app.
+
+Runs `python -X importtime -c "import main"` in fresh interpreters and
+reports the median total import time plus the slowest top-level packages
+(cumulative time of the first import of each package), which is what an
+autoscaled worker pays on cold start before it can serve a request.
+
+    python -m benchmarks.import_time --runs 5 --top 15
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+def profile(module: str) -> dict[str, int]:
+    """
+    The profile function imports the module in a fresh interpreter with -X importtime.
+
+    :param module: str: The module to import
+    :return: Cumulative microseconds per imported module, the requested one included
+    :doc-author: Trelent
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, _, cumulative, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        timings.setdefault(name, int(cumulative))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [profile(args.module) for _ in range(args.runs)]
+    totals = [run[args.module] for run in runs]
+    packages: dict[str, list[int]] = {}
+    for run in runs:
+        for name, cumulative in run.items():
+            if "." not in name and name != args.module:
+                packages.setdefault(name, []).append(cumulative)
+
+    print(f"import {args.module}: median {statistics.median(totals) / 1000:.1f} ms "
+          f"(min {min(totals) / 1000:.1f}, max {max(totals) / 1000:.1f}, {args.runs} runs)\n")
+    ordered = sorted(packages.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    print(f"{'package':<30} {'cumulative ms':>14}")
+    for name, values in ordered[:args.top]:
+        print(f"{name:<30} {statistics.median(values) / 1000:14.1f}")
+
+
+if __name__ == "__main__":
+    main()
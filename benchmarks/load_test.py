@@ -0,0 +1,382 @@
+"""
+Load test of the HTTP API.
+
+Seeds N users x M contacts straight into the database from DB_URL, boots
+the app with uvicorn in a subprocess (or targets a running server with
+--url, which must use the same database), logs every user in and then
+runs each scenario for --duration seconds with --concurrency closed-loop
+clients. Prints RPS and p50/p95/p99 per scenario and saves the results
+as JSON under benchmarks/results, tagged with the current commit.
+
+    python -m benchmarks.load_test --users 50 --contacts 200 --concurrency 32
+    python -m benchmarks.load_test --scenarios list,get --compare benchmarks/results/<file>.json
+
+Rate limits are switched off in the booted server (RATE_LIMIT_ENABLED=false)
+unless --keep-rate-limits is given, otherwise the limiter is all that gets
+measured. Scenarios: login, list, list_names (list with fields=f_name,l_name),
+get, batch_get, search, birthday, by_phone, changes, create, update, delete
+(delete removes contacts made by create, so keep that order).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import httpx
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.conf.config import config
+from src.database.redis import redis_manager
+from src.entity.models import Contact, ContactTombstone, User
+from src.services.auth import auth_service
+from src.services.phone import to_e164
+
+
+RESULTS_DIR = Path(__file__).parent / "results"
+EMAIL_DOMAIN = "loadtest.example.com"
+PASSWORD = "bench-password"
+LAST_NAMES = ["Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Oliynyk", "Marchenko",
+              "Melnyk", "Koval", "Boyko", "Moroz", "Lysenko", "Savchenko", "Rudenko", "Petrenko"]
+SCENARIOS = ["login", "list", "list_names", "get", "batch_get", "search", "birthday", "by_phone", "changes", "create", "update", "delete"]
+
+
+class VirtualUser:
+    def __init__(self, email: str, contact_ids: list[int], phones: list[str]):
+        self.email = email
+        self.contact_ids = contact_ids
+        self.phones = phones
+        self.created: deque[int] = deque()
+        self.headers: dict[str, str] = {}
+        self.sync_token: str | None = None
+        self.sync_cursor: str | None = None
+
+
+def contact_body(rnd: random.Random, n: int) -> dict:
+    birthday = date(1970, 1, 1) + timedelta(days=rnd.randrange(365 * 35))
+    return {
+        "f_name": f"Name{n:05d}",
+        "l_name": rnd.choice(LAST_NAMES),
+        "email": f"contact{n}@example.com",
+        "phone": f"+380{rnd.randrange(10 ** 9):09d}",
+        "birthday": birthday.isoformat(),
+        "additional_data": "load test",
+    }
+
+
+async def seed(users: int, contacts: int, seed_value: int) -> list[VirtualUser]:
+    """
+    The seed function removes the users of previous runs and inserts fresh ones, confirmed,
+        with their contacts, in bulk and without going through the API.
+
+    :param users: int: How many users to create
+    :param contacts: int: How many contacts each user gets
+    :param seed_value: int: Seed of the generated data
+    :return: The virtual users with the ids of their contacts
+    :doc-author: Trelent
+    """
+    rnd = random.Random(seed_value)
+    engine = create_async_engine(config.DB_URL)
+    password = auth_service.get_password_hash(PASSWORD)
+    try:
+        async with engine.begin() as conn:
+            old = select(User.id).where(User.email.like(f"%@{EMAIL_DOMAIN}")).scalar_subquery()
+            await conn.execute(delete(ContactTombstone).where(ContactTombstone.user_id.in_(old)))
+            await conn.execute(delete(Contact).where(Contact.user_id.in_(old)))
+            await conn.execute(delete(User).where(User.email.like(f"%@{EMAIL_DOMAIN}")))
+
+            rows = [{"username": f"bench{i}", "email": f"bench{i}@{EMAIL_DOMAIN}", "password": password,
+                     "avatar": "https://www.gravatar.com/avatar/?d=mp", "confirmation": True}
+                    for i in range(users)]
+            # ids are zipped back onto rows: they have to come back in the order of rows
+            inserted = await conn.execute(insert(User).returning(User.id, sort_by_parameter_order=True), rows)
+            user_ids = inserted.scalars().all()
+
+            result = []
+            for user_id, row in zip(user_ids, rows):
+                bodies = [contact_body(rnd, n) for n in range(contacts)]
+                for body in bodies:
+                    body["birthday"] = date.fromisoformat(body["birthday"])
+                    body["phone_e164"] = to_e164(body["phone"])
+                    body["user_id"] = user_id
+                ids = (await conn.execute(insert(Contact).returning(Contact.id), bodies)).scalars().all() \
+                    if bodies else []
+                result.append(VirtualUser(row["email"], list(ids), [body["phone"] for body in bodies]))
+        # the auth cache would still serve the users of the previous run, with their old ids
+        await redis_manager.client.delete(*(auth_service.cache_key(row["email"]) for row in rows))
+        return result
+    finally:
+        await engine.dispose()
+        await redis_manager.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, keep_rate_limits: bool, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+    if not keep_rate_limits:
+        env["RATE_LIMIT_ENABLED"] = "false"
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning", "--no-access-log", "--workers", str(workers)]
+    return subprocess.Popen(command, env=env)
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start in time")
+
+
+async def login(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    response = await client.post("/api/auth/login", data={"username": user.email, "password": PASSWORD})
+    if response.status_code == 200:
+        user.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return response
+
+
+async def sync_changes(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    if user.sync_cursor is not None:
+        params = {"cursor": user.sync_cursor}
+    else:
+        params = {} if user.sync_token is None else {"since": user.sync_token}
+    response = await client.get("/api/contacts/changes", params=params, headers=user.headers)
+    if response.status_code == 200:
+        page = response.json()
+        user.sync_cursor = page["next_cursor"]
+        if user.sync_cursor is None:
+            user.sync_token = page["sync_token"]
+    return response
+
+
+def scenario_request(name: str, client: httpx.AsyncClient, user: VirtualUser, rnd: random.Random):
+    if name == "login":
+        return login(client, user)
+    if name in ("list", "list_names"):
+        offset = rnd.randrange(max(1, len(user.contact_ids) - 50))
+        params = {"limit": 50, "offset": offset}
+        if name == "list_names":
+            params["fields"] = "f_name,l_name"
+        return client.get("/api/contacts/", params=params, headers=user.headers)
+    if name == "get":
+        return client.get(f"/api/contacts/{rnd.choice(user.contact_ids)}", headers=user.headers)
+    if name == "batch_get":
+        ids = rnd.sample(user.contact_ids, min(100, len(user.contact_ids)))
+        return client.post("/api/contacts/batch-get", json={"ids": ids}, headers=user.headers)
+    if name == "search":
+        return client.get("/find_contact", params={"l_name": rnd.choice(LAST_NAMES)})
+    if name == "birthday":
+        return client.get("/api/contacts/birthdays/", params={"days_ahead": 7}, headers=user.headers)
+    if name == "by_phone":
+        return client.get(f"/api/contacts/by-phone/{rnd.choice(user.phones)}", headers=user.headers)
+    if name == "changes":
+        return sync_changes(client, user)
+    if name == "create":
+        return client.post("/api/contacts/", json=contact_body(rnd, rnd.randrange(10 ** 5)), headers=user.headers)
+    if name == "update":
+        body = dict(contact_body(rnd, rnd.randrange(10 ** 5)), completed=True)
+        return client.put(f"/api/contacts/{rnd.choice(user.contact_ids)}", json=body, headers=user.headers)
+    if name == "delete":
+        if not user.created:
+            return None
+        return client.delete(f"/api/contacts/{user.created.popleft()}", headers=user.headers)
+    raise ValueError(f"unknown scenario {name}")
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+async def run_scenario(name: str, client: httpx.AsyncClient, users: list[VirtualUser], concurrency: int,
+                       duration: float, seed_value: int) -> dict:
+    """
+    The run_scenario function keeps concurrency clients sending the scenario's request back to back
+        for the given duration and summarizes the latencies.
+
+    :param name: str: The scenario name
+    :param client: httpx.AsyncClient: The client bound to the server
+    :param users: list[VirtualUser]: The logged in users, client i acts as users[i % len(users)]
+    :param concurrency: int: How many requests are in flight at once
+    :param duration: float: How long to run, in seconds
+    :param seed_value: int: Seed of the random choices
+    :return: Requests, RPS, latency percentiles in ms and the count of every status code
+    :doc-author: Trelent
+    """
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        rnd = random.Random(seed_value * 1000 + index)
+        user = users[index % len(users)]
+        while time.perf_counter() < deadline:
+            request = scenario_request(name, client, user, rnd)
+            if request is None:
+                break
+            start = time.perf_counter()
+            try:
+                response = await request
+                status = str(response.status_code)
+                if name == "create" and response.status_code == 201:
+                    user.created.append(response.json()["id"])
+            except httpx.HTTPError as err:
+                status = type(err).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "statuses": statuses,
+    }
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"]).returncode != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict, baseline: dict | None):
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          + ("   vs baseline (rps / p95)" if baseline else ""))
+    for name, row in results.items():
+        line = (f"{name:<10} {row['requests']:8d} {row['errors']:6d} {row['rps']:9.1f} "
+                f"{row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f}")
+        old = (baseline or {}).get(name)
+        if old and old["rps"] and old["p95_ms"]:
+            line += f"   {(row['rps'] / old['rps'] - 1) * 100:+6.1f}% / {(row['p95_ms'] / old['p95_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    failed = []
+    for name, row in results.items():
+        old = baseline.get(name)
+        if not old or not old["rps"] or not old["p95_ms"]:
+            continue
+        if row["rps"] < old["rps"] * (1 - tolerance) or row["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            failed.append(name)
+    return failed
+
+
+async def run(args) -> dict:
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    print(f"seeding {args.users} users x {args.contacts} contacts")
+    users = await seed(args.users, args.contacts, args.seed)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        port = free_port()
+        server = start_server(port, args.keep_rate_limits, args.workers)
+        base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            await wait_ready(client)
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def first_login(user):
+                async with semaphore:
+                    response = await login(client, user)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"login of {user.email} failed: {response.status_code} {response.text}")
+
+            await asyncio.gather(*(first_login(user) for user in users))
+
+            results = {}
+            for name in scenarios:
+                if args.warmup:
+                    await run_scenario(name, client, users, args.concurrency, args.warmup, args.seed + 1)
+                results[name] = await run_scenario(name, client, users, args.concurrency, args.duration, args.seed)
+                print(f"  {name}: {results[name]['rps']} rps, p95 {results[name]['p95_ms']} ms")
+            return results
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target a running server instead of booting one")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--contacts", type=int, default=100, help="Contacts per user")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="Untimed seconds before each scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the booted server")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--keep-rate-limits", action="store_true")
+    parser.add_argument("--output", help="Results file, default benchmarks/results/<commit>-<time>.json")
+    parser.add_argument("--compare", help="Results file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="With --compare, exit 1 when RPS drops or p95 grows by more than this fraction")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": {key: getattr(args, key) for key in ("url", "users", "contacts", "concurrency", "duration",
+                                                        "warmup", "workers", "seed", "keep_rate_limits")},
+        "results": results,
+    }
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    baseline = json.loads(Path(args.compare).read_text())["results"] if args.compare else None
+    print()
+    print_results(results, baseline)
+    print(f"\nsaved to {output}")
+    if baseline is not None:
+        failed = regressions(results, baseline, args.tolerance)
+        if failed:
+            print(f"regression over {args.tolerance:.0%} in: {', '.join(failed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Microbenchmarks of the helpers every request goes through.
+
+Each benchmark is calibrated so one round takes at least --min-time
+seconds, runs --rounds rounds and reports the best and the median time per
+call, like pytest-benchmark does, but without the extra dependency.
+Results are saved under benchmarks/results, tagged with the commit, and
+--compare fails the run (exit 1) when the best time of any benchmark grew
+by more than --threshold against an earlier results file.
+
+    python -m benchmarks.microbench
+    python -m benchmarks.microbench --compare benchmarks/results/micro-<file>.json --threshold 0.10
+"""
+import argparse
+import json
+import pickle
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from jose import jwt
+from pydantic import TypeAdapter
+
+from benchmarks.bench_ip_ban import random_networks
+from src.conf.config import config
+from src.entity.models import Contact, User
+from src.middleware.ban import BanIPMiddleware, IPBanList
+from src.schemas.contact import ContactResponse
+from src.services.auth import auth_service
+from src.services.revocation import BloomFilter
+
+
+RESULTS_DIR = Path(__file__).parent / "results"
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    The benchmark function registers a setup function under the given name.
+        The setup builds the fixtures and returns the callable being measured.
+
+    :param name: str: The benchmark name shown in the report
+    :return: The decorator
+    :doc-author: Trelent
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def run_sync(coroutine):
+    # The measured coroutines never suspend, so they can be driven without an event loop.
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+
+def make_user() -> User:
+    now = datetime(2024, 1, 1, 12, 0)
+    return User(id=1, username="bench", email="bench@example.com", password="$2b$12$" + "x" * 53,
+                avatar="https://www.gravatar.com/avatar/0", refresh_token=None, created_at=now, updated_at=now,
+                confirmation=True)
+
+
+@benchmark("auth.create_access_token")
+def bench_create_access_token():
+    return lambda: run_sync(auth_service.create_access_token(data={"sub": "bench@example.com"}))
+
+
+@benchmark("jwt.decode access token")
+def bench_jwt_decode():
+    token = run_sync(auth_service.create_access_token(data={"sub": "bench@example.com"}))
+    return lambda: jwt.decode(token, config.SECRET_KEY_JWT, algorithms=[config.ALGORITHM])
+
+
+@benchmark("pickle.loads cached User")
+def bench_pickle_user():
+    # the auth cache entry: user, load time, expiry
+    cached = pickle.dumps((make_user(), 0.002, time.time() + auth_service.USER_CACHE_TTL))
+    return lambda: pickle.loads(cached)
+
+
+@benchmark("ContactResponse x500 to JSON")
+def bench_contact_response():
+    user = make_user()
+    contacts = [
+        Contact(id=i, f_name=f"Name{i}", l_name="Last", email=f"c{i}@example.com", phone="+380630000000",
+                birthday=date(1990, 1, 1) + timedelta(days=i), additional_data="notes",
+                created_at=user.created_at, updated_at=user.updated_at, user=user)
+        for i in range(1, 501)
+    ]
+    adapter = TypeAdapter(list[ContactResponse])
+    # what FastAPI does with a response_model: validate from attributes, dump in JSON mode, encode
+    return lambda: json.dumps(adapter.dump_python(adapter.validate_python(contacts, from_attributes=True),
+                                                  mode="json"))
+
+
+@benchmark("phone regex")
+def bench_phone_regex():
+    return lambda: re.match(r'^[\d\+\(\)]+$', "+380(63)1234567")
+
+
+@benchmark("BanIPMiddleware 10k networks")
+def bench_ban_middleware():
+    async def endpoint(scope, receive, send):
+        return None
+
+    middleware = BanIPMiddleware(endpoint, ban_list=IPBanList(random_networks(10_000)))
+    scope = {"type": "http", "client": ("10.20.30.40", 50000), "headers": []}
+    return lambda: run_sync(middleware(scope, None, None))
+
+
+@benchmark("revocation Bloom lookup 100k ids")
+def bench_revocation_bloom():
+    bloom = BloomFilter(100_000)
+    for i in range(100_000):
+        bloom.add(f"revoked-{i}")
+    return lambda: "0123456789abcdef0123456789abcdef" in bloom
+
+
+def measure(func, rounds: int, min_time: float) -> dict:
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - started >= min_time:
+            break
+        number *= 2
+
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - started) / number)
+    return {
+        "min_us": round(min(times) * 1e6, 3),
+        "median_us": round(statistics.median(times) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(times) * 1e6, 3) if len(times) > 1 else 0.0,
+        "calls_per_round": number,
+    }
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"]).returncode != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimal seconds per round")
+    parser.add_argument("-k", "--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="Results file, default benchmarks/results/micro-<commit>-<time>.json")
+    parser.add_argument("--compare", help="Results file of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="With --compare, exit 1 when a best time grows by more than this fraction")
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.compare).read_text())["results"] if args.compare else {}
+    results = {}
+    failed = []
+    print(f"{'benchmark':<32} {'min us':>10} {'median us':>10} {'stdev us':>9}"
+          + ("   vs baseline" if baseline else ""))
+    for name, setup in BENCHMARKS.items():
+        if args.filter.lower() not in name.lower():
+            continue
+        results[name] = row = measure(setup(), args.rounds, args.min_time)
+        line = f"{name:<32} {row['min_us']:10.3f} {row['median_us']:10.3f} {row['stdev_us']:9.3f}"
+        old = baseline.get(name)
+        if old:
+            change = row["min_us"] / old["min_us"] - 1
+            line += f"   {change * 100:+6.1f}%"
+            if change > args.threshold:
+                failed.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    commit = git_commit()
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"micro-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"commit": commit, "timestamp": datetime.now().isoformat(timespec="seconds"),
+                                  "python": platform.python_version(), "results": results}, indent=2))
+    print(f"\nsaved to {output}")
+    if failed:
+        print(f"regression over {args.threshold:.0%} in: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
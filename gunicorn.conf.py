@@ -0,0 +1,23 @@
+# gunicorn -c gunicorn.conf.py main:app
+# Same profile as `python main.py`, for deployments managed by gunicorn (the gunicorn extra: poetry install -E gunicorn):
+# the app is imported once in the master and forked into the workers. Nothing connects at import
+# (engine, Redis and mail clients are created on first use), so no socket is shared across the fork.
+import os
+
+from src.conf.config import config as app_config  # "config" is a gunicorn setting name
+from src.conf.server import worker_count
+
+workers = worker_count()
+os.environ["WEB_WORKERS"] = str(workers)
+
+bind = f"{app_config.WEB_HOST}:{os.environ.get('PORT', app_config.WEB_PORT)}"
+worker_class = "src.conf.gunicorn_worker.TunedUvicornWorker"
+preload_app = True
+backlog = app_config.WEB_BACKLOG
+keepalive = app_config.WEB_KEEPALIVE_SECONDS
+forwarded_allow_ips = app_config.WEB_FORWARDED_ALLOW_IPS
+graceful_timeout = int(app_config.SHUTDOWN_TIMEOUT_SECONDS) + 5
+timeout = 60
+# recycle workers now and then so slow leaks never build up, staggered so they don't restart together
+max_requests = 10_000
+max_requests_jitter = 1_000
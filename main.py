@@ -1,53 +1,119 @@
 #3#plan
+import asyncio
 import os
 import re
+import contextlib
+from contextlib import asynccontextmanager
 from typing import Callable
 from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from redis.exceptions import RedisError
 from sqlalchemy import text, select
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ipaddress import ip_address
-
-import uvicorn #4.13____CORS
-
-from src.database.db import get_db
+from src.database.db import get_db, profiler, sessionmanager
+from src.database.profiler import QueryProfilerMiddleware
 from src.routes import contacts, users
 from src.routes import auth #2.12.A&A
+from src.routes import health
+from src.services.health import health_checker
 from src.entity.models import Contact
 from src.repository import contacts as reps_contacts
-
-import redis.asyncio as redis  #3.13____limiter
-from fastapi_limiter import FastAPILimiter
+from src.middleware.ban import IPBanList, BanIPMiddleware, watch_ban_list
+from src.middleware.metrics import MetricsMiddleware
+from src.middleware.drain import DrainMiddleware, in_flight
+from src.middleware.admission import AdmissionMiddleware
+from src.services.metrics import registry
+from src.middleware.request_context import RequestContextMiddleware
+from src.services.logger import setup_logging, get_logger
+from src.services.tracing import tracer, LogSpanExporter, FileSpanExporter
+
+from src.database.redis import redis_manager  #3.13____limiter
+from src.services.rate_limit import rate_limit_service
+from src.services.revocation import revocation_list
 
 from src.conf.config import config
 
 
-app = FastAPI()
-banned_ips = [
-    ip_address("192.168.1.1"),
-    ip_address("192.168.1.2"),
-    #ip_address("127.0.0.1"),
-]
+logger = get_logger(__name__)
+
+ban_list = IPBanList(config.BANNED_IPS)
+
+
+#____________________________3.13____limiter___________________________________________________________________________________
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function starts the app's background resources before the first request
+        and releases them on shutdown. Database and Redis clients are created lazily on first use,
+        so importing the app stays cheap; here they are only closed.
+    
+    :param app: FastAPI: The application
+    :return: None, the app serves requests while it is suspended at yield
+    :doc-author: Trelent
+    """
+    logging_listener = setup_logging(config.LOG_LEVEL, config.LOG_FILE)
+    if config.TRACE_EXPORT == "log":
+        tracer.configure(LogSpanExporter())
+    elif config.TRACE_EXPORT == "file":
+        tracer.configure(FileSpanExporter(config.TRACE_FILE))
+    r = redis_manager.client
+    rate_limit_service.init(r)
+    ban_list_watcher = asyncio.create_task(
+        watch_ban_list(ban_list, r, config.BAN_LIST_REDIS_KEY, config.BANNED_IPS, config.BAN_LIST_RELOAD_SECONDS)
+    )
+    await revocation_list.start()
+    await health_checker.start()
+    try:
+        yield
+    finally:
+        # runs once the server has stopped: the requests were drained before (DrainingServer)
+        await health_checker.stop()
+        await revocation_list.stop()
+        ban_list_watcher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await ban_list_watcher
+        if profiler is not None:
+            profiler.dump(config.DB_PROFILE_REPORT)
+        await sessionmanager.close()
+        await redis_manager.close()
+        tracer.shutdown()
+        logging_listener.stop()
+#____________________________3.13____limiter___________________________________________________________________________________|
+
 
-origins = ["*"]
+app = FastAPI(lifespan=lifespan)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Only pure ASGI middlewares here: no @app.middleware("http"), which runs every request through
+# BaseHTTPMiddleware's extra task and body stream. The last one added is the outermost.
+if config.ADMISSION_ENABLED:
+    app.add_middleware(
+        AdmissionMiddleware,
+        initial_limit=config.ADMISSION_INITIAL_LIMIT,
+        min_limit=config.ADMISSION_MIN_LIMIT,
+        max_limit=config.ADMISSION_MAX_LIMIT,
+        pool_wait_ms=config.ADMISSION_POOL_WAIT_MS,
+        retry_after=config.ADMISSION_RETRY_AFTER_SECONDS,
+    )
+app.add_middleware(MetricsMiddleware)
+if profiler is not None:
+    app.add_middleware(QueryProfilerMiddleware)
+app.add_middleware(RequestContextMiddleware)
+app.add_middleware(DrainMiddleware, tracker=in_flight)
 #____________________________4.13____banned___________________________________________________________________________________
-@app.middleware("http")
-async def ban_ips(request: Request, call_next: Callable):
-    ip = ip_address(request.client.host)
-    if ip in banned_ips:
-        return JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
-    response = await call_next(request)
-    return response
+app.add_middleware(BanIPMiddleware, ban_list=ban_list)
+# outermost, so the early answers of the middlewares above (403 ban, 503 drain and admission) carry
+# the CORS headers too: without them browsers hide the response, Retry-After included
+if config.CORS_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=config.CORS_ORIGINS,
+        allow_credentials=config.CORS_ALLOW_CREDENTIALS,
+        allow_methods=config.CORS_ALLOW_METHODS,
+        allow_headers=config.CORS_ALLOW_HEADERS,
+        expose_headers=config.CORS_EXPOSE_HEADERS,
+    )
 
 
 # user_agent_ban_list = [r"Googlebot", r"Python-urllib"]
@@ -72,33 +138,30 @@ async def ban_ips(request: Request, call_next: Callable):
 app.include_router(auth.router, prefix="/api") #2.12.A&A
 app.include_router(contacts.router, prefix="/api")
 app.include_router(users.router, prefix="/api") #3.12.Limiter
-#____________________________3.13____limiter___________________________________________________________________________________
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(
-        host=config.REDIS_DOMAIN,
-        port=config.REDIS_PORT,
-        db=0,
-        password=config.REDIS_PASSWORD,
-    )
-    await FastAPILimiter.init(r)
-#____________________________3.13____limiter___________________________________________________________________________________|
+app.include_router(health.router, prefix="/api")
+
+@app.exception_handler(RedisError)
+async def redis_unavailable(request: Request, exc: RedisError):
+    # only features that live in Redis alone (sessions, refresh tokens) get here; the rest falls back
+    logger.warning("Redis unavailable", extra={"path": request.url.path, "error": str(exc)})
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": "Service temporarily unavailable"}, headers={"Retry-After": "5"})
+
 @app.get("/")
-def index():
+async def index():
     return {"message": "Contact Application"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/healthchecker")
-async def healthchecker(db: AsyncSession = Depends(get_db)):
-    try:
-        # Make request
-        result = await db.execute(text("SELECT 1"))
-        result = result.fetchone()
-        if result is None:
-            raise HTTPException(status_code=500, detail="Database is not configured correctly")
-        return {"message": "Welcome to FastAPI!"}
-    except Exception as e:
-        print(e)
+async def healthchecker():
+    # kept for existing probes; answered from the background checker instead of a query per call,
+    # see /api/health/live and /api/health/ready
+    if not health_checker.status["checks"].get("postgres", {}).get("ok"):
         raise HTTPException(status_code=500, detail="Error connecting to the database")
+    return {"message": "Welcome to FastAPI!"}
 
 
 @app.get("/find_contact")
@@ -123,7 +186,14 @@ async def find_contact(
     return {"contacts": contacts}
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=int(os.environ.get("PORT", 8000)), log_level="info")
+    from src.conf.server import worker_count, uvicorn_options, serve
+
+    # Production runner: WEB_WORKERS processes (one per core by default) with uvloop and httptools.
+    # The count is exported so every worker sizes its DB pool from the same number.
+    workers = worker_count()
+    os.environ["WEB_WORKERS"] = str(workers)
+    serve("main:app", host=config.WEB_HOST, port=int(os.environ.get("PORT", config.WEB_PORT)),
+          workers=workers, log_level="info", **uvicorn_options())
 
 
 
@@ -1,4 +1,5 @@
 import asyncio
+import re
 from logging.config import fileConfig
 
 from sqlalchemy.engine import Connection
@@ -31,6 +32,14 @@ config.set_main_option("sqlalchemy.url", app_config.DB_URL)
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
+# partitions of contacts (migration c5e8a1b7d3f2) are not in the models
+PARTITION_TABLE = re.compile(r"^contacts_p\d+$")
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    table = object if type_ == "table" else getattr(object, "table", None)
+    return table is None or not PARTITION_TABLE.match(table.name)
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -48,6 +57,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -57,7 +67,7 @@ def run_migrations_offline() -> None:
 
 
 def run_migrations(connection: Connection):
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
     with context.begin_transaction():
         context.run_migrations()
 
@@ -0,0 +1,129 @@
+"""partition contacts by user
+
+Revision ID: c5e8a1b7d3f2
+Revises: a3f1c9d2e7b4
+Create Date: 2026-10-19 19:40:12.274911
+
+Turns contacts into a table hash-partitioned on user_id, without stopping the app:
+
+1. contacts_partitioned is created with PARTITIONS partitions and a trigger on contacts
+   mirrors every insert, update and delete into it from now on;
+2. the existing rows are copied in batches of BATCH_SIZE ids, each batch committed on its own,
+   so no lock is held for long; the batch locks its rows FOR SHARE, so a row changed or deleted
+   while it is copied is mirrored by the trigger after the batch and never copied stale;
+3. the swap locks contacts for a moment, drops it and renames the new table and its indexes.
+
+Rows without a user can't be partitioned: the migration stops if there are any, at the start
+and again at the swap. During the copy the trigger leaves them out rather than fail the app's write.
+If it is interrupted during the copy it can simply be run again.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e8a1b7d3f2'
+down_revision: Union[str, None] = 'a3f1c9d2e7b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS = 16
+BATCH_SIZE = 10_000
+COLUMNS = "id, email, phone, birthday, f_name, l_name, additional_data, created_at, updated_at, user_id"
+NEW_COLUMNS = ", ".join(f"NEW.{column}" for column in COLUMNS.split(", "))
+
+
+def _create_table(name: str, partitioned: bool) -> None:
+    op.execute(f"""
+        CREATE TABLE {name} (
+            id integer NOT NULL DEFAULT nextval('contacts_id_seq'::regclass),
+            email varchar(100) NOT NULL,
+            phone varchar(25) NOT NULL,
+            birthday date NOT NULL,
+            f_name varchar(50) NOT NULL,
+            l_name varchar(50) NOT NULL,
+            additional_data varchar NOT NULL,
+            created_at timestamp,
+            updated_at timestamp,
+            user_id integer {"NOT NULL" if partitioned else ""} REFERENCES users (id),
+            PRIMARY KEY ({"user_id, id" if partitioned else "id"})
+        ) {"PARTITION BY HASH (user_id)" if partitioned else ""}
+    """)
+    op.execute(f"CREATE INDEX {name}_f_name ON {name} (f_name)")
+    op.execute(f"CREATE INDEX {name}_l_name ON {name} (l_name)")
+    op.execute(f"CREATE INDEX {name}_user_id_updated_at ON {name} (user_id, updated_at)")
+
+
+def _swap(old: str, new: str) -> None:
+    op.execute(f"ALTER SEQUENCE contacts_id_seq OWNED BY {new}.id")
+    op.execute(f"DROP TABLE {old}")
+    op.execute(f"ALTER TABLE {new} RENAME TO contacts")
+    op.execute(f"ALTER TABLE contacts RENAME CONSTRAINT {new}_pkey TO contacts_pkey")
+    op.execute(f"ALTER TABLE contacts RENAME CONSTRAINT {new}_user_id_fkey TO contacts_user_id_fkey")
+    for index in ("f_name", "l_name", "user_id_updated_at"):
+        op.execute(f"ALTER INDEX {new}_{index} RENAME TO ix_contacts_{index}")
+
+
+def _check_orphans(bind) -> None:
+    orphans = bind.execute(sa.text("SELECT count(*) FROM contacts WHERE user_id IS NULL")).scalar()
+    if orphans:
+        raise RuntimeError(f"{orphans} contacts have no user_id: assign or delete them before partitioning")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    _check_orphans(bind)
+
+    # a previous run may have stopped during the copy
+    op.execute("DROP TRIGGER IF EXISTS contacts_copy_to_partitioned ON contacts")
+    op.execute("DROP TABLE IF EXISTS contacts_partitioned")
+    _create_table("contacts_partitioned", partitioned=True)
+    for remainder in range(PARTITIONS):
+        op.execute(f"CREATE TABLE contacts_p{remainder:02d} PARTITION OF contacts_partitioned "
+                   f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})")
+
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION contacts_copy_to_partitioned() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM contacts_partitioned WHERE user_id = OLD.user_id AND id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+                INSERT INTO contacts_partitioned ({COLUMNS}) VALUES ({NEW_COLUMNS});
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("CREATE TRIGGER contacts_copy_to_partitioned AFTER INSERT OR UPDATE OR DELETE ON contacts "
+               "FOR EACH ROW EXECUTE FUNCTION contacts_copy_to_partitioned()")
+
+    # committing here makes the trigger live; every batch below is a transaction of its own
+    with op.get_context().autocommit_block():
+        # creating the trigger waited for the writes in flight: rows above max_id are mirrored by it
+        max_id = bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM contacts")).scalar()
+        for low in range(0, max_id, BATCH_SIZE):
+            bind.execute(sa.text(f"""
+                INSERT INTO contacts_partitioned ({COLUMNS})
+                SELECT {COLUMNS} FROM contacts WHERE id > :low AND id <= :high AND user_id IS NOT NULL
+                FOR SHARE
+                ON CONFLICT DO NOTHING
+            """), {"low": low, "high": low + BATCH_SIZE})
+
+    op.execute("LOCK TABLE contacts IN ACCESS EXCLUSIVE MODE")
+    # rows written without a user during the copy are not in contacts_partitioned
+    _check_orphans(bind)
+    op.execute("DROP TRIGGER contacts_copy_to_partitioned ON contacts")
+    op.execute("DROP FUNCTION contacts_copy_to_partitioned()")
+    _swap("contacts", "contacts_partitioned")
+    op.execute("ANALYZE contacts")
+
+
+def downgrade() -> None:
+    # not online: the table is locked while the rows are copied back
+    _create_table("contacts_unpartitioned", partitioned=False)
+    op.execute("LOCK TABLE contacts IN ACCESS EXCLUSIVE MODE")
+    op.execute(f"INSERT INTO contacts_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM contacts")
+    _swap("contacts", "contacts_unpartitioned")
@@ -0,0 +1,101 @@
+"""contacts phone e164
+
+Revision ID: e9d4b6a2f1c8
+Revises: c5e8a1b7d3f2
+Create Date: 2026-10-19 20:05:41.613027
+
+Adds contacts.phone_e164, the phone normalized to E.164, and
+the (user_id, phone_e164) index of the reverse lookup, without stopping the app:
+
+1. the nullable column is added, which doesn't rewrite the table;
+2. existing rows are backfilled in batches of BATCH_SIZE walking the primary key,
+   each batch committed on its own; a row whose phone was changed after it was read
+   is left alone, the app already stored its phone_e164;
+3. the index is built CONCURRENTLY on every partition and attached to an index
+   created ON ONLY the partitioned table, as Postgres can't build it concurrently there.
+
+If it is interrupted it can simply be run again. The normalization is a copy of
+src.services.phone.to_e164 as it was when this revision was written, with the country
+code of the time, so the migration gives the same result whatever the app code becomes.
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9d4b6a2f1c8'
+down_revision: Union[str, None] = 'c5e8a1b7d3f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10_000
+INDEX = "ix_contacts_user_id_phone_e164"
+COUNTRY_CODE = "380"
+NOT_DIGITS = re.compile(r"\D")
+
+
+def to_e164(number: str | None) -> str | None:
+    if not number:
+        return None
+    international = number.lstrip().startswith("+")
+    digits = NOT_DIGITS.sub("", number)
+    if not international:
+        if digits.startswith("00"):
+            digits = digits[2:]
+        elif digits.startswith("0"):
+            digits = COUNTRY_CODE + digits[1:]
+        elif not digits.startswith(COUNTRY_CODE):
+            digits = COUNTRY_CODE + digits
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return "+" + digits
+
+
+def _partitions(bind) -> list[str]:
+    return list(bind.execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'contacts'::regclass ORDER BY 1"
+    )).scalars())
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE contacts ADD COLUMN IF NOT EXISTS phone_e164 varchar(16)")
+
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        last = (0, 0)
+        while True:
+            rows = bind.execute(sa.text("""
+                SELECT user_id, id, phone FROM contacts
+                WHERE (user_id, id) > (:user_id, :id) AND phone_e164 IS NULL
+                ORDER BY user_id, id
+                LIMIT :limit
+            """), {"user_id": last[0], "id": last[1], "limit": BATCH_SIZE}).all()
+            if not rows:
+                break
+            updates = [{"user_id": user_id, "id": contact_id, "phone": phone, "phone_e164": to_e164(phone)}
+                       for user_id, contact_id, phone in rows]
+            updates = [update for update in updates if update["phone_e164"] is not None]
+            if updates:
+                bind.execute(sa.text("""
+                    UPDATE contacts SET phone_e164 = :phone_e164
+                    WHERE user_id = :user_id AND id = :id AND phone = :phone
+                """), updates)
+            last = rows[-1][:2]
+
+        for partition in _partitions(bind):
+            # an interrupted CREATE INDEX CONCURRENTLY leaves an invalid index behind
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {partition}_user_id_phone_e164_idx")
+            op.execute(f"CREATE INDEX CONCURRENTLY {partition}_user_id_phone_e164_idx "
+                       f"ON {partition} (user_id, phone_e164)")
+
+    op.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY contacts (user_id, phone_e164)")
+    for partition in _partitions(bind):
+        op.execute(f"ALTER INDEX {INDEX} ATTACH PARTITION {partition}_user_id_phone_e164_idx")
+
+
+def downgrade() -> None:
+    op.execute(f"DROP INDEX IF EXISTS {INDEX}")
+    op.execute("ALTER TABLE contacts DROP COLUMN IF EXISTS phone_e164")
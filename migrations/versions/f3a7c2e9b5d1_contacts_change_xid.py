@@ -0,0 +1,66 @@
+"""contacts change xid
+
+Revision ID: f3a7c2e9b5d1
+Revises: e9d4b6a2f1c8
+Create Date: 2026-10-19 21:14:08.402716
+
+Adds change_xid, the id of the transaction that last wrote the row, to contacts and
+contacts_deleted: the delta sync asks for the rows written since a snapshot, which unlike
+updated_at doesn't miss a write committed after a later one. Without stopping the app:
+
+1. the nullable columns are added without a default, which doesn't rewrite the tables,
+   and the default is set afterwards, so it applies to new rows only; older rows keep NULL
+   and are left out of every delta, the clients got them with their initial sync;
+2. the (user_id, change_xid) indexes are built CONCURRENTLY, on every partition of contacts
+   attached to an index created ON ONLY the partitioned table.
+
+If it is interrupted it can simply be run again.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a7c2e9b5d1'
+down_revision: Union[str, None] = 'e9d4b6a2f1c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CURRENT_XACT_ID = "(pg_current_xact_id()::text::bigint)"
+INDEX = "ix_contacts_user_id_change_xid"
+DELETED_INDEX = "ix_contacts_deleted_user_id_change_xid"
+
+
+def _partitions(bind) -> list[str]:
+    return list(bind.execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'contacts'::regclass ORDER BY 1"
+    )).scalars())
+
+
+def upgrade() -> None:
+    for table in ("contacts", "contacts_deleted"):
+        op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS change_xid bigint")
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN change_xid SET DEFAULT {CURRENT_XACT_ID}")
+
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        # an interrupted CREATE INDEX CONCURRENTLY leaves an invalid index behind
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {DELETED_INDEX}")
+        op.execute(f"CREATE INDEX CONCURRENTLY {DELETED_INDEX} ON contacts_deleted (user_id, change_xid)")
+        for partition in _partitions(bind):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {partition}_user_id_change_xid_idx")
+            op.execute(f"CREATE INDEX CONCURRENTLY {partition}_user_id_change_xid_idx "
+                       f"ON {partition} (user_id, change_xid)")
+
+    op.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON ONLY contacts (user_id, change_xid)")
+    for partition in _partitions(bind):
+        op.execute(f"ALTER INDEX {INDEX} ATTACH PARTITION {partition}_user_id_change_xid_idx")
+
+
+def downgrade() -> None:
+    op.execute(f"DROP INDEX IF EXISTS {INDEX}")
+    op.execute(f"DROP INDEX IF EXISTS {DELETED_INDEX}")
+    op.execute("ALTER TABLE contacts_deleted DROP COLUMN IF EXISTS change_xid")
+    op.execute("ALTER TABLE contacts DROP COLUMN IF EXISTS change_xid")
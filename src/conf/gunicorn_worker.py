@@ -0,0 +1,26 @@
+#__________________server profiles_______________________________________________________________________________________
+# Kept apart from src.conf.server: importing uvicorn.workers needs gunicorn, which only gunicorn.conf.py uses.
+import sys
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.workers import UvicornWorker
+
+from src.conf.server import uvicorn_options
+from src.middleware.drain import DrainingServer
+
+
+class TunedUvicornWorker(UvicornWorker):
+    # bind, backlog, keep-alive and forwarded IPs come from the gunicorn settings
+    CONFIG_KWARGS = {key: value for key, value in uvicorn_options().items()
+                     if key in ("loop", "http", "limit_concurrency", "timeout_graceful_shutdown",
+                                "proxy_headers", "access_log")}
+
+    async def _serve(self) -> None:
+        # UvicornWorker._serve with DrainingServer: gunicorn's arbiter sends SIGTERM, the worker drains
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+#__________________server profiles_______________________________________________________________________________________|
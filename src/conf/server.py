@@ -0,0 +1,105 @@
+#__________________server profiles_______________________________________________________________________________________
+import os
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from src.conf.config import config
+from src.services.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def worker_count() -> int:
+    """
+    The worker_count function tells how many server processes run in this container:
+        WEB_WORKERS when set, otherwise WEB_WORKERS_PER_CORE per available CPU.
+
+    :return: The number of workers, at least 1
+    :doc-author: Trelent
+    """
+    if config.WEB_WORKERS:
+        return config.WEB_WORKERS
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, round(cores * config.WEB_WORKERS_PER_CORE))
+
+
+def db_pool_options(workers: int | None = None) -> dict:
+    """
+    The db_pool_options function splits the DB_MAX_CONNECTIONS budget of the container between its workers,
+        so N workers never open more connections than Postgres was sized for.
+        A quarter of each worker's share is overflow, closed again when the burst is over.
+
+    >>> db_pool_options(workers=4) == {"pool_size": 15, "max_overflow": 5}
+    True
+
+    :param workers: int | None: The number of workers, worker_count() by default
+    :return: pool_size and max_overflow for create_async_engine
+    :doc-author: Trelent
+    """
+    if config.DB_POOL_SIZE is not None:
+        return {"pool_size": config.DB_POOL_SIZE, "max_overflow": config.DB_MAX_OVERFLOW or 0}
+    per_worker = max(1, config.DB_MAX_CONNECTIONS // (workers or worker_count()))
+    max_overflow = per_worker // 4
+    return {"pool_size": per_worker - max_overflow, "max_overflow": max_overflow}
+
+
+def uvicorn_options() -> dict:
+    """
+    The uvicorn_options function collects the tuned uvicorn settings shared by the uvicorn runner
+        in main.py and the gunicorn worker class below.
+
+    :return: Keyword arguments for uvicorn.Config
+    :doc-author: Trelent
+    """
+    return {
+        "loop": "uvloop",
+        "http": "httptools",
+        "backlog": config.WEB_BACKLOG,
+        "timeout_keep_alive": config.WEB_KEEPALIVE_SECONDS,
+        "limit_concurrency": config.WEB_LIMIT_CONCURRENCY,
+        "timeout_graceful_shutdown": int(config.SHUTDOWN_TIMEOUT_SECONDS),
+        "proxy_headers": True,
+        "forwarded_allow_ips": config.WEB_FORWARDED_ALLOW_IPS,
+        "access_log": False,  # RequestContextMiddleware writes the access log
+    }
+
+
+class DrainingMultiprocess(Multiprocess):
+    """
+    uvicorn's supervisor signals the next worker only once the previous one exited; with draining
+    workers that would keep the others serving as usual meanwhile. All of them drain together here.
+    """
+
+    def shutdown(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Stopping parent process [%s]", self.pid)
+
+
+def serve(app: str, workers: int, **options):
+    """
+    The serve function runs the app like uvicorn.run, with DrainingServer in every worker.
+
+    :param app: str: Import string of the ASGI app
+    :param workers: int: The number of worker processes
+    :param options: Keyword arguments for uvicorn.Config
+    :return: None
+    :doc-author: Trelent
+    """
+    # imported here: src.middleware.drain imports the database module, which imports this one
+    from src.middleware.drain import DrainingServer
+
+    server_config = uvicorn.Config(app, workers=workers, **options)
+    server = DrainingServer(config=server_config)
+    if server_config.workers > 1:
+        DrainingMultiprocess(server_config, target=server.run, sockets=[server_config.bind_socket()]).run()
+    else:
+        server.run()
+#__________________server profiles_______________________________________________________________________________________|
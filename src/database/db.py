@@ -1,26 +1,111 @@
 import contextlib
+import time
 
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from src.conf.config import config
+from src.conf.server import db_pool_options
+from src.services.metrics import instrument_engine, observe_pool_wait
+from src.database.profiler import QueryProfiler
+from src.services.logger import get_logger
+from src.services.tracing import trace_engine
+
+
+logger = get_logger(__name__)
+# session.info key: the session commits when its block ends, repositories only flush (see commit)
+COMMIT_ON_EXIT = "commit_on_exit"
+
+
+profiler: QueryProfiler | None = None
+if config.DB_PROFILE:
+    profiler = QueryProfiler(config.DB_PROFILE_SLOW_MS, config.DB_PROFILE_EXPLAIN, config.DB_PROFILE_N_PLUS_ONE)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    The default async pool, timing how long every checkout waits for a connection
+    (opening a new one included). A growing wait is the first sign Postgres is falling behind.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            observe_pool_wait(time.perf_counter() - started)
 
 
 class DatabaseSessionManager:
+    """
+    Owns the engine, which is created on first use (importing the app loads neither the
+    asyncpg dialect nor a pool) and disposed by the app lifespan on shutdown.
+    """
+
     def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
-        self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+        self._url = url
+        self._engine: AsyncEngine | None = None
+        self._session_maker: async_sessionmaker | None = None
+        self._pool_capacity = 0
+
+    def _connect(self):
+        pool_options = db_pool_options()
+        self._pool_capacity = pool_options["pool_size"] + pool_options["max_overflow"]
+        self._engine = create_async_engine(self._url, poolclass=TimedQueuePool, pool_timeout=config.DB_POOL_TIMEOUT,
+                                           **pool_options)
+        instrument_engine(self._engine)
+        trace_engine(self._engine)
+        if profiler is not None:
+            profiler.attach(self._engine)
+        self._session_maker = async_sessionmaker(autoflush=False, autocommit=False, bind=self._engine)
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._connect()
+        return self._engine
+
+    def pool_usage(self) -> tuple[int, int]:
+        # (connections checked out, pool_size + max_overflow); (0, 0) until the engine is created
+        if self._engine is None:
+            return 0, 0
+        return self._engine.pool.checkedout(), self._pool_capacity
+
+    async def close(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+            self._session_maker = None
 
     @contextlib.asynccontextmanager
-    async def session(self):
+    async def session(self, commit: bool = False):
+        """
+        The session function opens a session for one unit of work. The session checks out a pool
+            connection only when its first statement runs, so requests that never query (auth cache hits)
+            never touch the pool. Errors roll the transaction back and are re-raised to the caller;
+            whatever the block left uncommitted is rolled back on close.
+        
+        :param self: Represent the instance of the class
+        :param commit: bool: Commit once when the block succeeds; until then repositories only flush (see commit)
+        :return: The session
+        :doc-author: Trelent
+        """
         if self._session_maker is None:
-            raise Exception("Session is not initialized")
+            self._connect()
         session = self._session_maker()
+        session.info[COMMIT_ON_EXIT] = commit
         try:
             yield session
+            if commit:
+                await session.commit()
         except Exception as err:
-            print(err)
+            # request errors (404, 422 raised while the session is open) are the client's, not the database's
+            if not isinstance(err, (HTTPException, RequestValidationError)):
+                logger.error("Session rolled back", exc_info=err)
             await session.rollback()
+            raise
         finally:
             await session.close()
 
@@ -28,6 +113,41 @@ class DatabaseSessionManager:
 sessionmanager = DatabaseSessionManager(config.DB_URL)
 
 
+async def commit(db: AsyncSession):
+    """
+    The commit function ends the writes of a repository function. In a get_db session it commits them;
+        in a get_db_transaction session it only flushes them, and the request commits them all at its end.
+    
+    :param db: AsyncSession: The session the repository wrote to
+    :return: None
+    :doc-author: Trelent
+    """
+    if db.info.get(COMMIT_ON_EXIT):
+        await db.flush()
+    else:
+        await db.commit()
+
+
 async def get_db():
+    """
+    The get_db function is the default session dependency: every repository call commits its own
+        changes; anything left uncommitted when the request ends is rolled back.
+    
+    :return: The session of the request
+    :doc-author: Trelent
+    """
     async with sessionmanager.session() as session:
         yield session
+
+
+async def get_db_transaction():
+    """
+    The get_db_transaction function is the session dependency of handlers whose writes must succeed
+        together: the repositories only flush, the request commits once before the response is sent
+        and rolls everything back if anything raises. Background tasks run after the commit.
+    
+    :return: The session of the request
+    :doc-author: Trelent
+    """
+    async with sessionmanager.session(commit=True) as session:
+        yield session
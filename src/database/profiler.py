@@ -0,0 +1,223 @@
+#__________________SQL profiler_______________________________________________________________________________________
+import asyncio
+import random
+import re
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from src.services.logger import get_logger
+
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_BIND = re.compile(r"(?:\$\d+|%\(\w+\)s)(?:::\w+(?: \w+)*?(?=[,)\s]|$))?")
+_IN_LIST = re.compile(r"\bIN \((?:\?, )*\?\)", re.IGNORECASE)
+
+logger = get_logger(__name__)
+
+# statements of the request being served, fingerprint -> count; None outside requests
+request_statements: ContextVar[dict | None] = ContextVar("request_statements", default=None)
+
+
+def fingerprint(statement: str) -> str:
+    """
+    The fingerprint function normalizes a statement so the same query with other parameters
+        or a different IN list length is counted as one entry.
+
+    >>> fingerprint("SELECT * FROM contacts WHERE id IN ($1::INTEGER, $2::INTEGER) AND f_name = 'Yarko'")
+    'SELECT * FROM contacts WHERE id IN (...) AND f_name = ?'
+
+    :param statement: str: The SQL statement sent to the database
+    :return: The normalized statement
+    :doc-author: Trelent
+    """
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _STRING.sub("?", statement)
+    statement = _BIND.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _IN_LIST.sub("IN (...)", statement)
+
+
+def row_count(cursor) -> int:
+    """
+    The row_count function tells how many rows a statement returned, or changed for DML without RETURNING.
+        The asyncpg adapter takes the rowcount from the command status, "SELECT 3" included.
+        Server-side cursors fetch as the rows are read: theirs are not counted.
+
+    :param cursor: The DBAPI cursor after execute
+    :return: The number of rows, 0 when unknown
+    :doc-author: Trelent
+    """
+    return max(cursor.rowcount, 0)
+
+
+class StatementStats:
+    max_samples = 1024
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+        self.samples: list[float] = []
+        self.n_plus_one = 0
+        self.plan: str | None = None
+
+    def add(self, elapsed: float, rows: int):
+        self.count += 1
+        self.total += elapsed
+        self.rows += rows
+        if len(self.samples) < self.max_samples:
+            self.samples.append(elapsed)
+        else:
+            index = random.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = elapsed
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+class QueryProfiler:
+    """
+    Opt-in profiler fed by the engine cursor events: per statement fingerprint it keeps
+    the count, total time, p50/p99 and rows returned, flags the same statement repeated
+    within one request (N+1) and can capture EXPLAIN ANALYZE plans of slow SELECTs.
+    The plans are taken in a background task on a connection of their own, never on the one
+    serving the request.
+    """
+
+    def __init__(self, slow_ms: float = 100, explain: bool = False, n_plus_one: int = 5):
+        self.slow = slow_ms / 1000
+        self.explain = explain
+        self.n_plus_one = n_plus_one
+        self.stats: dict[str, StatementStats] = {}
+        self._fingerprints: dict[str, str] = {}
+        self._engine = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def attach(self, engine):
+        """
+        The attach function registers the cursor event listeners on the engine.
+
+        :param self: Represent the instance of the class
+        :param engine: AsyncEngine: The engine to profile
+        :return: None
+        :doc-author: Trelent
+        """
+        self._engine = engine
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine.sync_engine, "handle_error", self._handle_error)
+
+    @staticmethod
+    def _skipped(context) -> bool:
+        return context is not None and not context.execution_options.get("profile", True)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._skipped(context):
+            return
+        conn.info.setdefault("profiler_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._skipped(context):
+            return
+        elapsed = time.perf_counter() - conn.info["profiler_start"].pop()
+        key = self._fingerprints.get(statement)
+        if key is None:
+            if len(self._fingerprints) > 10_000:
+                self._fingerprints.clear()
+            key = self._fingerprints[statement] = fingerprint(statement)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = StatementStats()
+        stats.add(elapsed, row_count(cursor))
+
+        seen = request_statements.get()
+        if seen is not None:
+            seen[key] = seen.get(key, 0) + 1
+            if seen[key] == self.n_plus_one:
+                stats.n_plus_one += 1
+                logger.warning("Possible N+1: statement repeated in one request",
+                               extra={"statement": key, "times": self.n_plus_one})
+
+        if self.explain and elapsed >= self.slow and stats.plan is None and key.upper().startswith("SELECT"):
+            self._schedule_explain(stats, statement, parameters)
+
+    @staticmethod
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("profiler_start"):
+            connection.info["profiler_start"].pop()
+
+    def _schedule_explain(self, stats: StatementStats, statement: str, parameters):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        stats.plan = ""  # pending: one plan per statement
+        task = loop.create_task(self._explain(stats, statement, parameters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, stats: StatementStats, statement: str, parameters):
+        try:
+            async with self._engine.connect() as conn:
+                conn = await conn.execution_options(profile=False)
+                # read only: a SELECT ... FOR UPDATE fails instead of waiting for the request's locks
+                await conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                result = await conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+                stats.plan = "\n".join(row[0] for row in result)
+        except Exception as err:
+            stats.plan = f"EXPLAIN failed: {err}"
+
+    def reset(self):
+        self.stats.clear()
+
+    def report(self, limit: int = 30) -> str:
+        """
+        The report function renders the collected statistics as a text table ordered by total time,
+            followed by the plans captured for slow statements.
+
+        :param self: Represent the instance of the class
+        :param limit: int: How many statements to include
+        :return: The report text
+        :doc-author: Trelent
+        """
+        ordered = sorted(self.stats.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+        lines = [f"{'total ms':>10} {'count':>7} {'p50 ms':>8} {'p99 ms':>8} {'rows/call':>9} {'N+1':>5}  statement"]
+        for key, stats in ordered:
+            lines.append(f"{stats.total * 1000:10.1f} {stats.count:7d} {stats.percentile(0.5) * 1000:8.2f} "
+                         f"{stats.percentile(0.99) * 1000:8.2f} {stats.rows / stats.count:9.1f} "
+                         f"{stats.n_plus_one:5d}  {key}")
+        for key, stats in ordered:
+            if stats.plan:
+                lines.extend(["", f"-- {key}", stats.plan])
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.report(limit=len(self.stats) or 1))
+
+
+class QueryProfilerMiddleware:
+    """
+    Pure ASGI middleware giving every request its own statement counter for N+1 detection.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = request_statements.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_statements.reset(token)
+#__________________SQL profiler_______________________________________________________________________________________|
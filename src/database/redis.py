@@ -0,0 +1,63 @@
+#____________________________3.13____limiter___________________________________________________________________________________
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+
+from src.conf.config import config
+from src.services.circuit_breaker import CircuitBreaker
+
+
+class BreakerPipeline(Pipeline):
+    def __init__(self, *args, breaker: CircuitBreaker, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.breaker = breaker
+
+    async def execute(self, raise_on_error: bool = True):
+        async with self.breaker:
+            return await super().execute(raise_on_error)
+
+
+class BreakerRedis(redis.Redis):
+    """
+    Redis client sending every command, pipeline and script through a circuit breaker,
+    so while Redis is down callers get CircuitOpenError at once instead of waiting on timeouts.
+    """
+
+    def __init__(self, *args, breaker: CircuitBreaker, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.breaker = breaker
+
+    async def execute_command(self, *args, **options):
+        async with self.breaker:
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> BreakerPipeline:
+        return BreakerPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint,
+                               breaker=self.breaker)
+
+
+class RedisManager:
+    def __init__(self, host: str, port: int, password: str | None, breaker: CircuitBreaker | None = None):
+        self._host = host
+        self._port = port
+        self._password = password
+        self.breaker = breaker or CircuitBreaker("redis")
+        self._client: redis.Redis | None = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            # short timeouts: a slow Redis must trip the breaker, not hold requests
+            self._client = BreakerRedis(host=self._host, port=self._port, db=0, password=self._password,
+                                        socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+                                        socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+                                        breaker=self.breaker)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+redis_manager = RedisManager(config.REDIS_DOMAIN, config.REDIS_PORT, config.REDIS_PASSWORD,
+                             CircuitBreaker("redis", config.REDIS_BREAKER_FAILURES, config.REDIS_BREAKER_RESET_SECONDS))
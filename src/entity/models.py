@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, CheckConstraint, ForeignKey, DateTime, func, Boolean
+from sqlalchemy import String, Integer, BigInteger, CheckConstraint, ForeignKey, DateTime, func, Boolean, Index, \
+    literal_column, text, event, DDL
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.sql.sqltypes import Date
 from datetime import date
@@ -8,13 +9,21 @@ class Base(DeclarativeBase):
     pass
 
 
+# id of the writing transaction, the change sequence of the delta sync (see repository.get_contacts_changes)
+CURRENT_XACT_ID = "pg_current_xact_id()::text::bigint"
+CONTACT_PARTITIONS = 16
+
+
 class Contact(Base):
     __tablename__ = "contacts"
-    id: Mapped[int] = mapped_column(primary_key=True)
+    # hash-partitioned on user_id (migration c5e8a1b7d3f2): the primary key has to include it,
+    # and queries filtering on user_id only touch the partition of that user
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     f_name: Mapped[str] = mapped_column(String(50), index=True)
     l_name: Mapped[str] = mapped_column(String(50), index=True)
     email: Mapped[str] = mapped_column(String(100))
     phone: Mapped[str] = mapped_column(String(25))
+    phone_e164: Mapped[str] = mapped_column(String(16), nullable=True)  # phone normalized by services.phone.to_e164
     birthday: Mapped[date] = mapped_column(Date, nullable=False)
     additional_data: Mapped[str] = mapped_column(default=False)
     
@@ -23,15 +32,30 @@ class Contact(Base):
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now(),
                                              nullable=True)
 
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), primary_key=True)
+    change_xid: Mapped[int] = mapped_column(BigInteger, server_default=text(f"({CURRENT_XACT_ID})"),
+                                            onupdate=literal_column(CURRENT_XACT_ID), nullable=True)
     user: Mapped["User"] = relationship("User", backref="contacts", lazy="joined")
     #__________________1.12.A&A_______________________________________________________________________________________
     
     __table_args__ = (
         CheckConstraint("phone ~ E'^[\\d\\+\\(\\)]+$'"),
+        Index("ix_contacts_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_contacts_user_id_phone_e164", "user_id", "phone_e164"),
+        Index("ix_contacts_user_id_change_xid", "user_id", "change_xid"),
+        {"postgresql_partition_by": "HASH (user_id)"},
     )
     
     #__________________1.12.A&A_______________________________________________________________________________________
+# a partitioned table without partitions rejects every insert: metadata.create_all makes the same
+# partitions as migration c5e8a1b7d3f2 (env.py keeps them out of autogenerate)
+for remainder in range(CONTACT_PARTITIONS):
+    event.listen(Contact.__table__, "after_create", DDL(
+        f"CREATE TABLE contacts_p{remainder:02d} PARTITION OF contacts "
+        f"FOR VALUES WITH (MODULUS {CONTACT_PARTITIONS}, REMAINDER {remainder})"
+    ).execute_if(dialect="postgresql"))
+
+
 class User(Base):
     __tablename__ = 'users'
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -39,8 +63,26 @@ class User(Base):
     email: Mapped[str] = mapped_column(String(150), nullable=False, unique=True)
     password: Mapped[str] = mapped_column(String(255), nullable=False)
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
+    # deprecated: refresh tokens live in the Redis rotation store (services.token_store) and nothing
+    # writes this column any more; drop it once no deployed version selects it
     refresh_token: Mapped[str] = mapped_column(String(255), nullable=True)
     created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now())
     #__________________1.13.Email_______________________________________________________________________________________
-    confirmation: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
\ No newline at end of file
+    confirmation: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
+
+
+#__________________delta sync_______________________________________________________________________________________
+class ContactTombstone(Base):
+    __tablename__ = "contacts_deleted"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    contact_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=True)
+    deleted_at: Mapped[date] = mapped_column('deleted_at', DateTime, default=func.now(), nullable=False)
+    change_xid: Mapped[int] = mapped_column(BigInteger, server_default=text(f"({CURRENT_XACT_ID})"), nullable=True)
+
+    __table_args__ = (
+        Index("ix_contacts_deleted_user_id_deleted_at", "user_id", "deleted_at"),
+        Index("ix_contacts_deleted_user_id_change_xid", "user_id", "change_xid"),
+    )
+#__________________delta sync_______________________________________________________________________________________|
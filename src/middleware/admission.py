@@ -0,0 +1,136 @@
+#__________________admission control_______________________________________________________________________________________
+import math
+import time
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+from src.services.metrics import admission_in_flight, admission_limit, admission_rejected_total, request_pool_wait
+
+
+# route groups by priority, highest first
+AUTH, READ, WRITE = "auth", "read", "write"
+PRIORITY = {AUTH: 0, READ: 1, WRITE: 2}
+# share of its limit a group may use while the pool is congested: writes are shed first
+CONGESTED_SHARE = {AUTH: 1.0, READ: 0.8, WRITE: 0.5}
+EXEMPT_PATHS = ("/metrics", "/api/health/", "/api/healthchecker")
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adapted from observed latency, in the spirit of Netflix's Gradient2:
+    a fast and a slow moving average of the latency are compared and, while the fast one
+    stays within tolerance of the slow one, the limit grows by about sqrt(limit) per update;
+    when latency rises the limit shrinks proportionally. A request that waited on the DB pool
+    longer than allowed is a congestion signal and cuts the limit by 10% (AIMD decrease).
+    """
+
+    def __init__(self, initial: int = 50, min_limit: int = 5, max_limit: int = 1000,
+                 tolerance: float = 2.0, smoothing: float = 0.2):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self._short: float | None = None
+        self._long: float | None = None
+
+    def try_acquire(self, share: float = 1.0) -> bool:
+        if self.in_flight >= max(self.min_limit, int(self.limit * share)):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: float, congested: bool = False):
+        """
+        The release function ends an admitted request and updates the limit from its latency.
+
+        :param self: Represent the instance of the class
+        :param latency: float: The request duration in seconds
+        :param congested: bool: Whether the request waited on the DB pool longer than allowed
+        :return: None
+        :doc-author: Trelent
+        """
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        if self._short is None:
+            self._short = self._long = latency
+        self._short += 0.1 * (latency - self._short)
+        self._long += 0.01 * (latency - self._long)
+        if self._long > 2 * self._short:
+            # latency dropped for good (e.g. after a slow period): let the baseline follow quickly
+            self._long *= 0.95
+
+        if congested:
+            new_limit = self.limit * 0.9
+        elif in_flight < self.limit / 2:
+            # far below the limit the latency says nothing about it, keep it as is
+            return
+        else:
+            gradient = max(0.5, min(1.0, self.tolerance * self._long / self._short))
+            new_limit = self.limit * gradient + math.sqrt(self.limit)
+        new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+
+def route_group(scope) -> str | None:
+    path = scope["path"]
+    if path == "/" or path.startswith(EXEMPT_PATHS):
+        return None
+    if path.startswith("/api/auth/"):
+        return AUTH
+    if scope["method"] in ("GET", "HEAD", "OPTIONS"):
+        return READ
+    return WRITE
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware shedding load before it piles up on the DB pool: every route group
+    (auth, reads, writes) has its own adaptive concurrency limit and requests above it get
+    503 with Retry-After at once. While the pool is congested, reads and writes may only use
+    part of their limit, so token refreshes and logins keep going and writes are shed first.
+    """
+
+    def __init__(self, app, initial_limit: int = 50, min_limit: int = 5, max_limit: int = 1000,
+                 pool_wait_ms: float = 50, retry_after: int = 1):
+        self.app = app
+        self.pool_wait = pool_wait_ms / 1000
+        self.retry_after = str(retry_after)
+        self.limiters = {group: AdaptiveLimiter(initial_limit, min_limit, max_limit) for group in PRIORITY}
+        self._pool_wait_avg = 0.0
+
+    @property
+    def congested(self) -> bool:
+        return self._pool_wait_avg > self.pool_wait
+
+    async def __call__(self, scope, receive, send):
+        group = route_group(scope) if scope["type"] == "http" else None
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[group]
+        share = CONGESTED_SHARE[group] if self.congested else 1.0
+        if not limiter.try_acquire(share):
+            admission_rejected_total.labels(group).inc()
+            response = JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    content={"detail": "Server is overloaded, retry later"},
+                                    headers={"Retry-After": self.retry_after})
+            await response(scope, receive, send)
+            return
+
+        admission_in_flight.labels(group).set(limiter.in_flight)
+        waited = [0.0]
+        token = request_pool_wait.set(waited)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_pool_wait.reset(token)
+            self._pool_wait_avg += 0.1 * (waited[0] - self._pool_wait_avg)
+            limiter.release(time.perf_counter() - start, congested=waited[0] > self.pool_wait)
+            admission_in_flight.labels(group).set(limiter.in_flight)
+            admission_limit.labels(group).set(round(limiter.limit, 1))
+#__________________admission control_______________________________________________________________________________________|
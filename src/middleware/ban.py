@@ -0,0 +1,119 @@
+#____________________________4.13____banned___________________________________________________________________________________
+import asyncio
+from bisect import bisect_right
+from ipaddress import ip_address, ip_network
+from typing import Iterable
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
+
+from src.services.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class IPBanList:
+    """
+    Banned networks (single addresses or CIDR ranges) compiled into sorted, merged
+    integer intervals per IP version, so a lookup is one bisect instead of a list scan.
+    The compiled tables are swapped in a single assignment, which makes reloads safe
+    while requests are being served.
+    """
+
+    def __init__(self, networks: Iterable[str] = ()):
+        self._tables: dict[int, tuple[list[int], list[int]]] = {}
+        self._size = 0
+        self.load(networks)
+
+    def load(self, networks: Iterable[str]) -> None:
+        """
+        The load function compiles the given networks and replaces the current ban list with them.
+            Entries that are not valid addresses or networks are skipped.
+        
+        :param self: Represent the instance of the class
+        :param networks: Iterable[str]: Addresses or CIDR ranges like "10.0.0.0/8"
+        :return: None
+        :doc-author: Trelent
+        """
+        intervals: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+        size = 0
+        for entry in networks:
+            try:
+                network = ip_network(entry.strip(), strict=False)
+            except ValueError as err:
+                logger.warning("Skipping invalid ban list entry", extra={"entry": entry, "error": str(err)})
+                continue
+            intervals[network.version].append((int(network.network_address), int(network.broadcast_address)))
+            size += 1
+
+        tables = {}
+        for version, ranges in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            tables[version] = (starts, ends)
+        self._tables = tables
+        self._size = size
+
+    def __contains__(self, host: str) -> bool:
+        try:
+            ip = ip_address(host)
+        except ValueError:
+            return False
+        starts, ends = self._tables[ip.version]
+        value = int(ip)
+        index = bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class BanIPMiddleware:
+    """
+    Pure ASGI middleware answering 403 to clients whose address is in the ban list.
+    Unlike @app.middleware("http") it doesn't wrap the request in BaseHTTPMiddleware streams.
+    """
+
+    def __init__(self, app, ban_list: IPBanList):
+        self.app = app
+        self.ban_list = ban_list
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.ban_list:
+            client = scope.get("client")
+            if client and client[0] in self.ban_list:
+                response = JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+async def watch_ban_list(ban_list: IPBanList, redis, key: str, static: Iterable[str], interval: float):
+    """
+    The watch_ban_list function reloads the ban list from the Redis set stored under key every interval seconds,
+        so bans can be added or lifted without restarting the workers.
+    
+    :param ban_list: IPBanList: The ban list used by the middleware
+    :param redis: Redis client holding the set of banned networks
+    :param key: str: The name of the Redis set
+    :param static: Iterable[str]: Networks from the config that are always banned
+    :param interval: float: Seconds between reloads
+    :return: None, runs until cancelled
+    :doc-author: Trelent
+    """
+    static = list(static)
+    while True:
+        try:
+            members = await redis.smembers(key)
+            ban_list.load(static + [m.decode() if isinstance(m, bytes) else m for m in members])
+        except RedisError as err:
+            logger.warning("Ban list reload failed", exc_info=err)
+        await asyncio.sleep(interval)
+#____________________________4.13____banned___________________________________________________________________________________|
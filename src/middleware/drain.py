@@ -0,0 +1,130 @@
+#__________________graceful shutdown_______________________________________________________________________________________
+import asyncio
+import signal
+from types import FrameType
+
+import uvicorn
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+from src.conf.config import config
+from src.services.health import health_checker
+from src.services.logger import get_logger
+from src.services.metrics import mail_queue_depth
+
+
+logger = get_logger(__name__)
+
+
+class InFlightTracker:
+    """
+    Counts the requests being served, background tasks included: Starlette runs a response's
+    BackgroundTasks (the queued emails) inside the same ASGI call, after the body is sent.
+    Draining starts on SIGTERM (DrainingServer), while the server still listens:
+    new requests are refused and the server stops only once the count reaches zero.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def enter(self):
+        self.active += 1
+        self._idle.clear()
+
+    def leave(self):
+        self.active -= 1
+        if self.active == 0:
+            self._idle.set()
+
+    def start_draining(self):
+        self.draining = True
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """
+        The wait_idle function waits until no request or background task is running.
+
+        :param self: Represent the instance of the class
+        :param timeout: float: The deadline in seconds
+        :return: True if everything finished in time, False if work was still running at the deadline
+        :doc-author: Trelent
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class DrainMiddleware:
+    """
+    Pure ASGI middleware counting in-flight requests and answering 503 with Connection: close
+    once the app is draining, so clients and load balancers retry on another worker.
+    """
+
+    def __init__(self, app, tracker: InFlightTracker):
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.tracker.draining:
+            response = JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    content={"detail": "Server is shutting down"},
+                                    headers={"Connection": "close", "Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+        self.tracker.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.leave()
+
+
+# the worker's tracker, shared by the middleware and DrainingServer
+in_flight = InFlightTracker()
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn Server draining before it stops. uvicorn closes the listening sockets and the
+    connections as soon as it gets SIGTERM, and only runs the lifespan shutdown after that,
+    so draining can't start there. Here the first SIGTERM or SIGINT only starts draining, with
+    the sockets still open: readiness and new requests are answered 503 with Connection: close,
+    so load balancers and clients go to another worker, and the requests in flight and their
+    queued emails get up to SHUTDOWN_TIMEOUT_SECONDS. Then the usual uvicorn shutdown runs.
+    A second signal skips the rest of the drain.
+    """
+
+    tracker = in_flight
+
+    def handle_exit(self, sig: int, frame: FrameType | None) -> None:
+        if self.tracker.draining or self.should_exit:
+            super().handle_exit(sig, frame)
+            return
+        self.tracker.start_draining()
+        self._drain_task = asyncio.get_event_loop().create_task(self.drain(sig, frame))
+
+    async def drain(self, sig: int, frame: FrameType | None) -> None:
+        """
+        The drain function waits for the work in flight, then lets uvicorn shut down.
+
+        :param self: Represent the instance of the class
+        :param sig: int: The signal received
+        :param frame: FrameType | None: The frame the signal interrupted
+        :return: None
+        :doc-author: Trelent
+        """
+        logger.info("Draining", extra={"signal": signal.Signals(sig).name, "requests": self.tracker.active})
+        await health_checker.stop()
+        if not await self.tracker.wait_idle(config.SHUTDOWN_TIMEOUT_SECONDS):
+            logger.warning("Shutdown deadline reached with work in flight",
+                           extra={"requests": self.tracker.active, "queued_emails": mail_queue_depth.value})
+            # the deadline is spent: uvicorn cancels what is still running instead of waiting again
+            self.config.timeout_graceful_shutdown = 0
+        super().handle_exit(sig, frame)
+#__________________graceful shutdown_______________________________________________________________________________________|
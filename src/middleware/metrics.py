@@ -0,0 +1,60 @@
+#__________________metrics_______________________________________________________________________________________
+import time
+
+from src.services.metrics import (
+    db_queries_per_request,
+    db_time_per_request_seconds,
+    http_request_duration_seconds,
+    http_requests_in_flight,
+    http_requests_total,
+    request_db_stats,
+)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status and SQL usage per route.
+    Routes are labelled with their path template ("/api/contacts/{contact_id}"), not the raw path,
+    to keep the number of series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: dict | None = None
+
+    def route_label(self, scope) -> str:
+        if self._route_paths is None:
+            self._route_paths = {route.endpoint: route.path
+                                 for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = request_db_stats.set(stats)
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            request_db_stats.reset(token)
+            route = self.route_label(scope)
+            method = scope["method"]
+            http_requests_total.labels(method, route, status_code).inc()
+            http_request_duration_seconds.labels(method, route).observe(elapsed)
+            db_queries_per_request.labels(route).observe(stats[0])
+            db_time_per_request_seconds.labels(route).observe(stats[1])
+#__________________metrics_______________________________________________________________________________________|
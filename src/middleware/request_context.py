@@ -0,0 +1,56 @@
+#__________________logging_______________________________________________________________________________________
+import time
+import uuid
+
+from src.services.logger import get_logger, request_id_var
+from src.services.tracing import tracer
+
+
+logger = get_logger("access")
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware giving every request an id (taken from X-Request-ID or generated),
+    returned in the X-Request-ID header, a root "http.request" span and one access log line.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        start = time.perf_counter()
+        try:
+            with tracer.span("http.request", method=scope["method"], path=scope["path"]) as span:
+                await self.app(scope, receive, send_wrapper)
+                span.set_attribute("status", status_code)
+        finally:
+            logger.info("request", extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            })
+            request_id_var.reset(token)
+#__________________logging_______________________________________________________________________________________|
@@ -1,15 +1,42 @@
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, or_, any_, bindparam, Integer, literal_column
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import load_only, raiseload
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.entity.models import Contact, User
+from src.database.db import commit
+from src.entity.models import Contact, ContactTombstone, User
 from src.schemas.contact import ContactSchema, ContactUpdateSchema
 
 from datetime import date
 import datetime
 
+from src.services.logger import get_logger
+from src.services.phone import to_e164
 
 
-async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User):
+logger = get_logger(__name__)
+
+
+
+def fieldset_options(fields: tuple[str, ...] | None) -> list:
+    """
+    The fieldset_options function returns the loader options selecting only the columns of the requested
+        fields, and skipping the join of the user unless it is requested. Anything else raises
+        if accessed instead of being loaded behind the caller's back.
+    
+    :param fields: tuple[str, ...] | None: Names of ContactResponse fields, all when None
+    :return: Options for select(Contact)
+    :doc-author: Trelent
+    """
+    if not fields:
+        return []
+    options = [load_only(*(getattr(Contact, field) for field in fields if field != "user"), raiseload=True)]
+    if "user" not in fields:
+        options.append(raiseload(Contact.user))
+    return options
+
+
+async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User, fields: tuple[str, ...] | None = None):
     """
     The get_contacts function returns a list of contacts for the given user.
     
@@ -17,15 +44,16 @@ async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User):
     :param offset: int: Specify the number of records to skip
     :param db: AsyncSession: Pass the database connection to the function
     :param user: User: Filter the contacts by user
+    :param fields: tuple[str, ...] | None: Load only these ContactResponse fields, all when None
     :return: A list of contact objects
     :doc-author: Trelent
     """
-    stmt = select(Contact).filter_by(user=user).offset(offset).limit(limit)
+    stmt = select(Contact).filter_by(user=user).offset(offset).limit(limit).options(*fieldset_options(fields))
     contacts = await db.execute(stmt)
     return contacts.scalars().all()
 
 #_____________11.12 _________________A&A__________________________________
-async def get_all_contacts(limit: int, offset: int, db: AsyncSession, user: User):
+async def get_all_contacts(limit: int, offset: int, db: AsyncSession, user: User, fields: tuple[str, ...] | None = None):
     """
     The get_all_contacts function returns all contacts for a given user.
     
@@ -33,29 +61,70 @@ async def get_all_contacts(limit: int, offset: int, db: AsyncSession, user: User
     :param offset: int: Determine how many contacts to skip before returning the results
     :param db: AsyncSession: Pass the database session to the function
     :param user: User: Identify the user who is making the request
+    :param fields: tuple[str, ...] | None: Load only these ContactResponse fields, all when None
     :return: A list of contact objects
     :doc-author: Trelent
     """
-    stmt = select(Contact).offset(offset).limit(limit)
+    stmt = select(Contact).offset(offset).limit(limit).options(*fieldset_options(fields))
     contacts = await db.execute(stmt)
     return contacts.scalars().all()
 
 
-async def get_contact(contact_id: int, db: AsyncSession, user: User):
+async def get_contact(contact_id: int, db: AsyncSession, user: User, fields: tuple[str, ...] | None = None):
     """
     The get_contact function returns a contact object from the database.
     
     :param contact_id: int: Filter the contact by id
     :param db: AsyncSession: Pass the database connection to the function
     :param user: User: Check if the user is allowed to access the contact
+    :param fields: tuple[str, ...] | None: Load only these ContactResponse fields, all when None
     :return: A contact object, not a list of contacts
     :doc-author: Trelent
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
+    stmt = select(Contact).filter_by(id=contact_id, user=user).options(*fieldset_options(fields))
     contact = await db.execute(stmt)
     return contact.scalar_one_or_none()
 
-async def get_contacts_by_birthday(today: date, end_date: date, db: AsyncSession, user: User):
+async def get_contacts_by_ids(contact_ids: list[int], db: AsyncSession, user: User, fields: tuple[str, ...] | None = None):
+    """
+    The get_contacts_by_ids function returns the contacts of the user with the given ids in one query.
+        The ids go as a single array parameter (id = ANY(:ids)), so the statement is the same
+        whatever the number of ids and its prepared form is reused.
+    
+    :param contact_ids: list[int]: The ids to fetch
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Filter the contacts by user
+    :param fields: tuple[str, ...] | None: Load only these ContactResponse fields, all when None
+    :return: A tuple of the contacts found, in the order of the ids, and the ids not found
+    :doc-author: Trelent
+    """
+    contact_ids = list(dict.fromkeys(contact_ids))
+    stmt = select(Contact).filter(Contact.user_id == user.id,
+                                  Contact.id == any_(bindparam("ids", contact_ids, type_=ARRAY(Integer))))
+    stmt = stmt.options(*fieldset_options(fields))
+    contacts = await db.execute(stmt)
+    by_id = {contact.id: contact for contact in contacts.scalars().all()}
+    found = [by_id[contact_id] for contact_id in contact_ids if contact_id in by_id]
+    missing = [contact_id for contact_id in contact_ids if contact_id not in by_id]
+    return found, missing
+
+async def get_contacts_by_phone(phone_e164: str, db: AsyncSession, user: User, fields: tuple[str, ...] | None = None):
+    """
+    The get_contacts_by_phone function returns the contacts of the user with the given phone number,
+        one probe of the (user_id, phone_e164) index in the partition of the user.
+    
+    :param phone_e164: str: The number in E.164 form, see services.phone.to_e164
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Filter the contacts by user
+    :param fields: tuple[str, ...] | None: Load only these ContactResponse fields, all when None
+    :return: A list of contacts
+    :doc-author: Trelent
+    """
+    stmt = select(Contact).filter_by(user_id=user.id, phone_e164=phone_e164).options(*fieldset_options(fields))
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
+
+async def get_contacts_by_birthday(today: date, end_date: date, db: AsyncSession, user: User, fields: tuple[str, ...] | None = None):
     """
     The get_contacts_by_birthday function returns a list of contacts that have birthdays between the start and end dates.
         
@@ -64,16 +133,17 @@ async def get_contacts_by_birthday(today: date, end_date: date, db: AsyncSession
     :param end_date: date: Specify the end date of the range
     :param db: AsyncSession: Pass in the database session
     :param user: User: Filter the contacts by user
+    :param fields: tuple[str, ...] | None: Load only these ContactResponse fields, all when None
     :return: A list of contacts
     :doc-author: Trelent
     """
     try:
         date_range_filter = and_(Contact.birthday >= today, Contact.birthday <= end_date)
-        stmt = select(Contact).filter(date_range_filter)
+        stmt = select(Contact).filter_by(user_id=user.id).filter(date_range_filter).options(*fieldset_options(fields))
         contacts = await db.execute(stmt)
         return contacts.scalars().all()
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error("Birthday search failed", exc_info=e)
         return []
 
 async def create_contact(body: ContactSchema, db: AsyncSession, user: User):
@@ -86,9 +156,9 @@ async def create_contact(body: ContactSchema, db: AsyncSession, user: User):
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = Contact(**body.model_dump(exclude_unset=True), user=user)  # (title=body.title, description=body.description)
+    contact = Contact(**body.model_dump(exclude_unset=True), phone_e164=to_e164(body.phone), user=user)  # (title=body.title, description=body.description)
     db.add(contact)
-    await db.commit()
+    await commit(db)
     await db.refresh(contact)
     return contact
 
@@ -112,9 +182,10 @@ async def update_contact(contact_id: int, body: ContactUpdateSchema, db: AsyncSe
         contact.l_name = body.l_name
         contact.email = body.email
         contact.phone = body.phone
+        contact.phone_e164 = to_e164(body.phone)
         contact.birthday = body.birthday
         contact.additional_data = body.additional_data
-        await db.commit()
+        await commit(db)
         await db.refresh(contact)
     return contact
 
@@ -134,5 +205,48 @@ async def delete_contact(contact_id: int, db: AsyncSession, user: User):
     contact = contact.scalar_one_or_none()
     if contact:
         await db.delete(contact)
-        await db.commit()
-    return contact
\ No newline at end of file
+        db.add(ContactTombstone(contact_id=contact.id, user_id=contact.user_id))
+        await commit(db)
+    return contact
+
+
+#__________________delta sync_______________________________________________________________________________________
+async def get_contacts_changes(since: str | None, db: AsyncSession, user: User, limit: int = 500,
+                               after: int | None = None, sync_token: str | None = None):
+    """
+    The get_contacts_changes function returns one page of the contacts of the user changed since the given
+        sync token, in id order, together with the ids of the contacts deleted since then (on the first page).
+        When since is None every contact of the user is returned, which is the initial sync.
+        Every write stores the id of its transaction (change_xid) and the token is the snapshot of the sync
+        in Postgres text form, xmin:xmax:running ids. A write the snapshot couldn't see has an id from xmax on
+        or one of the running ids, and only those are asked for next time. So a write committing late is
+        never skipped, and a long transaction doesn't hold the token back: only its own id stays in it
+        until it ends. Statements after the snapshot may see a bit more, which is sent again next time,
+        so clients apply changes idempotently.
+    
+    :param since: str | None: The sync token the client received last time
+    :param db: AsyncSession: Pass the database session to the function
+    :param user: User: Filter the contacts by user
+    :param limit: int: The page size
+    :param after: int | None: The last contact id of the previous page
+    :param sync_token: str | None: The token of the first page, taken now when None
+    :return: A tuple of changed contacts, deleted contact ids and the new sync token
+    :doc-author: Trelent
+    """
+    if sync_token is None:
+        # taken before the reads: under READ COMMITTED every statement sees at least what this snapshot saw
+        sync_token = (await db.execute(select(literal_column("pg_current_snapshot()::text")))).scalar_one()
+    stmt = select(Contact).filter_by(user_id=user.id)
+    tombstones_stmt = select(ContactTombstone.contact_id).filter_by(user_id=user.id)
+    if since is not None:
+        _, xmax, running = since.split(":")
+        running = [int(xid) for xid in running.split(",") if xid]
+        stmt = stmt.filter(or_(Contact.change_xid >= int(xmax), Contact.change_xid.in_(running)))
+        tombstones_stmt = tombstones_stmt.filter(or_(ContactTombstone.change_xid >= int(xmax),
+                                                     ContactTombstone.change_xid.in_(running)))
+    if after is not None:
+        stmt = stmt.filter(Contact.id > after)
+    changed = (await db.execute(stmt.order_by(Contact.id).limit(limit))).scalars().all()
+    deleted = [] if since is None or after is not None else (await db.execute(tombstones_stmt)).scalars().all()
+    return changed, deleted, sync_token
+#__________________delta sync_______________________________________________________________________________________|
\ No newline at end of file
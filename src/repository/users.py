@@ -1,12 +1,18 @@
 #____5.12.A&A_____________________________repository/users____________________________
+import hashlib
+
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import exists, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from libgravatar import Gravatar
 
-from src.database.db import get_db
+from src.database.db import get_db, commit
 from src.entity.models import User
 from src.schemas.user import UserSchema
+from src.services.logger import get_logger
+
+
+logger = get_logger(__name__)
 
 
 async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
@@ -25,56 +31,81 @@ async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
     return user
 
 #____6.12.A&A_____________________________create_user____________________________
+def gravatar_url(email: str) -> str:
+    """
+    The gravatar_url function builds the Gravatar image URL of the email: the MD5 of the trimmed,
+        lowercased address, no request to Gravatar needed.
+
+    >>> gravatar_url(" Test@Example.com ")
+    'https://www.gravatar.com/avatar/55502f40dc8b7c769880b10874abc9d0'
+
+    :param email: str: The user's email
+    :return: The avatar URL
+    :doc-author: Trelent
+    """
+    digest = hashlib.md5(email.strip().lower().encode(), usedforsecurity=False).hexdigest()
+    return f"https://www.gravatar.com/avatar/{digest}"
+
+
 async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
     """
     The create_user function creates a new user in the database.
         It takes a UserSchema object as input and returns the newly created user.
+        One INSERT ... ON CONFLICT (email) DO NOTHING RETURNING statement both detects an existing
+        account and returns the new row, so two signups with the same email can't race.
     
     :param body: UserSchema: Validate the request body
     :param db: AsyncSession: Get the database session
-    :return: A user object, which is the same as the body
+    :return: The new user, or None if an account with this email already exists
     :doc-author: Trelent
     """
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as err:
-        print(err)
-
-    new_user = User(**body.model_dump(), avatar=avatar)
-    db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
+    stmt = (
+        insert(User)
+        .values(**body.model_dump(), avatar=gravatar_url(body.email))
+        .on_conflict_do_nothing(index_elements=[User.email])
+        .returning(User)
+    )
+    new_user = (await db.scalars(stmt)).one_or_none()
+    if new_user is None:
+        return None
+    # detached before the commit, which would otherwise expire it and cost a SELECT to reload
+    db.expunge(new_user)
+    await commit(db)
     return new_user
 
-#____7.12.A&A_____9.12.A&A________________________________________________________________
-async def update_token(user: User, token: str | None, db: AsyncSession):
+#__________________1.13.Email_______________________________________________________________________________________    
+async def confirmed_email(email: str, db: AsyncSession) -> bool:
     """
-    The update_token function updates the user's refresh token in the database.
+    The confirmed_email function marks a user as confirmed by setting their confirmation field to True.
+        It is one conditional UPDATE: only a user not confirmed yet is changed, and no row is loaded.
     
-    :param user: User: Identify the user that is being updated
-    :param token: str | None: Specify that the token parameter can be either a string or none
-    :param db: AsyncSession: Allow the function to commit changes to the database
-    :return: Nothing, so the return type is none
+    :param email: str: Pass in the email address of the user who is confirming their account
+    :param db: AsyncSession: Pass in the database session
+    :return: True if the user was confirmed now, False if there is no such user or it was already confirmed
     :doc-author: Trelent
     """
-    user.refresh_token = token
-    await db.commit()
-    
-#__________________1.13.Email_______________________________________________________________________________________    
-async def confirmed_email(email: str, db: AsyncSession) -> None:
+    stmt = (
+        update(User)
+        .where(User.email == email, User.confirmation.is_not(True))
+        .values(confirmation=True)
+        .returning(User.id)
+    )
+    if (await db.execute(stmt)).scalar_one_or_none() is None:
+        return False
+    await commit(db)
+    return True
+
+
+async def user_exists(email: str, db: AsyncSession) -> bool:
     """
-    The confirmed_email function marks a user as confirmed by setting their confirmation field to True.
+    The user_exists function tells whether there is an account with this email.
     
-    :param email: str: Pass in the email address of the user who is confirming their account
+    :param email: str: The email to look up
     :param db: AsyncSession: Pass in the database session
-    :return: None, but the type hint says it returns none
+    :return: True if the account exists
     :doc-author: Trelent
     """
-    user = await get_user_by_email(email, db)
-    user.confirmation = True
-    await db.commit()
+    return bool(await db.scalar(select(exists().where(User.email == email))))
 
 #____________________________5.13____cloudinary______________________________________    
 async def update_avatar_url(email: str, url: str | None, db: AsyncSession) -> User:
@@ -89,6 +120,6 @@ async def update_avatar_url(email: str, url: str | None, db: AsyncSession) -> Us
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    await db.commit()
+    await commit(db)
     await db.refresh(user)
     return user
\ No newline at end of file
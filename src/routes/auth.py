@@ -1,28 +1,54 @@
 from fastapi import APIRouter, HTTPException, Request, Depends, status, Path, Query, Security, BackgroundTasks
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
+from jose import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.conf.config import config
+from src.database.db import get_db, get_db_transaction
 from src.repository import users as reps_users
-from src.schemas.user import UserSchema, TokenSchema, UserResponse, RequestEmail
+from src.entity.models import User
+from src.schemas.user import UserSchema, TokenSchema, UserResponse, RequestEmail, SessionResponse
 from src.services.auth import auth_service
-from src.services.email import send_email, send_email_reset_password
+from src.services.email import send_email, send_email_reset_password, enqueue_email
+from src.services.logger import get_logger
+from src.services.revocation import revocation_list
+from src.services.rate_limit import RateLimiter, TOKEN_BUCKET
+from src.services.token_store import token_store, REUSED, ROTATED
 
 import re
+import time
 from datetime import date, timedelta
 
+logger = get_logger(__name__)
 router = APIRouter(prefix='/auth', tags=['auth'])
 get_refresh_token = HTTPBearer() #____9.12.A&A____
 
+
+async def revoke_sessions(*session_ids: str):
+    """
+    The revoke_sessions function makes the access tokens already issued for the sessions invalid,
+        as their refresh tokens are. They are refused until the longest of them would have expired.
+    
+    :param session_ids: str: The revoked sessions
+    :return: None
+    :doc-author: Trelent
+    """
+    expires_at = time.time() + config.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    for session_id in session_ids:
+        await revocation_list.revoke(session_id, expires_at)
+
 #__________________2.12.A&A_______________________________________________________________________________________
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 #____6.12.A&A_____________________________реалізація____________________________
-async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
+async def signup(body: UserSchema, bt: BackgroundTasks, request: Request,
+                 db: AsyncSession = Depends(get_db_transaction)):
     """
     The signup function creates a new user in the database.
         It takes a UserSchema object as input, and returns the newly created user.
         If an account with that email already exists, it raises an HTTP 409 Conflict error.
+        The duplicate check is the insert itself, so signup is a single statement. The user is committed
+        with the request, and the verification email is sent only once that commit succeeded.
     
     :param body: UserSchema: Validate the request body
     :param bt: BackgroundTasks: Add a task to the background tasks queue
@@ -31,25 +57,27 @@ async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: As
     :return: A new user object
     :doc-author: Trelent
     """
-    exist_user = await reps_users.get_user_by_email(body.email, db)
-    if exist_user:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash_async(body.password)
     new_user = await reps_users.create_user(body, db)
+    if new_user is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
     #__________________1.13.Email_______________________________________________________________________________________
-    bt.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    enqueue_email(bt, send_email, new_user.email, new_user.username, str(request.base_url))
     #__________________1.13.Email_______________________________________________________________________________________|
     return new_user
 
 #__________________2.12.A&A_______________________________________________________________________________________
-@router.post("/login", response_model=TokenSchema)
+@router.post("/login", response_model=TokenSchema,
+             dependencies=[Depends(RateLimiter(times=5, seconds=60, group="login", by="ip", algorithm=TOKEN_BUCKET))])
 #____7.12.A&A_____________________________реалізація____________________________
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+async def login(request: Request, body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
     It takes the email and password of the user as input, and returns an access token if authentication was successful.
     The access token can be used in subsequent requests to gain access to protected resources.
+    Every login starts a new session in the token store, so each device has its own refresh token.
     
+    :param request: Request: Get the client's User-Agent and address for the session
     :param body: OAuth2PasswordRequestForm: Receive the login information from the user
     :param db: AsyncSession: Get a database session
     :return: A dictionary with the access_token and refresh_token keys
@@ -62,42 +90,103 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
     if not user.confirmation:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
     #__________________1.13.Email_______________________________________________________________________________________|
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password_async(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email, "test": "Ярослав Вдовенко"})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await reps_users.update_token(user, refresh_token, db)
+    family, jti = await token_store.create(user.email, request.headers.get("user-agent"),
+                                           request.client.host if request.client else None)
+    access_token = await auth_service.create_access_token(data={"sub": user.email, "sid": family,
+                                                                "test": "Ярослав Вдовенко"})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "fam": family, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 #__________________2.12.A&A_______________________________________________________________________________________
-@router.get('/refresh_token', response_model=TokenSchema)
+@router.get('/refresh_token', response_model=TokenSchema,
+            dependencies=[Depends(RateLimiter(times=10, seconds=60, group="refresh", by="ip"))])
 #____9.12.A&A_____________________________реалізація____________________________
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token),
-                        db: AsyncSession = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Depends(get_refresh_token)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access_token, 
         a new refresh_token, and the type of token (bearer).
+        Each refresh token works once: presenting an already rotated one revokes its whole session.
     
     :param credentials: HTTPAuthorizationCredentials: Get the refresh token from the request header
-    :param db: AsyncSession: Connect to the database
     :return: A dictionary with the access_token, refresh_token and token type
     :doc-author: Trelent
     """
     
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await reps_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await reps_users.update_token(user, None, db)
+    payload = await auth_service.decode_refresh_token(credentials.credentials)
+    email, family = payload["sub"], payload["fam"]
+    result, jti = await token_store.rotate(email, family, payload["jti"])
+    if result != ROTATED:
+        if result == REUSED:
+            logger.warning("Refresh token reuse, session revoked", extra={"user": email, "session": family})
+            await revoke_sessions(family)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await reps_users.update_token(user, refresh_token, db)
+    access_token = await auth_service.create_access_token(data={"sub": email, "sid": family})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "fam": family, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
+@router.get("/sessions", response_model=list[SessionResponse])
+async def list_sessions(user: User = Depends(auth_service.get_current_user),
+                        token: str = Depends(auth_service.oauth2_scheme)):
+    """
+    The list_sessions function returns the active sessions (logged in devices) of the current user.
+    
+    :param user: User: The current user
+    :param token: str: The access token, used to mark the session making the request
+    :return: A list of sessions, most recently used first
+    :doc-author: Trelent
+    """
+    current = auth_service.session_id(token)
+    return [dict(session, current=session["id"] == current) for session in await token_store.sessions(user.email)]
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_session(session_id: str = Path(max_length=32), user: User = Depends(auth_service.get_current_user)):
+    """
+    The revoke_session function logs one device out: the refresh token of the session stops working.
+    
+    :param session_id: str: The session to revoke
+    :param user: User: The current user
+    :return: None
+    :doc-author: Trelent
+    """
+    if not await token_store.revoke(user.email, session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    await revoke_sessions(session_id)
+
+@router.delete("/sessions", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_all_sessions(user: User = Depends(auth_service.get_current_user)):
+    """
+    The revoke_all_sessions function logs the current user out of every device.
+    
+    :param user: User: The current user
+    :return: None
+    :doc-author: Trelent
+    """
+    await revoke_sessions(*await token_store.revoke_all(user.email))
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(user: User = Depends(auth_service.get_current_user),
+                 token: str = Depends(auth_service.oauth2_scheme)):
+    """
+    The logout function ends the session the access token belongs to: the access token
+        and the session's refresh token stop working at once.
+    
+    :param user: User: The current user
+    :param token: str: The access token of the request
+    :return: None
+    :doc-author: Trelent
+    """
+    claims = jwt.get_unverified_claims(token)
+    if claims.get("jti"):
+        await revocation_list.revoke(claims["jti"], claims["exp"])
+    if claims.get("sid"):
+        await token_store.revoke(user.email, claims["sid"])
+        await revoke_sessions(claims["sid"])
+
 #__________________1.13.Email_______________________________________________________________________________________
 @router.get('/confirmed_email/{token}')
 async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
@@ -108,6 +197,7 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
         If they do exist but their account has already been confirmed, we return a message saying so.
         Otherwise (if they exist and their account has not yet been confirmed), we update their record in our database 
         with confirmation=True.
+        A used link is remembered in Redis until it expires, so opening it again doesn't query the database.
     
     :param token: str: Get the token from the url
     :param db: AsyncSession: Connect to the database
@@ -116,13 +206,16 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     :doc-author: Trelent
     """
     email = await auth_service.get_email_from_token(token)
-    user = await reps_users.get_user_by_email(email, db)
-    if user is None:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
-    if user.confirmation:
+    if await auth_service.email_token_used(token):
         return {"message": "Your email is already confirmed"}
-    await reps_users.confirmed_email(email, db)
-    return {"message": "Email confirmed"}
+    if await reps_users.confirmed_email(email, db):
+        await auth_service.mark_email_token_used(token)
+        await auth_service.uncache_user(email)
+        return {"message": "Email confirmed"}
+    if not await reps_users.user_exists(email, db):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
+    await auth_service.mark_email_token_used(token)
+    return {"message": "Your email is already confirmed"}
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
@@ -146,7 +239,7 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmation:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, str(request.base_url))
+        enqueue_email(background_tasks, send_email, user.email, user.username, str(request.base_url))
     return {"message": "Check your email for confirmation."}
 #__________________1.13.Email_______________________________________________________________________________________|
 
@@ -174,8 +267,6 @@ async def forget_password(
     """
     try:
         user = await reps_users.get_user_by_email(fpr.email, db)
-        print('-----------------------')
-        print(user.email,user.username)
         if user is None:
            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                   detail="Invalid Email address")
@@ -197,7 +288,7 @@ async def forget_password(
 
         fm = FastMail(mail_conf)
         background_tasks.add_task(fm.send_message, message, template_name)'''
-        background_tasks.add_task(send_email_reset_password, user.email, user.username, str(request.base_url))
+        enqueue_email(background_tasks, send_email_reset_password, user.email, user.username, str(request.base_url))
         return JSONResponse(status_code=status.HTTP_200_OK,
            content={"message": "Email has been sent", "success": True,
                "status_code": status.HTTP_200_OK})
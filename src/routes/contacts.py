@@ -1,19 +1,66 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.entity.models import User #8.12__A&A__приутствие аутентификации
 from src.services.auth import auth_service #8.12__A&A__приутствие аутентификации
-from src.database.db import get_db
+from src.database.db import get_db, get_db_transaction
 from src.repository import contacts as reps_contacts
-from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse
+from src.services.rate_limit import RateLimiter
+from src.services.phone import to_e164
+from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse, ContactChangesResponse, \
+    ContactBatchGetSchema, ContactBatchResponse, CONTACT_FIELDS, dump_contacts, SYNC_TOKEN_PATTERN, \
+    ContactFieldsResponse, ContactBatchFieldsResponse
 
+import base64
+import json
 import re
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 
-router = APIRouter(prefix='/contacts', tags=['contacts'])
+router = APIRouter(prefix='/contacts', tags=['contacts'],
+                   dependencies=[Depends(RateLimiter(times=100, seconds=60, group="contacts"))])
 
 
-@router.get("/", response_model=list[ContactResponse])
+#__________________sparse fieldsets_______________________________________________________________________________________
+def contact_fields(fields: str | None = Query(None, description="Comma separated contact fields to return, "
+                                                                 "e.g. f_name,l_name (id is always returned); all when not given")
+                   ) -> tuple[str, ...] | None:
+    """
+    The contact_fields function parses the fields query parameter of the contact routes.
+        Only the requested columns are selected and serialized, so a list showing names
+        doesn't load and send every column and the nested user.
+    
+    :param fields: str | None: Comma separated names of ContactResponse fields
+    :return: The fields in CONTACT_FIELDS order, or None for all of them
+    :doc-author: Trelent
+    """
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(CONTACT_FIELDS)
+    if unknown:
+        raise RequestValidationError([{"type": "value_error", "loc": ("query", "fields"),
+                                       "msg": f"Unknown fields: {', '.join(sorted(unknown))}", "input": fields}])
+    return tuple(field for field in CONTACT_FIELDS if field in requested or field == "id")
+
+
+def fieldset_responses(model) -> dict:
+    """
+    The fieldset_responses function documents the response of a route taking fields: given fields,
+        the route sends only id and the requested fields, which response_model alone doesn't describe.
+
+    :param model: The response model with every field but id optional
+    :return: The responses argument of the route
+    :doc-author: Trelent
+    """
+    return {200: {"model": model, "description": "All the contact fields, or only id and the fields "
+                                                 "requested in the fields query parameter"}}
+#__________________sparse fieldsets_______________________________________________________________________________________|
+
+
+@router.get("/", response_model=list[ContactResponse], responses=fieldset_responses(list[ContactFieldsResponse]))
 async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
+                    fields: tuple[str, ...] | None = Depends(contact_fields),
                     db: AsyncSession = Depends(get_db), 
                     user: User = Depends(auth_service.get_current_user) #8.12__A&A__User=__приутствие аутентификации
                     ):
@@ -27,17 +74,21 @@ async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Quer
     :param le: Specify the maximum value that can be passed in
     :param offset: int: Specify the offset in the database
     :param ge: Specify that the limit must be greater than or equal to 10
+    :param fields: tuple[str, ...] | None: The fields to return, all when None
     :param db: AsyncSession: Get the database session
     :param user: User: Get the current user from the database
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = await reps_contacts.get_contacts(limit, offset, db, user)
+    contacts = await reps_contacts.get_contacts(limit, offset, db, user, fields)
+    if fields:
+        return JSONResponse(dump_contacts(contacts, fields))
     return contacts
 
 #_____________11.12 _________________A&A__________________________________
-@router.get("/all", response_model=list[ContactResponse])
+@router.get("/all", response_model=list[ContactResponse], responses=fieldset_responses(list[ContactFieldsResponse]))
 async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
+                    fields: tuple[str, ...] | None = Depends(contact_fields),
                     db: AsyncSession = Depends(get_db), 
                     user: User = Depends(auth_service.get_current_user) #8.12__A&A__User=__приутствие аутентификации
                     ):
@@ -51,17 +102,137 @@ async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Quer
     :param le: Limit the maximum number of contacts returned
     :param offset: int: Specify the number of contacts to skip
     :param ge: Specify that the limit must be greater than or equal to 10
+    :param fields: tuple[str, ...] | None: The fields to return, all when None
     :param db: AsyncSession: Pass the database session to the function
     :param user: User: Get the current user from the auth_service
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = await reps_contacts.get_all_contacts(limit, offset, db, user)
+    contacts = await reps_contacts.get_all_contacts(limit, offset, db, user, fields)
+    if fields:
+        return JSONResponse(dump_contacts(contacts, fields))
     return contacts
 
+#__________________delta sync_______________________________________________________________________________________
+def encode_cursor(since: str | None, sync_token: str, after: int) -> str:
+    """
+    The encode_cursor function packs what the next page of a sync needs into one opaque string.
+
+    >>> decode_cursor(encode_cursor(None, "5:9:7", 42))
+    (None, '5:9:7', 42)
+
+    :param since: str | None: The token the sync started from
+    :param sync_token: str: The token of the first page
+    :param after: int: The last contact id sent
+    :return: The cursor
+    :doc-author: Trelent
+    """
+    return base64.urlsafe_b64encode(json.dumps([since, sync_token, after]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str | None, str, int]:
+    """
+    The decode_cursor function unpacks a cursor made by encode_cursor.
+        Anything else is a validation error of the cursor query parameter.
+
+    :param cursor: str: The cursor sent by the client
+    :return: The since token, the sync token and the last contact id sent
+    :doc-author: Trelent
+    """
+    try:
+        since, sync_token, after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        tokens = [since, sync_token] if since is not None else [sync_token]
+        if all(isinstance(token, str) and re.match(SYNC_TOKEN_PATTERN, token) for token in tokens) \
+                and isinstance(after, int) and not isinstance(after, bool):
+            return since, sync_token, after
+    except (ValueError, TypeError):
+        pass
+    raise RequestValidationError([{"type": "value_error", "loc": ("query", "cursor"),
+                                   "msg": "Invalid cursor", "input": cursor}])
+
+
+@router.get("/changes", response_model=ContactChangesResponse)
+async def get_contacts_changes(since: str | None = Query(None, pattern=SYNC_TOKEN_PATTERN,
+                                                         description="Sync token returned by the previous sync"),
+                    cursor: str | None = Query(None, description="next_cursor of the previous page of this sync"),
+                    limit: int = Query(500, ge=10, le=1000),
+                    db: AsyncSession = Depends(get_db),
+                    user: User = Depends(auth_service.get_current_user)
+                    ):
+    """
+    The get_contacts_changes function returns only the contacts changed since the given sync token
+        and the ids of the contacts deleted since then, so clients don't have to page through
+        the whole list to stay in sync. Without since it returns every contact (initial sync).
+        Contacts come in pages of limit: while next_cursor is set the client asks for it,
+        and keeps the sync_token for its next sync only after the last page.
+    
+    :param since: str | None: The sync token returned by the previous sync
+    :param cursor: str | None: The next_cursor of the previous page, it carries since
+    :param limit: int: The page size
+    :param db: AsyncSession: Get the database session
+    :param user: User: Get the current user
+    :return: Changed contacts, deleted contact ids, the new sync token and the cursor of the next page
+    :doc-author: Trelent
+    """
+    after, sync_token = None, None
+    if cursor is not None:
+        since, sync_token, after = decode_cursor(cursor)
+    changed, deleted, sync_token = await reps_contacts.get_contacts_changes(since, db, user, limit, after, sync_token)
+    next_cursor = encode_cursor(since, sync_token, changed[-1].id) if len(changed) == limit else None
+    return {"changed": changed, "deleted": deleted, "sync_token": sync_token, "next_cursor": next_cursor}
+#__________________delta sync_______________________________________________________________________________________|
+
+
+@router.post("/batch-get", response_model=ContactBatchResponse,
+             responses=fieldset_responses(ContactBatchFieldsResponse))
+async def batch_get_contacts(body: ContactBatchGetSchema, fields: tuple[str, ...] | None = Depends(contact_fields),
+                    db: AsyncSession = Depends(get_db),
+                    user: User = Depends(auth_service.get_current_user)
+                    ):
+    """
+    The batch_get_contacts function returns up to 500 contacts by id in one request and one query,
+        instead of one GET /contacts/{contact_id} per contact.
+    
+    :param body: ContactBatchGetSchema: The ids of the contacts
+    :param fields: tuple[str, ...] | None: The fields to return, all when None
+    :param db: AsyncSession: Get the database session
+    :param user: User: Get the current user
+    :return: The contacts found, in the order of the ids, and the ids that don't exist or belong to another user
+    :doc-author: Trelent
+    """
+    found, missing = await reps_contacts.get_contacts_by_ids(body.ids, db, user, fields)
+    if fields:
+        return JSONResponse({"found": dump_contacts(found, fields), "missing": missing})
+    return {"found": found, "missing": missing}
+
+@router.get("/by-phone/{number}", response_model=list[ContactResponse],
+            responses=fieldset_responses(list[ContactFieldsResponse]))
+async def get_contacts_by_phone(number: str = Path(max_length=32),
+                    fields: tuple[str, ...] | None = Depends(contact_fields), db: AsyncSession = Depends(get_db),
+                    user: User = Depends(auth_service.get_current_user)
+                    ):
+    """
+    The get_contacts_by_phone function returns the contacts with the given phone number (caller ID lookup).
+        The number can be written any usual way, it is normalized to E.164 before the lookup.
+    
+    :param number: str: The phone number
+    :param fields: tuple[str, ...] | None: The fields to return, all when None
+    :param db: AsyncSession: Get the database session
+    :param user: User: Get the current user
+    :return: The matching contacts, an empty list if there are none
+    :doc-author: Trelent
+    """
+    phone_e164 = to_e164(number)
+    if phone_e164 is None:
+        raise HTTPException(status_code=422, detail="Input valid phone")
+    contacts = await reps_contacts.get_contacts_by_phone(phone_e164, db, user, fields)
+    if fields:
+        return JSONResponse(dump_contacts(contacts, fields))
+    return contacts
 
-@router.get("/{contact_id}", response_model=ContactResponse)
-async def get_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db), 
+@router.get("/{contact_id}", response_model=ContactResponse, responses=fieldset_responses(ContactFieldsResponse))
+async def get_contact(contact_id: int = Path(ge=1), fields: tuple[str, ...] | None = Depends(contact_fields),
+                    db: AsyncSession = Depends(get_db), 
                     user: User = Depends(auth_service.get_current_user) #8.12__A&A__User=__приутствие аутентификации
                     ):
     """
@@ -70,19 +241,24 @@ async def get_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(g
     
     
     :param contact_id: int: Specify the path parameter
+    :param fields: tuple[str, ...] | None: The fields to return, all when None
     :param db: AsyncSession: Get a database connection
     :param user: User: Get the current user
     :return: A contact
     :doc-author: Trelent
     """
-    contact = await reps_contacts.get_contact(contact_id, db, user)
+    contact = await reps_contacts.get_contact(contact_id, db, user, fields)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    if fields:
+        return JSONResponse(dump_contacts([contact], fields)[0])
     return contact
 
-@router.get("/birthdays/", response_model=list[ContactResponse])
+@router.get("/birthdays/", response_model=list[ContactResponse],
+            responses=fieldset_responses(list[ContactFieldsResponse]))
 async def get_contact_by_bday(
     days_ahead: int = Query(7, description="Number of days ahead to search for birthdays"),
+    fields: tuple[str, ...] | None = Depends(contact_fields),
     db: AsyncSession = Depends(get_db), 
                     user: User = Depends(auth_service.get_current_user) #8.12__A&A__User=__приутствие аутентификации
                     ):
@@ -93,6 +269,7 @@ async def get_contact_by_bday(
     
     :param days_ahead: int: Specify the number of days ahead to search for birthdays
     :param description: Document the api
+    :param fields: tuple[str, ...] | None: The fields to return, all when None
     :param db: AsyncSession: Pass in the database session
     :param user: User: Get the user from the request
     :return: A list of contacts
@@ -100,9 +277,11 @@ async def get_contact_by_bday(
     """
     today = date.today()
     end_date = today + timedelta(days=days_ahead)
-    contacts = await reps_contacts.get_contacts_by_birthday(today, end_date, db, user)
+    contacts = await reps_contacts.get_contacts_by_birthday(today, end_date, db, user, fields)
     if contacts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
+    if fields:
+        return JSONResponse(dump_contacts(contacts, fields))
     return contacts
 
 
@@ -150,7 +329,7 @@ async def update_contact(body: ContactUpdateSchema, contact_id: int = Path(ge=1)
 
 
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db), 
+async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db_transaction), 
                     user: User = Depends(auth_service.get_current_user) #8.12__A&A__User=__приутствие аутентификации
                     ):
     """
@@ -161,6 +340,7 @@ async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depend
         Returns:
             dict: A dictionary containing information about whether or not 
                 deleting was successful and, if so, which user was deleted.
+        The contact and its tombstone for the delta sync are committed together with the request.
     
     :param contact_id: int: Specify the path parameter
     :param db: AsyncSession: Get the database session
@@ -0,0 +1,34 @@
+#__________________health checks_______________________________________________________________________________________
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from src.services.health import health_checker
+
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live")
+async def liveness():
+    """
+    The liveness function tells the orchestrator the process is up and its event loop responsive.
+        It checks no dependency: a database outage must not get every pod restarted.
+    
+    :return: A static status
+    :doc-author: Trelent
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness():
+    """
+    The readiness function answers from the status cached by the background health checker,
+        with 503 while a critical dependency (Postgres, its pool, Redis) is failing or saturated.
+    
+    :return: The status of every dependency, with the time it was checked
+    :doc-author: Trelent
+    """
+    code = status.HTTP_200_OK if health_checker.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(status_code=code, content=health_checker.status)
+#__________________health checks_______________________________________________________________________________________|
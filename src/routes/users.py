@@ -1,8 +1,5 @@
 #____________________________3.13____limiter___________________________________________________________________________________
-import pickle
-
-import cloudinary
-import cloudinary.uploader
+from functools import cache
 
 from fastapi import APIRouter, File, HTTPException, Request, Depends, UploadFile, status, Path, Query, Security, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -11,22 +8,35 @@ from src.entity.models import User
 from src.schemas.user import UserResponse
 from src.services.auth import auth_service
 from src.repository import users as reps_users
-from fastapi_limiter.depends import RateLimiter 
+from src.services.rate_limit import RateLimiter
 from src.conf.config import config
 from src.database.db import get_db
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 #____5.13___ініціалізація cloudinary__________________________
-cloudinary.config(
-    cloud_name=config.CLD_NAME,
-    api_key=config.CLD_API_KEY,
-    api_secret=config.CLD_API_SECRET,
-    secure=True,
-)
+@cache
+def get_cloudinary():
+    """
+    The get_cloudinary function imports and configures cloudinary on the first avatar upload,
+        instead of at import time, so workers that never upload don't pay for it on startup.
+    
+    :return: The configured cloudinary module
+    :doc-author: Trelent
+    """
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(
+        cloud_name=config.CLD_NAME,
+        api_key=config.CLD_API_KEY,
+        api_secret=config.CLD_API_SECRET,
+        secure=True,
+    )
+    return cloudinary
 
 
-@router.get("/me", response_model=UserResponse, dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+@router.get("/me", response_model=UserResponse, dependencies=[Depends(RateLimiter(times=1, seconds=20, group="users.me"))])
 async def get_current_user(user: User = Depends(auth_service.get_current_user)):
     """
     The get_current_user function is a dependency that will be injected into the
@@ -46,7 +56,7 @@ async def get_current_user(user: User = Depends(auth_service.get_current_user)):
 @router.patch(
     "/avatar",
     response_model=UserResponse,
-    dependencies=[Depends(RateLimiter(times=1, seconds=20))],
+    dependencies=[Depends(RateLimiter(times=1, seconds=20, group="users.avatar"))],
 )
 async def get_current_user(
     file: UploadFile = File(),
@@ -66,14 +76,13 @@ async def get_current_user(
     :doc-author: Trelent
     """
     
+    cloudinary = get_cloudinary()
     public_id = f"Web17/{user.email}"
     res = cloudinary.uploader.upload(file.file, public_id=public_id, owerite=True)
-    print(res)
     res_url = cloudinary.CloudinaryImage(public_id).build_url(
         width=250, height=250, crop="fill", version=res.get("version")
     )
     user = await reps_users.update_avatar_url(user.email, res_url, db)
-    auth_service.cache.set(user.email, pickle.dumps(user))
-    auth_service.cache.expire(user.email, 300)
+    await auth_service.cache_user(user)
     
     return user
\ No newline at end of file
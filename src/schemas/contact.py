@@ -1,6 +1,7 @@
-from typing import Optional
+from functools import lru_cache
+from typing import Annotated, Optional
 
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, TypeAdapter, create_model
 #from sqlalchemy.sql.sqltypes import Date
 from datetime import date, datetime
 from sqlalchemy import CheckConstraint
@@ -26,6 +27,7 @@ class ContactResponse(BaseModel):
     l_name: str
     email: str
     phone: str
+    phone_e164: str | None = None
     birthday: date
     additional_data: str = None
     created_at: datetime | None
@@ -33,4 +35,74 @@ class ContactResponse(BaseModel):
     user: UserResponse | None  #если заккоментить, get возвращается без юзера
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+
+#__________________sparse fieldsets_____________________
+CONTACT_FIELDS = tuple(ContactResponse.model_fields)
+
+# for the API docs: a contact of the routes taking fields, where only id and the requested fields are sent
+ContactFieldsResponse = create_model(
+    "ContactFieldsResponse",
+    **{name: (field.annotation, field if name == "id" else Field(None))
+       for name, field in ContactResponse.model_fields.items()})
+
+
+class ContactBatchFieldsResponse(BaseModel):
+    found: list[ContactFieldsResponse]
+    missing: list[int]
+
+
+@lru_cache(maxsize=256)
+def contact_fieldset(fields: tuple[str, ...]) -> TypeAdapter:
+    """
+    The contact_fieldset function returns the adapter of lists of contacts narrowed to the given
+        fields of ContactResponse, built once per fieldset.
+
+    :param fields: tuple[str, ...]: Names of ContactResponse fields, in CONTACT_FIELDS order
+    :return: A TypeAdapter of lists of the narrowed model
+    :doc-author: Trelent
+    """
+    model = create_model(f"ContactResponse[{','.join(fields)}]", __config__=ConfigDict(from_attributes=True),
+                         **{name: (ContactResponse.model_fields[name].annotation, ContactResponse.model_fields[name])
+                            for name in fields})
+    return TypeAdapter(list[model])
+
+
+def dump_contacts(contacts: list, fields: tuple[str, ...]) -> list[dict]:
+    """
+    The dump_contacts function serializes contacts with only the given fields, reading no other attribute.
+
+    >>> dump_contacts([{"id": 1, "f_name": "Taras", "l_name": "Shevchenko"}], ("id", "f_name"))
+    [{'id': 1, 'f_name': 'Taras'}]
+
+    :param contacts: list: Contact objects, or dicts
+    :param fields: tuple[str, ...]: Names of ContactResponse fields, in CONTACT_FIELDS order
+    :return: JSON-ready dicts
+    :doc-author: Trelent
+    """
+    adapter = contact_fieldset(fields)
+    return adapter.dump_python(adapter.validate_python(contacts, from_attributes=True), mode="json")
+#__________________sparse fieldsets_____________________|
+
+#__________________delta sync_____________________
+# a Postgres snapshot in text form, xmin:xmax:running transaction ids
+SYNC_TOKEN_PATTERN = r"^\d{1,19}:\d{1,19}:(\d{1,19}(,\d{1,19})*)?$"
+
+
+class ContactChangesResponse(BaseModel):
+    changed: list[ContactResponse]
+    deleted: list[int]
+    sync_token: str
+    next_cursor: str | None = None
+
+
+class ContactBatchGetSchema(BaseModel):
+    # contacts.id is an int4 column: larger ids can't exist and asyncpg refuses to bind them
+    ids: list[Annotated[int, Field(ge=1, le=2**31 - 1)]] = Field(min_length=1, max_length=500)
+
+
+class ContactBatchResponse(BaseModel):
+    found: list[ContactResponse]
+    missing: list[int]
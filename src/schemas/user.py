@@ -26,6 +26,14 @@ class TokenSchema(BaseModel):
     refresh_token: str
     token_type: str = "bearer"
 
+class SessionResponse(BaseModel):
+    id: str
+    device: Optional[str]
+    ip: Optional[str]
+    created: int
+    last_used: int
+    current: bool = False
+
 #__________________1.13.Email_____________________    
 class RequestEmail(BaseModel):
     email: EmailStr
\ No newline at end of file
@@ -1,19 +1,32 @@
 #__________________4.12.A&A__________________________Аут та створення токенів_____________________________________________________________
 from datetime import datetime, timedelta
+import hashlib
 import pickle
+import time
+import uuid
 from typing import Optional
 
-import redis
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
+from redis.exceptions import RedisError
 from src.conf.config import config
 
 
-from src.database.db import get_db
+from src.database.db import sessionmanager
+from src.database.redis import redis_manager
 from src.repository import users as reps_users
+from src.services.circuit_breaker import CircuitOpenError
+from src.services.cache import LocalCache, SingleFlight, refresh_early
+from src.services.revocation import revocation_list
+from src.services.metrics import auth_cache_requests_total, bcrypt_pool_wait_seconds, bcrypt_duration_seconds
+from src.services.logger import get_logger
+from src.services.tracing import tracer
+
+
+logger = get_logger(__name__)
 
 class Auth:
     
@@ -25,12 +38,84 @@ class Auth:
     SECRET_KEY = config.SECRET_KEY_JWT
     ALGORITHM = config.ALGORITHM
     #____________________________5.13____cloudinary______________________________________
-    cache = redis.Redis(
-        host=config.REDIS_DOMAIN,
-        port=config.REDIS_PORT,
-        db=0,
-        password=config.REDIS_PASSWORD,
-    )
+    USER_CACHE_TTL = 300
+    USER_CACHE_PREFIX = "user:"
+    USER_CACHE_BETA = 1.0  # XFetch: >1 refreshes earlier
+    EMAIL_TOKEN_TTL = 24 * 3600
+    USED_EMAIL_TOKEN_PREFIX = "email_token_used:"
+    user_loads = SingleFlight()
+    # serves the users seen lately while Redis is unavailable, instead of a query per request;
+    # holds the pickled cache entries, so every request unpickles its own User instance
+    local_users = LocalCache(ttl=30)
+
+    @property
+    def cache(self):
+        # the shared async client, connected on first use rather than when the module is imported
+        return redis_manager.client
+
+    def cache_key(self, email: str) -> str:
+        return f"{self.USER_CACHE_PREFIX}{email}"
+
+    async def cache_user(self, user, delta: float = 0.01):
+        """
+        The cache_user function stores the user in the auth cache under its email,
+            so get_current_user doesn't have to query the database for the next requests.
+            The entry keeps how long the load took and when it expires, for the early refresh.
+        
+        :param self: Represent the instance of the class
+        :param user: User: The user to cache
+        :param delta: float: How long loading the user took, in seconds
+        :return: The pickled cache entry
+        :doc-author: Trelent
+        """
+        key = self.cache_key(user.email)
+        entry = pickle.dumps((user, delta, time.time() + self.USER_CACHE_TTL))
+        self.local_users.set(key, entry)
+        try:
+            with tracer.span("redis.set"):
+                await self.cache.set(key, entry, ex=self.USER_CACHE_TTL)
+        except CircuitOpenError:
+            pass
+        except RedisError as err:
+            logger.warning("User not cached in Redis", extra={"error": str(err)})
+        return entry
+
+    async def uncache_user(self, email: str):
+        """
+        The uncache_user function drops the user's auth cache entry after the user changed in the database,
+            so the next request loads the new state.
+        
+        :param self: Represent the instance of the class
+        :param email: str: The user's email
+        :return: None
+        :doc-author: Trelent
+        """
+        key = self.cache_key(email)
+        self.local_users.delete(key)
+        try:
+            await self.cache.delete(key)
+        except RedisError as err:
+            logger.warning("User not removed from the Redis cache", extra={"error": str(err)})
+
+    async def load_user(self, email: str):
+        """
+        The load_user function reads the user from the database in its own session and caches it.
+            It runs as a task shared by all requests missing the same user, so it must not
+            depend on the session of the request that started it. It returns the pickled cache
+            entry: every waiting request unpickles its own instance, as one ORM object can't be
+            used by several sessions at once.
+        
+        :param self: Represent the instance of the class
+        :param email: str: The user's email
+        :return: The pickled cache entry, or None if there is no such user
+        :doc-author: Trelent
+        """
+        started = time.perf_counter()
+        async with sessionmanager.session() as db:
+            user = await reps_users.get_user_by_email(email, db) #____5.12.A&A____repository/users
+        if user is None:
+            return None
+        return await self.cache_user(user, time.perf_counter() - started)
     #____________________________5.13____cloudinary______________________________________|
     def verify_password(self, plain_password, hashed_password):
         """
@@ -58,6 +143,43 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    async def _run_bcrypt(self, func, *args):
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            return started, func(*args), time.perf_counter() - started
+
+        with tracer.span("bcrypt", operation=func.__name__):
+            started, result, duration = await run_in_threadpool(job)
+        bcrypt_pool_wait_seconds.observe(started - submitted)
+        bcrypt_duration_seconds.observe(duration)
+        return result
+
+    async def verify_password_async(self, plain_password, hashed_password):
+        """
+        The verify_password_async function runs verify_password in the threadpool,
+            so the event loop keeps serving other requests while bcrypt works.
+        
+        :param self: Represent the instance of the class
+        :param plain_password: Pass in the password that is entered by the user
+        :param hashed_password: Check the password that is stored in the database
+        :return: True or false
+        :doc-author: Trelent
+        """
+        return await self._run_bcrypt(self.verify_password, plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str):
+        """
+        The get_password_hash_async function runs get_password_hash in the threadpool.
+        
+        :param self: Represent the instance of the class
+        :param password: str: Get the password from the user
+        :return: A hash of the password
+        :doc-author: Trelent
+        """
+        return await self._run_bcrypt(self.get_password_hash, password)
+
 
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
@@ -66,7 +188,7 @@ class Auth:
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
         The create_access_token function creates a new access token for the user.
-            
+            Every token gets its own id (jti), so it can be revoked before it expires.
         
         :param self: Represent the instance of the class
         :param data: dict: Pass the data that will be encoded in the token
@@ -78,8 +200,8 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
+            expire = datetime.utcnow() + timedelta(minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token", "jti": uuid.uuid4().hex})
         encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_access_token
     
@@ -101,7 +223,7 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(days=config.REFRESH_TOKEN_EXPIRE_DAYS)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
         encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
@@ -109,33 +231,74 @@ class Auth:
     async def decode_refresh_token(self, refresh_token: str):
         """
         The decode_refresh_token function takes a refresh token and decodes it.
-            If the scope is 'refresh_token', then we return the email address of the user.
+            If the scope is 'refresh_token' and the token names its family (fam) and id (jti), we return the payload.
             Otherwise, we raise an HTTPException with status code 401 (UNAUTHORIZED) and detail message 'Invalid scope for token'.
         
         
         :param self: Represent the instance of the class
         :param refresh_token: str: Pass the refresh token to the function
-        :return: The email of the user if the token is valid
+        :return: The token payload if the token is valid
         :doc-author: Trelent
         """
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                # tokens issued before the token store have no family and need a new login
+                if not payload.get('fam') or not payload.get('jti'):
+                    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid refresh token')
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    def session_id(self, token: str) -> Optional[str]:
+        """
+        The session_id function reads the session (token family) id from an access token
+            that get_current_user has already validated.
+        
+        :param self: Represent the instance of the class
+        :param token: str: The access token
+        :return: The session id, None for tokens issued before sessions existed
+        :doc-author: Trelent
+        """
+        return jwt.get_unverified_claims(token).get("sid")
+
+    def decode_token(self, token: str, request: Request | None = None) -> dict:
+        """
+        The decode_token function verifies the token and returns its claims.
+            The outcome is kept on request.state, so the rate limiter and get_current_user
+            verify the signature of a request's token once.
+
+        :param self: Represent the instance of a class
+        :param token: str: The JWT
+        :param request: Request | None: The request carrying the token, to reuse its outcome
+        :return: The token claims
+        :doc-author: Trelent
+        """
+        cached = getattr(request.state, "token_claims", None) if request is not None else None
+        if cached is None or cached[0] != token:
+            try:
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            except JWTError:
+                payload = None
+            cached = (token, payload)
+            if request is not None:
+                request.state.token_claims = cached
+        if cached[1] is None:
+            raise JWTError("Invalid token")
+        return cached[1]
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), request: Request = None):
         """
         The get_current_user function is a dependency that will be called by the FastAPI framework to retrieve the current user.
         It uses the token in the Authorization header of each request to validate and decode it, then returns an instance of User.
+        Concurrent misses for the same user share one database load, and entries close to expiry
+        are refreshed in the background by one request (XFetch), so an expiry never reaches Postgres as a burst.
         
         :param self: Represent the instance of a class
         :param token: str: Pass the token to the function
-        :param db: AsyncSession: Get a database session
+        :param request: Request: The request, whose token the rate limiter may have verified already
         :return: A user object
         :doc-author: Trelent
         """
@@ -147,7 +310,7 @@ class Auth:
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token, request)
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
@@ -156,21 +319,40 @@ class Auth:
                 raise credentials_exception
         except JWTError as e:
             raise credentials_exception
+        # answered from the in-memory filter unless the token or its session may have been revoked
+        if await revocation_list.is_revoked(payload.get("jti"), payload.get("sid")):
+            raise credentials_exception
         #________________5.13____кешування_______
-        user_hash = str(email)
+        user_hash = self.cache_key(email)
 
-        user = self.cache.get(user_hash)
+        try:
+            with tracer.span("redis.get"):
+                cached = await self.cache.get(user_hash)
+        except RedisError:
+            # Redis is down or its circuit is open: recent users from memory, the others from the database
+            loaded = self.local_users.get(user_hash)
+            auth_cache_requests_total.labels("local" if loaded is not None else "fallback").inc()
+            if loaded is None:
+                loaded = await self.user_loads.do(user_hash, lambda: self.load_user(email))
+                if loaded is None:
+                    raise credentials_exception
+            user, _, _ = pickle.loads(loaded)
+            return user
         
-        if user is None:
-            print("User from database")
-            user = await reps_users.get_user_by_email(email, db) #____5.12.A&A____repository/users
-            if user is None:
+        if cached is None:
+            auth_cache_requests_total.labels("coalesced" if user_hash in self.user_loads else "miss").inc()
+            loaded = await self.user_loads.do(user_hash, lambda: self.load_user(email))
+            if loaded is None:
                 raise credentials_exception
-            self.cache.set(user_hash, pickle.dumps(user))
-            self.cache.expire(user_hash, 300)
+            user, _, _ = pickle.loads(loaded)
         else:
-            print("User from cache")
-            user = pickle.loads(user)
+            user, delta, expiry = pickle.loads(cached)
+            self.local_users.set(user_hash, cached)
+            if refresh_early(delta, expiry, self.USER_CACHE_BETA) and user_hash not in self.user_loads:
+                auth_cache_requests_total.labels("early_refresh").inc()
+                self.user_loads.spawn(user_hash, lambda: self.load_user(email))
+            else:
+                auth_cache_requests_total.labels("hit").inc()
         return user
         #________________5.13____кешування_______|
 #__________________1.13.Email_______________________________________________________________________________________    
@@ -187,7 +369,7 @@ class Auth:
         :doc-author: Trelent
         """
         to_encode = data.copy()
-        expire = datetime.utcnow() + timedelta(days=1)
+        expire = datetime.utcnow() + timedelta(seconds=self.EMAIL_TOKEN_TTL)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire})
         token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return token
@@ -208,9 +390,41 @@ class Auth:
             email = payload["sub"]
             return email
         except JWTError as e:
-            print(e)
+            logger.info("Invalid email verification token", extra={"error": str(e)})
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
+
+    def _used_email_token_key(self, token: str) -> str:
+        return self.USED_EMAIL_TOKEN_PREFIX + hashlib.sha256(token.encode()).hexdigest()
+
+    async def email_token_used(self, token: str) -> bool:
+        """
+        The email_token_used function tells whether the email token was already used, from Redis only.
+            When Redis can't answer it returns False and the caller goes to the database.
+        
+        :param self: Represent the instance of the class
+        :param token: str: The token from the email link
+        :return: True if the token was used
+        :doc-author: Trelent
+        """
+        try:
+            return bool(await self.cache.exists(self._used_email_token_key(token)))
+        except RedisError:
+            return False
+
+    async def mark_email_token_used(self, token: str):
+        """
+        The mark_email_token_used function records that the email token was used, until the token expires.
+        
+        :param self: Represent the instance of the class
+        :param token: str: The token from the email link
+        :return: None
+        :doc-author: Trelent
+        """
+        try:
+            await self.cache.set(self._used_email_token_key(token), 1, ex=self.EMAIL_TOKEN_TTL)
+        except RedisError as err:
+            logger.warning("Used email token not recorded", extra={"error": str(err)})
 #__________________1.13.Email_______________________________________________________________________________________|
 
 auth_service = Auth()
\ No newline at end of file
@@ -0,0 +1,115 @@
+#__________________cache stampede protection_______________________________________________________________________________________
+import asyncio
+import math
+import random
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from src.services.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent loads of the same key within the worker: the first caller starts the load
+    as a task, later callers await the same task, so a cache miss costs one query however many
+    requests hit it at once. The task is shielded: a caller that goes away doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    def spawn(self, key: str, load: Callable[[], Awaitable]) -> asyncio.Task:
+        """
+        The spawn function starts load for the key unless a load of the key is already running.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :param load: Callable[[], Awaitable]: The coroutine function loading the value
+        :return: The running task
+        :doc-author: Trelent
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.create_task(load())
+            task.add_done_callback(lambda done: self._done(key, done))
+        return task
+
+    async def do(self, key: str, load: Callable[[], Awaitable]):
+        """
+        The do function returns the result of load for the key, sharing a load already in progress.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :param load: Callable[[], Awaitable]: The coroutine function loading the value
+        :return: The loaded value; an exception raised by load is raised to every caller
+        :doc-author: Trelent
+        """
+        return await asyncio.shield(self.spawn(key, load))
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            # retrieved here so refreshes nobody awaits don't end as "exception was never retrieved"
+            logger.warning("Cache load failed", extra={"key": key}, exc_info=task.exception())
+
+
+class LocalCache:
+    """
+    Small in-process TTL cache with LRU eviction, the worker's fallback while Redis is unavailable.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[object, float]] = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+def refresh_early(delta: float, expiry: float, beta: float = 1.0, now: float | None = None) -> bool:
+    """
+    The refresh_early function is the XFetch test (Vattani et al., "Optimal Probabilistic Cache Stampede
+        Prevention"): it says yes with a probability growing as the expiry approaches, earlier for values
+        that are slow to compute, so one request refreshes the value before it expires for everybody.
+
+    >>> refresh_early(delta=0.01, expiry=100.0, now=200.0)
+    True
+    >>> refresh_early(delta=0.0, expiry=100.0, now=99.0)
+    False
+
+    :param delta: float: How long loading the value took, in seconds
+    :param expiry: float: Unix time the cached value expires
+    :param beta: float: Above 1 favours earlier refreshes, below 1 later ones
+    :param now: float | None: The current time, time.time() by default
+    :return: True if the caller should refresh the value now
+    :doc-author: Trelent
+    """
+    now = time.time() if now is None else now
+    return now - delta * beta * math.log(1.0 - random.random()) >= expiry
+#__________________cache stampede protection_______________________________________________________________________________________|
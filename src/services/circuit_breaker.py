@@ -0,0 +1,104 @@
+#__________________circuit breaker_______________________________________________________________________________________
+import asyncio
+import time
+
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from src.services.logger import get_logger
+from src.services.metrics import Counter, Gauge
+
+
+logger = get_logger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+circuit_state = Gauge("circuit_state", "Circuit breaker state (0 closed, 1 open, 2 half open).", ("circuit",))
+circuit_failures_total = Counter("circuit_failures_total", "Calls failed with an outage error.", ("circuit",))
+circuit_rejected_total = Counter("circuit_rejected_total", "Calls refused at once while the circuit is open.",
+                                 ("circuit",))
+
+
+class CircuitOpenError(RedisConnectionError):
+    """
+    Raised instead of calling the dependency while the circuit is open. It is a Redis ConnectionError,
+    so the code already falling back on Redis errors falls back without waiting for a timeout.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency: after failure_threshold consecutive outage errors
+    (connection errors and timeouts, not command errors) the circuit opens and calls fail at once.
+    After reset_timeout seconds one call is let through (half open): if it succeeds the circuit
+    closes, otherwise it opens again for another reset_timeout.
+    """
+
+    OUTAGE_ERRORS = (RedisConnectionError, RedisTimeoutError, asyncio.TimeoutError, OSError)
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 5.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        circuit_state.labels(name).set(STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            log = logger.warning if state == OPEN else logger.info
+            log("Circuit state changed", extra={"circuit": self.name, "from": self.state, "to": state})
+            self.state = state
+            circuit_state.labels(self.name).set(STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """
+        The allow function tells whether a call may go to the dependency now.
+            In the half open state only one probe call is allowed at a time.
+
+        :param self: Represent the instance of the class
+        :return: True if the call may proceed
+        :doc-author: Trelent
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        circuit_failures_total.labels(self.name).inc()
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    async def __aenter__(self):
+        if not self.allow():
+            circuit_rejected_total.labels(self.name).inc()
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, self.OUTAGE_ERRORS):
+            self.record_failure()
+        elif issubclass(exc_type, asyncio.CancelledError):
+            self._probing = False
+        else:
+            # a command error: the dependency answered, so it is up
+            self.record_success()
+        return False
+#__________________circuit breaker_______________________________________________________________________________________|
@@ -1,11 +1,17 @@
+from functools import cache
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from fastapi import BackgroundTasks
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
 from src.conf.config import config
+from src.services.metrics import mail_queue_depth
+from src.services.logger import get_logger
+from src.services.tracing import tracer
+
+
+logger = get_logger(__name__)
 
 #__________________1.13.Email_______________________________________________________________________________________
 # conf = ConnectionConfig(
@@ -23,19 +29,32 @@ from src.conf.config import config
 # )
 
     #__________________2.13.Env_______________________________________________________________________________________
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.MAIL_USERNAME,
-    MAIL_PASSWORD=config.MAIL_PASSWORD,
-    MAIL_FROM=config.MAIL_USERNAME,
-    MAIL_PORT=config.MAIL_PORT,
-    MAIL_SERVER=config.MAIL_SERVER,
-    MAIL_FROM_NAME="Contact Systems",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+@cache
+def get_mailer():
+    """
+    The get_mailer function builds the mail client on the first email sent and reuses it afterwards.
+        fastapi_mail (with jinja2 and the email validators) is only imported then,
+        which keeps it out of the worker's cold start.
+    
+    :return: The FastMail client
+    :doc-author: Trelent
+    """
+    from fastapi_mail import FastMail, ConnectionConfig
+
+    conf = ConnectionConfig(
+        MAIL_USERNAME=config.MAIL_USERNAME,
+        MAIL_PASSWORD=config.MAIL_PASSWORD,
+        MAIL_FROM=config.MAIL_USERNAME,
+        MAIL_PORT=config.MAIL_PORT,
+        MAIL_SERVER=config.MAIL_SERVER,
+        MAIL_FROM_NAME="Contact Systems",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    )
+    return FastMail(conf)
     #__________________2.13.Env_______________________________________________________________________________________|
 
 async def send_email(email: EmailStr, username: str, host: str):
@@ -52,6 +71,9 @@ async def send_email(email: EmailStr, username: str, host: str):
     :return: None
     :doc-author: Trelent
     """
+    from fastapi_mail import MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
         token_verification = auth_service.create_email_token({"sub": email})
         message = MessageSchema(
@@ -61,10 +83,9 @@ async def send_email(email: EmailStr, username: str, host: str):
             subtype=MessageType.html
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="verify_email.html")
+        await get_mailer().send_message(message, template_name="verify_email.html")
     except ConnectionErrors as err:
-        print(err)
+        logger.error("Verification email not sent", exc_info=err)
         
         
 async def send_email_reset_password(email: EmailStr, username: str, host: str): 
@@ -81,6 +102,9 @@ async def send_email_reset_password(email: EmailStr, username: str, host: str):
     :return: Nothing
     :doc-author: Trelent
     """
+    from fastapi_mail import MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
     try: 
         token_verification = auth_service.create_email_token({"sub": email}) 
         message = MessageSchema( 
@@ -90,8 +114,29 @@ async def send_email_reset_password(email: EmailStr, username: str, host: str):
             subtype=MessageType.html 
         ) 
  
-        fm = FastMail(conf) 
-        await fm.send_message(message, template_name="reset_password.html") 
+        await get_mailer().send_message(message, template_name="reset_password.html") 
     except ConnectionErrors as err: 
-        print(err)
-        
+        logger.error("Password reset email not sent", exc_info=err)
+
+
+def enqueue_email(background_tasks: BackgroundTasks, send, *args):
+    """
+    The enqueue_email function schedules one of the send functions above as a background task
+        and keeps the mail_queue_depth gauge up to date until it has run.
+    
+    :param background_tasks: BackgroundTasks: The background tasks of the request
+    :param send: The send function, send_email or send_email_reset_password
+    :param args: The arguments of the send function
+    :return: None
+    :doc-author: Trelent
+    """
+    mail_queue_depth.inc()
+    background_tasks.add_task(_send_queued, send, *args)
+
+
+async def _send_queued(send, *args):
+    try:
+        with tracer.span("mail.send", template=send.__name__):
+            await send(*args)
+    finally:
+        mail_queue_depth.dec()
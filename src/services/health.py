@@ -0,0 +1,144 @@
+#__________________health checks_______________________________________________________________________________________
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.database.redis import redis_manager
+from src.services.logger import get_logger
+from src.services.metrics import Gauge
+
+
+logger = get_logger(__name__)
+
+dependency_up = Gauge("dependency_up", "Result of the last health check of a dependency (1 up, 0 down).",
+                      ("dependency",))
+
+
+class HealthChecker:
+    """
+    Probes the dependencies in the background every interval seconds and keeps the last result,
+    so readiness probes are answered from memory and never add load to Postgres or Redis.
+    The app is ready while every critical check passes; failing non-critical ones (the mail
+    backend) only mark it degraded, as emails are sent in the background and block no request.
+    """
+
+    def __init__(self, interval: float, timeout: float):
+        self.interval = interval
+        self.timeout = timeout
+        self._checks: dict[str, tuple[Callable[[], Awaitable[dict | None]], bool]] = {}
+        self.status: dict = {"status": "starting", "ready": False, "checks": {}, "checked_at": None}
+        self._task: asyncio.Task | None = None
+
+    def add_check(self, name: str, probe: Callable[[], Awaitable[dict | None]], critical: bool = True):
+        """
+        The add_check function registers a probe. A probe fails by raising or timing out;
+            it may return a dict of details shown in the readiness response.
+
+        :param self: Represent the instance of the class
+        :param name: str: The dependency name
+        :param probe: The coroutine function doing the check
+        :param critical: bool: Whether a failure makes the app not ready
+        :return: None
+        :doc-author: Trelent
+        """
+        self._checks[name] = (probe, critical)
+
+    @property
+    def ready(self) -> bool:
+        return self.status["ready"]
+
+    async def _run_check(self, name: str, probe) -> dict:
+        started = time.perf_counter()
+        try:
+            details = await asyncio.wait_for(probe(), self.timeout)
+            result = {"ok": True}
+            if details:
+                result.update(details)
+        except Exception as err:
+            result = {"ok": False, "error": str(err) or type(err).__name__}
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        dependency_up.labels(name).set(1 if result["ok"] else 0)
+        return result
+
+    async def check(self) -> dict:
+        """
+        The check function runs all probes concurrently and stores the result as the current status.
+
+        :param self: Represent the instance of the class
+        :return: The new status
+        :doc-author: Trelent
+        """
+        names = list(self._checks)
+        results = await asyncio.gather(*(self._run_check(name, self._checks[name][0]) for name in names))
+        checks = dict(zip(names, results))
+        ready = all(checks[name]["ok"] for name in names if self._checks[name][1])
+        degraded = not all(result["ok"] for result in results)
+        if ready != self.status["ready"] and self.status["checked_at"] is not None:
+            logger.warning("Readiness changed", extra={"ready": ready, "checks": checks})
+        self.status = {
+            "status": ("degraded" if degraded else "ok") if ready else "fail",
+            "ready": ready,
+            "checks": checks,
+            "checked_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        return self.status
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def start(self):
+        # the first check runs before the app starts serving, so readiness is known from the first probe
+        await self.check()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.status = dict(self.status, status="stopping", ready=False)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def check_postgres() -> None:
+    async with sessionmanager.engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def check_postgres_pool() -> dict:
+    checked_out, capacity = sessionmanager.pool_usage()
+    saturation = checked_out / capacity if capacity else 0.0
+    if saturation >= config.HEALTH_MAX_POOL_SATURATION:
+        raise RuntimeError(f"pool saturated: {checked_out}/{capacity} connections in use")
+    return {"in_use": checked_out, "capacity": capacity}
+
+
+async def check_redis() -> None:
+    await redis_manager.client.ping()
+
+
+async def check_smtp() -> None:
+    # a TCP connect is enough to know the server is reachable; no SMTP session is opened
+    _, writer = await asyncio.open_connection(config.MAIL_SERVER, config.MAIL_PORT)
+    writer.close()
+    await writer.wait_closed()
+
+
+health_checker = HealthChecker(config.HEALTH_CHECK_INTERVAL_SECONDS, config.HEALTH_CHECK_TIMEOUT_SECONDS)
+# the pool is read first, before the postgres probe borrows a connection from it
+health_checker.add_check("postgres_pool", check_postgres_pool)
+health_checker.add_check("postgres", check_postgres)
+# with Redis down the app keeps serving (auth falls back to the database, rate limits to the worker)
+health_checker.add_check("redis", check_redis, critical=False)
+if config.HEALTH_CHECK_SMTP:
+    health_checker.add_check("smtp", check_smtp, critical=False)
+#__________________health checks_______________________________________________________________________________________|
@@ -0,0 +1,87 @@
+#__________________logging_______________________________________________________________________________________
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+# set by src.services.tracing so records can be joined with spans
+trace_ids_var: ContextVar[tuple[str, str] | None] = ContextVar("trace_ids", default=None)
+
+_RECORD_FIELDS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, with the request and trace ids of the
+    request that produced them and any extra={...} fields passed to the logger.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Captures the request and trace ids while still on the request's context,
+    then hands the record to the listener thread, so the event loop never waits on I/O.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = request_id_var.get()
+        trace_ids = trace_ids_var.get()
+        if trace_ids is not None:
+            record.trace_id, record.span_id = trace_ids
+        return record
+
+
+def setup_logging(level: str = "INFO", path: str | None = None) -> logging.handlers.QueueListener:
+    """
+    The setup_logging function routes the "app" loggers through a queue to a thread writing JSON lines
+        to stdout or to the given file.
+
+    :param level: str: The minimal level of the app loggers
+    :param path: str | None: Write to this file instead of stdout
+    :return: The started queue listener, stop it on shutdown to flush the queue
+    :doc-author: Trelent
+    """
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+
+    app_logger = logging.getLogger("app")
+    app_logger.handlers.clear()
+    app_logger.addHandler(ContextQueueHandler(log_queue))
+    app_logger.setLevel(level)
+    app_logger.propagate = False
+    listener.start()
+    return listener
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"app.{name}")
+#__________________logging_______________________________________________________________________________________|
@@ -0,0 +1,229 @@
+#__________________metrics_______________________________________________________________________________________
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label_value(value) -> str:
+    r"""
+    The _escape_label_value function escapes a label value as the Prometheus text format requires,
+        so a value holding a quote, a backslash or a newline (a path, an error message) can't break the line.
+
+    >>> print(_escape_label_value('C:\\tmp "a"\nb'))
+    C:\\tmp \"a\"\nb
+
+    :param value: The label value
+    :return: The value with backslash, double quote and newline escaped
+    :doc-author: Trelent
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum!r}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._children[()].inc(amount)
+
+    @property
+    def value(self) -> float:
+        return self._children[()].value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1):
+        self._children[()].dec(amount)
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+
+class Registry:
+    """
+    Minimal in-process metric registry rendered in the Prometheus text exposition format.
+    Metrics are only updated from the event loop thread, so no locking is needed on the hot path.
+    """
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route and status.",
+                              ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency by route.",
+                                          ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served.")
+db_query_duration_seconds = Histogram("db_query_duration_seconds", "Duration of single SQL statements.",
+                                      buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+db_queries_per_request = Histogram("db_queries_per_request", "SQL statements executed per HTTP request.",
+                                   ("route",), buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+db_time_per_request_seconds = Histogram("db_time_per_request_seconds", "Time spent in SQL per HTTP request.",
+                                        ("route",))
+auth_cache_requests_total = Counter("auth_cache_requests_total", "Auth user cache lookups by result.", ("result",))
+mail_queue_depth = Gauge("mail_queue_depth", "Emails queued as background tasks and not sent yet.")
+bcrypt_pool_wait_seconds = Histogram("bcrypt_pool_wait_seconds", "Time bcrypt jobs wait for a worker thread.")
+bcrypt_duration_seconds = Histogram("bcrypt_duration_seconds", "Time spent hashing or verifying with bcrypt.")
+db_pool_wait_seconds = Histogram("db_pool_wait_seconds", "Time spent waiting for a connection from the pool.",
+                                 buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0))
+admission_limit = Gauge("admission_limit", "Adaptive concurrency limit by route group.", ("group",))
+admission_in_flight = Gauge("admission_in_flight", "Admitted requests being served by route group.", ("group",))
+admission_rejected_total = Counter("admission_rejected_total", "Requests shed with 503 by route group.", ("group",))
+
+# [statement count, seconds] of the request being served, None outside requests
+request_db_stats: ContextVar[list | None] = ContextVar("request_db_stats", default=None)
+# [seconds waited for pool connections] of the request being served, set by the admission middleware
+request_pool_wait: ContextVar[list | None] = ContextVar("request_pool_wait", default=None)
+
+
+def observe_pool_wait(elapsed: float):
+    db_pool_wait_seconds.observe(elapsed)
+    waited = request_pool_wait.get()
+    if waited is not None:
+        waited[0] += elapsed
+
+
+def instrument_engine(engine):
+    """
+    The instrument_engine function attaches cursor events to the engine recording the duration
+        of every statement and the per-request statement count and time.
+
+    :param engine: AsyncEngine: The engine to instrument
+    :return: None
+    :doc-author: Trelent
+    """
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_query_duration_seconds.observe(elapsed)
+        stats = request_db_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+#__________________metrics_______________________________________________________________________________________|
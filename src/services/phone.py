@@ -0,0 +1,54 @@
+#__________________phone normalization_______________________________________________________________________________________
+import re
+
+from src.conf.config import config
+
+
+TRUNK_PREFIX = "0"
+INTERNATIONAL_PREFIX = "00"
+# E.164 allows up to 15 digits with the country code; shorter than 8 is no subscriber number anywhere
+MIN_DIGITS, MAX_DIGITS = 8, 15
+NOT_DIGITS = re.compile(r"\D")
+
+
+def to_e164(number: str | None, country_code: str | None = None) -> str | None:
+    """
+    The to_e164 function brings a phone number written any of the usual ways to E.164 (+ and digits only),
+        so the same number is stored and looked up as one value whatever way it was typed.
+        Numbers without a country code are taken as numbers of country_code: the national trunk
+        prefix 0 is replaced by it, and digits already starting with it only get the +.
+
+    >>> to_e164("+380 63 123 45 67")
+    '+380631234567'
+    >>> to_e164("(063)1234567")
+    '+380631234567'
+    >>> to_e164("380631234567")
+    '+380631234567'
+    >>> to_e164("00 44 20 7946 0958")
+    '+442079460958'
+    >>> to_e164("0201234567", country_code="49")
+    '+49201234567'
+    >>> to_e164("12-34") is None
+    True
+
+    :param number: str | None: The phone number as entered
+    :param country_code: str | None: Country code of numbers written without one, PHONE_DEFAULT_COUNTRY_CODE by default
+    :return: The number in E.164 form, or None if it can't be a phone number
+    :doc-author: Trelent
+    """
+    if not number:
+        return None
+    country_code = country_code or config.PHONE_DEFAULT_COUNTRY_CODE
+    international = number.lstrip().startswith("+")
+    digits = NOT_DIGITS.sub("", number)
+    if not international:
+        if digits.startswith(INTERNATIONAL_PREFIX):
+            digits = digits[len(INTERNATIONAL_PREFIX):]
+        elif digits.startswith(TRUNK_PREFIX):
+            digits = country_code + digits[len(TRUNK_PREFIX):]
+        elif not digits.startswith(country_code):
+            digits = country_code + digits
+    if not MIN_DIGITS <= len(digits) <= MAX_DIGITS or digits.startswith("0"):
+        return None
+    return "+" + digits
+#__________________phone normalization_______________________________________________________________________________________|
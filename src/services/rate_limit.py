@@ -0,0 +1,203 @@
+#____________________________3.13____limiter___________________________________________________________________________________
+import math
+import time
+import uuid
+from collections import deque
+
+from fastapi import HTTPException, Request, Response, status
+from jose import JWTError
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.auth import auth_service
+from src.services.circuit_breaker import CircuitOpenError
+from src.services.logger import get_logger
+from src.services.tracing import tracer
+
+
+logger = get_logger(__name__)
+
+
+SLIDING_WINDOW = "sliding_window"
+TOKEN_BUCKET = "token_bucket"
+
+# Both scripts take the clock from Redis, so every worker sees the same time,
+# and return {allowed, remaining, milliseconds until reset/retry}.
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, window}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+TOKEN_BUCKET_LUA = """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2]) / tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = math.ceil((1 - tokens) / rate)
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+    wait = math.ceil((capacity - tokens) / rate)
+end
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, math.ceil(capacity / rate))
+return {allowed, math.floor(tokens), wait}
+"""
+
+
+class LocalLimiter:
+    """
+    Per-process fallback with the same algorithms as the Lua scripts, used while Redis is unavailable.
+    Limits are then enforced per worker instead of globally, which is better than no limits at all.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._windows: dict[str, deque] = {}
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def sliding_window(self, key: str, limit: int, window_ms: int, now_ms: float | None = None):
+        now_ms = time.monotonic() * 1000 if now_ms is None else now_ms
+        hits = self._windows.get(key)
+        if hits is None:
+            if len(self._windows) >= self.max_keys:
+                self._windows.clear()
+            hits = self._windows[key] = deque()
+        while hits and hits[0] <= now_ms - window_ms:
+            hits.popleft()
+        if len(hits) < limit:
+            hits.append(now_ms)
+            return 1, limit - len(hits), window_ms
+        return 0, 0, math.ceil(hits[0] + window_ms - now_ms)
+
+    def token_bucket(self, key: str, capacity: int, window_ms: int, now_ms: float | None = None):
+        now_ms = time.monotonic() * 1000 if now_ms is None else now_ms
+        rate = capacity / window_ms
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+        tokens, ts = self._buckets.get(key, (capacity, now_ms))
+        tokens = min(capacity, tokens + max(0, now_ms - ts) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            self._buckets[key] = (tokens, now_ms)
+            return 1, math.floor(tokens), math.ceil((capacity - tokens) / rate)
+        self._buckets[key] = (tokens, now_ms)
+        return 0, 0, math.ceil((1 - tokens) / rate)
+
+
+class RateLimitService:
+    def __init__(self):
+        self.redis = None
+        self.local = LocalLimiter()
+        self._scripts = {}
+
+    def init(self, redis):
+        """
+        The init function binds the service to a Redis client and registers the Lua scripts.
+            Until it is called, and whenever Redis fails, the in-memory limiter is used.
+
+        :param self: Represent the instance of the class
+        :param redis: redis.asyncio.Redis: The shared Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+        self.redis = redis
+        self._scripts = {
+            SLIDING_WINDOW: redis.register_script(SLIDING_WINDOW_LUA),
+            TOKEN_BUCKET: redis.register_script(TOKEN_BUCKET_LUA),
+        }
+
+    async def hit(self, key: str, times: int, window_ms: int, algorithm: str):
+        """
+        The hit function counts one request against the key and tells whether it is allowed.
+
+        :param self: Represent the instance of the class
+        :param key: str: The rate limit key (group and identity)
+        :param times: int: How many requests are allowed per window
+        :param window_ms: int: The window length in milliseconds
+        :param algorithm: str: sliding_window or token_bucket
+        :return: A tuple of allowed (0 or 1), remaining requests and milliseconds until reset
+        :doc-author: Trelent
+        """
+        if self.redis is not None:
+            try:
+                if algorithm == SLIDING_WINDOW:
+                    args = [times, window_ms, uuid.uuid4().hex]
+                else:
+                    args = [times, times, window_ms]
+                with tracer.span("redis.evalsha", script=algorithm):
+                    allowed, remaining, reset_ms = await self._scripts[algorithm](keys=[key], args=args)
+                return int(allowed), int(remaining), int(reset_ms)
+            except RedisError as err:
+                if not isinstance(err, CircuitOpenError):  # an open circuit was already logged once
+                    logger.warning("Rate limiter falls back to local limits", exc_info=err)
+        if algorithm == SLIDING_WINDOW:
+            return self.local.sliding_window(key, times, window_ms)
+        return self.local.token_bucket(key, times, window_ms)
+
+
+rate_limit_service = RateLimitService()
+
+
+class RateLimiter:
+    """
+    Route dependency limiting requests per route group, keyed by user (the token subject) or by client IP.
+    Sets the RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset headers and answers 429 with Retry-After.
+    """
+
+    def __init__(self, times: int, seconds: int, group: str, by: str = "user", algorithm: str = SLIDING_WINDOW):
+        if algorithm not in (SLIDING_WINDOW, TOKEN_BUCKET):
+            raise ValueError(f"unknown rate limit algorithm {algorithm}")
+        self.times = times
+        self.window_ms = seconds * 1000
+        self.group = group
+        self.by = by
+        self.algorithm = algorithm
+
+    def identity(self, request: Request) -> str:
+        if self.by == "user":
+            scheme, _, token = request.headers.get("authorization", "").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    # verified once per request: get_current_user reuses the claims
+                    payload = auth_service.decode_token(token, request)
+                    if payload.get("sub"):
+                        return f"user:{payload['sub']}"
+                except JWTError:
+                    pass
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    async def __call__(self, request: Request, response: Response):
+        if not config.RATE_LIMIT_ENABLED:
+            return
+        key = f"rl:{self.group}:{self.identity(request)}"
+        allowed, remaining, reset_ms = await rate_limit_service.hit(key, self.times, self.window_ms, self.algorithm)
+        headers = {
+            "RateLimit-Limit": str(self.times),
+            "RateLimit-Remaining": str(remaining),
+            "RateLimit-Reset": str(math.ceil(reset_ms / 1000)),
+        }
+        if not allowed:
+            headers["Retry-After"] = headers["RateLimit-Reset"]
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers=headers)
+        response.headers.update(headers)
+#____________________________3.13____limiter___________________________________________________________________________________|
@@ -0,0 +1,166 @@
+#__________________token revocation_______________________________________________________________________________________
+import asyncio
+import hashlib
+import math
+import time
+
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.database.redis import redis_manager
+from src.services.logger import get_logger
+from src.services.metrics import Counter, Gauge
+
+
+logger = get_logger(__name__)
+
+revocation_checks_total = Counter("revocation_checks_total", "Access token revocation checks by result.", ("result",))
+revocation_list_size = Gauge("revocation_list_size", "Revoked ids loaded into the worker's Bloom filter.")
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership with no false negatives: a lookup hashes the key once and tests
+    k bits, whatever the number of entries. Sized for capacity entries at the given false positive rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # double hashing: k positions from the two halves of one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    Revoked access token ids (jti) and session ids (sid), kept in a Redis sorted set scored by
+    the time the revocation can be forgotten: the expiry of the last access token it applies to.
+    Every worker mirrors the set in a Bloom filter reloaded every sync interval, so the common
+    case of a token that was never revoked is answered from memory; only Bloom hits, revoked
+    tokens and rare false positives, are confirmed in Redis.
+    """
+
+    def __init__(self, key: str, capacity: int, error_rate: float, interval: float, redis=None):
+        self.key = key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.interval = interval
+        self._redis = redis
+        self.bloom = BloomFilter(capacity, error_rate)
+        self._revoked_during_sync: list[str] | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else redis_manager.client
+
+    async def revoke(self, token_id: str, expires_at: float):
+        """
+        The revoke function adds an id to the revocation list until expires_at.
+            The local filter is updated at once; other workers see it after their next sync.
+
+        :param self: Represent the instance of the class
+        :param token_id: str: The jti of an access token or the sid of a session
+        :param expires_at: float: Unix time after which no token with this id is valid anyway
+        :return: None
+        :doc-author: Trelent
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.key, {token_id: expires_at})
+            pipe.zremrangebyscore(self.key, "-inf", time.time())
+            await pipe.execute()
+        self.bloom.add(token_id)
+        if self._revoked_during_sync is not None:
+            self._revoked_during_sync.append(token_id)
+
+    async def is_revoked(self, *token_ids: str | None) -> bool:
+        """
+        The is_revoked function tells whether any of the ids (the token's jti and sid) was revoked.
+
+        :param self: Represent the instance of the class
+        :param token_ids: str | None: The ids to check, None values are ignored
+        :return: True if one of them is revoked
+        :doc-author: Trelent
+        """
+        candidates = [token_id for token_id in token_ids if token_id and token_id in self.bloom]
+        if not candidates:
+            revocation_checks_total.labels("clean").inc()
+            return False
+        try:
+            scores = await self.redis.zmscore(self.key, candidates)
+        except RedisError as err:
+            # can't tell a false positive from a revoked token: refuse it, the client can log in again
+            logger.warning("Revocation check failed, token refused", exc_info=err)
+            revocation_checks_total.labels("error").inc()
+            return True
+        now = time.time()
+        revoked = any(score is not None and score > now for score in scores)
+        revocation_checks_total.labels("revoked" if revoked else "false_positive").inc()
+        return revoked
+
+    async def sync(self):
+        """
+        The sync function rebuilds the Bloom filter from the ids in Redis that are still in force,
+            sized for twice their number so the false positive rate holds as the list grows.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        now = time.time()
+        # ids this worker revokes while the set is being read must not be lost by the swap
+        revoked_during_sync = self._revoked_during_sync = []
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zremrangebyscore(self.key, "-inf", now)
+                pipe.zrangebyscore(self.key, now, "+inf")
+                _, members = await pipe.execute()
+        except RedisError as err:
+            logger.warning("Revocation list reload failed", exc_info=err)
+            return
+        finally:
+            self._revoked_during_sync = None
+        bloom = BloomFilter(max(self.capacity, 2 * len(members)), self.error_rate)
+        for member in members:
+            bloom.add(member.decode())
+        for token_id in revoked_during_sync:
+            bloom.add(token_id)
+        self.bloom = bloom
+        revocation_list_size.set(len(members))
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sync()
+
+    async def start(self):
+        await self.sync()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+revocation_list = RevocationList(config.REVOCATION_REDIS_KEY, config.REVOCATION_BLOOM_CAPACITY,
+                                 config.REVOCATION_BLOOM_ERROR_RATE, config.REVOCATION_SYNC_SECONDS)
+#__________________token revocation_______________________________________________________________________________________|
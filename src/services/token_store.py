@@ -0,0 +1,158 @@
+#__________________refresh tokens_______________________________________________________________________________________
+import time
+import uuid
+
+from src.conf.config import config
+from src.database.redis import redis_manager
+from src.services.tracing import tracer
+
+
+# A login starts a token family (one per device session): rt:fam:{family} is a hash with the user,
+# the jti of the only refresh token of the family still valid, the device and timestamps;
+# rt:user:{email} is the set of the user's families. Both expire with the refresh token lifetime,
+# which every rotation extends, so idle sessions disappear without any cleanup job.
+FAMILY_KEY = "rt:fam:{}"
+USER_KEY = "rt:user:{}"
+
+ROTATED, UNKNOWN, REUSED = 1, 0, -1
+
+# Swaps the current jti for a new one if the presented jti is the current one. A token
+# presented again after rotation was stolen or replayed: the whole family is revoked.
+ROTATE_LUA = """
+local current = redis.call('HGET', KEYS[1], 'jti')
+if not current then
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[5])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2], 'last_used', ARGV[3])
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+redis.call('PEXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class RefreshTokenStore:
+    """
+    Redis store of the refresh token families: logins, refreshes and logouts are a single Redis
+    round trip each and never write to Postgres. Rotation and reuse detection run in one Lua
+    script, so two workers refreshing the same token at once can't both succeed.
+    """
+
+    def __init__(self, ttl_seconds: int, redis=None):
+        self.ttl_ms = ttl_seconds * 1000
+        self._redis = redis
+        self._rotate = None
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else redis_manager.client
+
+    async def create(self, email: str, device: str | None = None, ip: str | None = None) -> tuple[str, str]:
+        """
+        The create function starts a new session (token family) for the user.
+
+        :param self: Represent the instance of the class
+        :param email: str: The user the session belongs to
+        :param device: str | None: The User-Agent of the client
+        :param ip: str | None: The client address
+        :return: The family id and the jti of its first refresh token
+        :doc-author: Trelent
+        """
+        family, jti = uuid.uuid4().hex, uuid.uuid4().hex
+        now = int(time.time())
+        fields = {"user": email, "jti": jti, "device": (device or "")[:255], "ip": ip or "",
+                  "created": now, "last_used": now}
+        with tracer.span("redis.pipeline", operation="session.create"):
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(FAMILY_KEY.format(family), mapping=fields)
+                pipe.pexpire(FAMILY_KEY.format(family), self.ttl_ms)
+                pipe.sadd(USER_KEY.format(email), family)
+                pipe.pexpire(USER_KEY.format(email), self.ttl_ms)
+                await pipe.execute()
+        return family, jti
+
+    async def rotate(self, email: str, family: str, jti: str) -> tuple[int, str]:
+        """
+        The rotate function replaces the refresh token of a family with a new one.
+
+        :param self: Represent the instance of the class
+        :param email: str: The token subject
+        :param family: str: The family id from the token
+        :param jti: str: The jti from the token
+        :return: ROTATED, UNKNOWN (expired or revoked family) or REUSED, and the new jti
+        :doc-author: Trelent
+        """
+        if self._rotate is None:
+            self._rotate = self.redis.register_script(ROTATE_LUA)
+        new_jti = uuid.uuid4().hex
+        with tracer.span("redis.evalsha", script="session.rotate"):
+            result = await self._rotate(keys=[FAMILY_KEY.format(family), USER_KEY.format(email)],
+                                        args=[jti, new_jti, int(time.time()), self.ttl_ms, family])
+        return int(result), new_jti
+
+    async def sessions(self, email: str) -> list[dict]:
+        """
+        The sessions function lists the user's active sessions, dropping the expired ones from the user's set.
+
+        :param self: Represent the instance of the class
+        :param email: str: The user
+        :return: A list of dicts with id, device, ip, created and last_used, most recently used first
+        :doc-author: Trelent
+        """
+        families = [family.decode() for family in await self.redis.smembers(USER_KEY.format(email))]
+        if not families:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for family in families:
+                pipe.hgetall(FAMILY_KEY.format(family))
+            states = await pipe.execute()
+        sessions, expired = [], []
+        for family, state in zip(families, states):
+            if not state:
+                expired.append(family)
+                continue
+            state = {key.decode(): value.decode() for key, value in state.items()}
+            sessions.append({"id": family, "device": state["device"] or None, "ip": state["ip"] or None,
+                             "created": int(state["created"]), "last_used": int(state["last_used"])})
+        if expired:
+            await self.redis.srem(USER_KEY.format(email), *expired)
+        return sorted(sessions, key=lambda session: session["last_used"], reverse=True)
+
+    async def revoke(self, email: str, family: str) -> bool:
+        """
+        The revoke function ends one session of the user; its refresh token stops working at once.
+
+        :param self: Represent the instance of the class
+        :param email: str: The user
+        :param family: str: The session (family) id
+        :return: True if the session existed
+        :doc-author: Trelent
+        """
+        if not await self.redis.srem(USER_KEY.format(email), family):
+            return False
+        return bool(await self.redis.delete(FAMILY_KEY.format(family)))
+
+    async def revoke_all(self, email: str) -> list[str]:
+        """
+        The revoke_all function ends every session of the user.
+
+        :param self: Represent the instance of the class
+        :param email: str: The user
+        :return: The ids of the revoked sessions
+        :doc-author: Trelent
+        """
+        families = [family.decode() for family in await self.redis.smembers(USER_KEY.format(email))]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for family in families:
+                pipe.delete(FAMILY_KEY.format(family))
+            pipe.delete(USER_KEY.format(email))
+            *deleted, _ = await pipe.execute()
+        return [family for family, existed in zip(families, deleted) if existed]
+
+
+token_store = RefreshTokenStore(config.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600)
+#__________________refresh tokens_______________________________________________________________________________________|
@@ -0,0 +1,183 @@
+#__________________tracing_______________________________________________________________________________________
+import json
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from src.services.logger import get_logger, trace_ids_var
+
+
+current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attributes", "status")
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self.duration = 0.0
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class LogSpanExporter:
+    """
+    Sends finished spans to the app log stream, where a log collector can pick them up.
+    """
+
+    def __init__(self):
+        self.logger = get_logger("spans")
+
+    def export(self, span: Span):
+        self.logger.info(span.name, extra={"span": span.to_dict()})
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter:
+    """
+    Writes finished spans as JSON lines from a background thread; export only puts them on a queue.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        self._queue.put(span.to_dict())
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as file:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                file.write(json.dumps(item, default=str) + "\n")
+                if self._queue.empty():
+                    file.flush()
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class Tracer:
+    def __init__(self):
+        self.exporter = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(self, exporter):
+        self.exporter = exporter
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+            self.exporter = None
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """
+        The start_span function starts a child of the current span without making it current,
+            for callers that can't use a with block, like the SQLAlchemy cursor events.
+
+        :param self: Represent the instance of the class
+        :param name: str: The span name, e.g. "db.query"
+        :param attributes: Attributes stored with the span
+        :return: The started span, finish it with end_span
+        :doc-author: Trelent
+        """
+        return Span(name, current_span.get(), attributes)
+
+    def end_span(self, span: Span):
+        span.duration = time.time() - span.start
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        The span function is a context manager timing the block as a span, child of the current one.
+            Log records written inside the block carry its trace and span ids.
+
+        :param self: Represent the instance of the class
+        :param name: str: The span name, e.g. "redis.get"
+        :param attributes: Attributes stored with the span
+        :return: The span, so attributes can be added inside the block
+        :doc-author: Trelent
+        """
+        span = self.start_span(name, **attributes)
+        token = current_span.set(span)
+        ids_token = trace_ids_var.set((span.trace_id, span.span_id))
+        try:
+            yield span
+        except BaseException as err:
+            span.status = "error"
+            span.attributes["error"] = repr(err)
+            raise
+        finally:
+            trace_ids_var.reset(ids_token)
+            current_span.reset(token)
+            self.end_span(span)
+
+
+tracer = Tracer()
+
+
+def trace_engine(engine):
+    """
+    The trace_engine function wraps every SQL statement executed by the engine in a "db.query" span.
+
+    :param engine: AsyncEngine: The engine to trace
+    :return: None
+    :doc-author: Trelent
+    """
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if tracer.enabled:
+            conn.info.setdefault("spans", []).append(tracer.start_span("db.query", statement=statement[:200]))
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("spans"):
+            span = conn.info["spans"].pop()
+            span.set_attribute("rows", cursor.rowcount)
+            tracer.end_span(span)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("spans"):
+            span = connection.info["spans"].pop()
+            span.status = "error"
+            span.set_attribute("error", repr(exception_context.original_exception))
+            tracer.end_span(span)
+#__________________tracing_______________________________________________________________________________________|
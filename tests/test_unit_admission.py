@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+
+from src.middleware.admission import AdmissionMiddleware, AdaptiveLimiter, route_group
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_rejects_above_limit(self):
+        limiter = AdaptiveLimiter(initial=5, min_limit=5)
+        self.assertTrue(all(limiter.try_acquire() for _ in range(5)))
+        self.assertFalse(limiter.try_acquire())
+
+    def test_share_lowers_effective_limit(self):
+        limiter = AdaptiveLimiter(initial=20, min_limit=2)
+        self.assertTrue(all(limiter.try_acquire(share=0.5) for _ in range(10)))
+        self.assertFalse(limiter.try_acquire(share=0.5))
+        self.assertTrue(limiter.try_acquire())
+
+    def test_grows_while_latency_is_stable(self):
+        limiter = AdaptiveLimiter(initial=10, max_limit=100)
+        for _ in range(50):
+            while limiter.try_acquire():
+                pass
+            limiter.release(0.01)
+        self.assertGreater(limiter.limit, 10)
+
+    def test_shrinks_on_congestion_and_latency_rise(self):
+        limiter = AdaptiveLimiter(initial=100, min_limit=5)
+        for _ in range(100):
+            limiter.try_acquire()
+        for _ in range(20):
+            limiter.release(0.01)
+        high = limiter.limit
+        for _ in range(30):
+            limiter.try_acquire()
+            limiter.release(0.5, congested=True)
+        self.assertLess(limiter.limit, high)
+        self.assertGreaterEqual(limiter.limit, 5)
+
+
+class TestAdmissionMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    def test_route_groups(self):
+        self.assertEqual(route_group({"path": "/api/auth/refresh_token", "method": "GET"}), "auth")
+        self.assertEqual(route_group({"path": "/api/contacts/", "method": "GET"}), "read")
+        self.assertEqual(route_group({"path": "/api/contacts/", "method": "POST"}), "write")
+        self.assertIsNone(route_group({"path": "/api/health/ready", "method": "GET"}))
+
+    async def test_sheds_with_retry_after(self):
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = AdmissionMiddleware(app, initial_limit=1, min_limit=1)
+        scope = {"type": "http", "method": "POST", "path": "/api/contacts/", "headers": []}
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        first = asyncio.create_task(middleware(scope, None, send))
+        await asyncio.sleep(0)
+        await middleware(scope, None, send)
+        self.assertEqual(sent[0]["status"], 503)
+        self.assertIn((b"retry-after", b"1"), sent[0]["headers"])
+        release.set()
+        await first
+        self.assertEqual(sent[-2]["status"], 200)
+        self.assertEqual(middleware.limiters["write"].in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
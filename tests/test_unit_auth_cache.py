@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, PropertyMock, patch
+
+from fastapi import HTTPException, Request
+from jose import jwt
+from redis.exceptions import ConnectionError
+
+from src.entity.models import User
+from src.services.auth import Auth, auth_service
+from src.services.rate_limit import RateLimiter
+
+
+class TestAuthCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.email = "cached@example.com"
+        self.token = await auth_service.create_access_token(data={"sub": self.email})
+        self.redis = MagicMock()
+        self.redis.get = AsyncMock(return_value=None)
+        self.redis.set = AsyncMock()
+        self.loads = 0
+
+        async def get_user_by_email(email, db):
+            self.loads += 1
+            await asyncio.sleep(0.01)
+            return User(id=8, username="Test", email=email, password="qwerty!!", confirmation=True)
+
+        self.patches = [
+            patch.object(Auth, "cache", new_callable=PropertyMock, return_value=self.redis),
+            patch("src.services.auth.sessionmanager"),
+            patch("src.services.auth.reps_users.get_user_by_email", get_user_by_email),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        auth_service.local_users.delete(auth_service.cache_key(self.email))
+
+    async def asyncTearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        auth_service.local_users.delete(auth_service.cache_key(self.email))
+
+    async def test_coalesced_callers_get_their_own_user(self):
+        users = await asyncio.gather(*(auth_service.get_current_user(self.token) for _ in range(5)))
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(len({id(user) for user in users}), 5)
+        self.assertTrue(all(user.email == self.email for user in users))
+
+    async def test_local_fallback_gives_every_request_its_own_user(self):
+        await auth_service.get_current_user(self.token)
+        self.redis.get.side_effect = ConnectionError("down")
+        first = await auth_service.get_current_user(self.token)
+        second = await auth_service.get_current_user(self.token)
+        self.assertEqual(self.loads, 1)
+        self.assertIsNot(first, second)
+        self.assertEqual(first.email, second.email)
+
+    async def test_token_is_verified_once_per_request(self):
+        limiter = RateLimiter(times=10, seconds=60, group="test")
+        with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as decode:
+            request = Request({"type": "http", "headers": [(b"authorization", f"Bearer {self.token}".encode())]})
+            self.assertEqual(limiter.identity(request), f"user:{self.email}")
+            user = await auth_service.get_current_user(self.token, request)
+            self.assertEqual(user.email, self.email)
+            self.assertEqual(decode.call_count, 1)
+
+            request = Request({"type": "http", "headers": [(b"authorization", b"Bearer forged")],
+                               "client": ("10.0.0.1", 4000)})
+            self.assertEqual(limiter.identity(request), "ip:10.0.0.1")
+            with self.assertRaises(HTTPException):
+                await auth_service.get_current_user("forged", request)
+            self.assertEqual(decode.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from src.middleware.ban import IPBanList
+
+
+class TestIPBanList(unittest.TestCase):
+
+    def test_single_addresses(self):
+        ban_list = IPBanList(["192.168.1.1", "192.168.1.2"])
+        self.assertIn("192.168.1.1", ban_list)
+        self.assertIn("192.168.1.2", ban_list)
+        self.assertNotIn("192.168.1.3", ban_list)
+
+    def test_cidr_ranges_are_merged(self):
+        ban_list = IPBanList(["10.0.0.0/24", "10.0.1.0/24", "10.0.0.128/25"])
+        self.assertIn("10.0.0.0", ban_list)
+        self.assertIn("10.0.1.255", ban_list)
+        self.assertNotIn("10.0.2.0", ban_list)
+        self.assertNotIn("9.255.255.255", ban_list)
+
+    def test_ipv6_and_invalid_entries(self):
+        ban_list = IPBanList(["2001:db8::/32", "not an ip"])
+        self.assertEqual(len(ban_list), 1)
+        self.assertIn("2001:db8::1", ban_list)
+        self.assertNotIn("2001:db9::1", ban_list)
+        self.assertNotIn("testclient", ban_list)
+
+    def test_reload(self):
+        ban_list = IPBanList(["127.0.0.1"])
+        ban_list.load([])
+        self.assertNotIn("127.0.0.1", ban_list)
+        self.assertFalse(ban_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+
+from src.services.cache import SingleFlight, refresh_early
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.flight = SingleFlight()
+        self.loads = 0
+
+    async def load(self):
+        self.loads += 1
+        await asyncio.sleep(0.01)
+        return self.loads
+
+    async def test_concurrent_calls_share_one_load(self):
+        results = await asyncio.gather(*(self.flight.do("user", self.load) for _ in range(20)))
+        self.assertEqual(results, [1] * 20)
+        self.assertEqual(self.loads, 1)
+        self.assertNotIn("user", self.flight)
+        self.assertEqual(await self.flight.do("user", self.load), 2)
+
+    async def test_errors_reach_every_caller(self):
+        async def fail():
+            raise ConnectionError("db down")
+
+        results = await asyncio.gather(self.flight.do("user", fail), self.flight.do("user", fail),
+                                       return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertNotIn("user", self.flight)
+
+    async def test_cancelled_caller_does_not_cancel_the_load(self):
+        first = asyncio.create_task(self.flight.do("user", self.load))
+        second = asyncio.create_task(self.flight.do("user", self.load))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, 1)
+
+
+class TestRefreshEarly(unittest.TestCase):
+
+    def test_probability_grows_near_expiry(self):
+        far = sum(refresh_early(delta=1.0, expiry=100.0, now=90.0) for _ in range(1000))
+        near = sum(refresh_early(delta=1.0, expiry=100.0, now=99.5) for _ in range(1000))
+        self.assertLess(far, near)
+        self.assertTrue(refresh_early(delta=1.0, expiry=100.0, now=100.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
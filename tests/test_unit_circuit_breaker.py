@@ -0,0 +1,50 @@
+import unittest
+
+from redis.exceptions import ConnectionError, ResponseError
+
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN
+
+
+class TestCircuitBreaker(unittest.IsolatedAsyncioTestCase):
+
+    async def call(self, breaker, error=None):
+        async with breaker:
+            if error is not None:
+                raise error
+
+    async def fail(self, breaker, times):
+        for _ in range(times):
+            with self.assertRaises(ConnectionError):
+                await self.call(breaker, ConnectionError("down"))
+
+    async def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+        await self.fail(breaker, 2)
+        await self.call(breaker)
+        await self.fail(breaker, 2)
+        self.assertEqual(breaker.state, CLOSED)
+        await self.fail(breaker, 1)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            await self.call(breaker)
+
+    async def test_command_errors_do_not_count(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+        with self.assertRaises(ResponseError):
+            await self.call(breaker, ResponseError("NOSCRIPT"))
+        self.assertEqual(breaker.state, CLOSED)
+
+    async def test_half_open_probe(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        await self.fail(breaker, 1)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())  # one probe at a time
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        await self.call(breaker)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+from pydantic import ValidationError
+
+from src.conf.config import Settings
+
+
+class TestCorsSettings(unittest.TestCase):
+
+    def test_cors_is_off_by_default(self):
+        settings = Settings(_env_file=None)
+        self.assertEqual(settings.CORS_ORIGINS, [])
+        self.assertFalse(settings.CORS_ALLOW_CREDENTIALS)
+        self.assertNotIn("*", settings.CORS_ALLOW_METHODS + settings.CORS_ALLOW_HEADERS)
+
+    def test_credentials_follow_explicit_origins(self):
+        self.assertTrue(Settings(_env_file=None, CORS_ORIGINS=["https://app.example.com"]).CORS_ALLOW_CREDENTIALS)
+        self.assertFalse(Settings(_env_file=None, CORS_ORIGINS=["*"]).CORS_ALLOW_CREDENTIALS)
+
+    def test_credentials_with_any_origin_are_rejected(self):
+        with self.assertRaises(ValidationError):
+            Settings(_env_file=None, CORS_ORIGINS=["*"], CORS_ALLOW_CREDENTIALS=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
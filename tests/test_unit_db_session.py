@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+
+from src.database.db import DatabaseSessionManager, commit
+
+
+class TestDatabaseSessionManager(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.session = AsyncMock()
+        self.session.info = {}
+        self.manager = DatabaseSessionManager("postgresql+asyncpg://user@localhost/test")
+        self.manager._session_maker = MagicMock(return_value=self.session)
+
+    async def test_no_commit_by_default(self):
+        async with self.manager.session():
+            pass
+        self.session.commit.assert_not_awaited()
+        self.session.close.assert_awaited_once()
+
+    async def test_commit_policy(self):
+        async with self.manager.session(commit=True) as session:
+            await commit(session)
+        self.session.flush.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+        self.session.close.assert_awaited_once()
+
+    async def test_repositories_commit_by_default(self):
+        async with self.manager.session() as session:
+            await commit(session)
+        self.session.flush.assert_not_awaited()
+        self.session.commit.assert_awaited_once()
+
+    async def test_error_is_rolled_back_and_reraised(self):
+        with self.assertRaises(ValueError):
+            async with self.manager.session(commit=True):
+                raise ValueError("boom")
+        self.session.rollback.assert_awaited_once()
+        self.session.commit.assert_not_awaited()
+        self.session.close.assert_awaited_once()
+
+    async def test_http_errors_are_reraised(self):
+        with self.assertRaises(HTTPException):
+            async with self.manager.session():
+                raise HTTPException(status_code=404)
+        self.session.rollback.assert_awaited_once()
+
+    async def test_request_errors_are_not_logged(self):
+        with patch("src.database.db.logger") as logger:
+            for err in (HTTPException(status_code=404), RequestValidationError([])):
+                with self.assertRaises(type(err)):
+                    async with self.manager.session():
+                        raise err
+        logger.error.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
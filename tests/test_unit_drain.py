@@ -0,0 +1,103 @@
+import ast
+import asyncio
+import importlib.util
+import inspect
+import signal
+import textwrap
+import unittest
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from src.conf.server import DrainingMultiprocess
+from src.middleware.drain import DrainMiddleware, DrainingServer, InFlightTracker
+
+
+class TestDrainMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tracker = InFlightTracker()
+        self.release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await self.release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        self.middleware = DrainMiddleware(app, tracker=self.tracker)
+        self.scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+
+    async def call(self):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await self.middleware(self.scope, None, send)
+        return messages
+
+    async def test_waits_for_requests_in_flight(self):
+        request = asyncio.create_task(self.call())
+        await asyncio.sleep(0)
+        self.assertEqual(self.tracker.active, 1)
+        self.tracker.start_draining()
+        self.assertFalse(await self.tracker.wait_idle(0.01))
+        self.release.set()
+        self.assertTrue(await self.tracker.wait_idle(1))
+        messages = await request
+        self.assertEqual(messages[0]["status"], 200)
+
+    async def test_refuses_new_requests_while_draining(self):
+        self.tracker.start_draining()
+        messages = await self.call()
+        self.assertEqual(messages[0]["status"], 503)
+        self.assertIn((b"connection", b"close"), messages[0]["headers"])
+        self.assertEqual(self.tracker.active, 0)
+
+    async def test_server_drains_before_exiting(self):
+        server = DrainingServer(uvicorn.Config(self.middleware))
+        server.tracker = self.tracker
+        request = asyncio.create_task(self.call())
+        await asyncio.sleep(0)
+        server.handle_exit(signal.SIGTERM, None)
+        await asyncio.sleep(0.01)
+        self.assertTrue(self.tracker.draining)
+        self.assertFalse(server.should_exit)
+        self.release.set()
+        await request
+        await server._drain_task
+        self.assertTrue(server.should_exit)
+
+
+def method_ast(method) -> list[str]:
+    return [ast.dump(node) for node in ast.parse(textwrap.dedent(inspect.getsource(method))).body[0].body]
+
+
+class TestUvicornOverrides(unittest.TestCase):
+    # the server profiles override private uvicorn internals: these fail once an upgrade changes them
+
+    @unittest.skipUnless(importlib.util.find_spec("gunicorn"), "gunicorn is an optional extra")
+    def test_worker_serve_matches_upstream(self):
+        from uvicorn.workers import UvicornWorker
+        from src.conf.gunicorn_worker import TunedUvicornWorker
+
+        upstream = ast.parse(textwrap.dedent(inspect.getsource(UvicornWorker._serve))).body[0]
+        for node in ast.walk(upstream):
+            if isinstance(node, ast.Name) and node.id == "Server":
+                node.id = "DrainingServer"
+        self.assertEqual([ast.dump(node) for node in upstream.body], method_ast(TunedUvicornWorker._serve))
+        self.assertEqual(list(inspect.signature(UvicornWorker._install_sigquit_handler).parameters), ["self"])
+
+    def test_multiprocess_shutdown_matches_upstream(self):
+        upstream = ast.parse(textwrap.dedent(inspect.getsource(Multiprocess.shutdown))).body[0]
+        attributes = {node.attr for node in ast.walk(upstream)
+                      if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "self"}
+        self.assertEqual(attributes, {"processes", "pid"})
+        self.assertEqual(list(inspect.signature(Multiprocess.shutdown).parameters), ["self"])
+        self.assertEqual(list(inspect.signature(Multiprocess.__init__).parameters),
+                         ["self", "config", "target", "sockets"])
+        self.assertIs(DrainingMultiprocess.run, Multiprocess.run)
+
+
+if __name__ == '__main__':
+    unittest.main()
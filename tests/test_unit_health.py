@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+
+from src.services.health import HealthChecker
+
+
+async def ok():
+    return None
+
+
+async def down():
+    raise ConnectionError("connection refused")
+
+
+async def hangs():
+    await asyncio.sleep(10)
+
+
+class TestHealthChecker(unittest.IsolatedAsyncioTestCase):
+
+    async def test_not_ready_before_first_check(self):
+        checker = HealthChecker(interval=5, timeout=0.1)
+        self.assertFalse(checker.ready)
+        self.assertEqual(checker.status["status"], "starting")
+
+    async def test_ready_when_all_checks_pass(self):
+        checker = HealthChecker(interval=5, timeout=0.1)
+        checker.add_check("postgres", ok)
+        checker.add_check("redis", ok)
+        status = await checker.check()
+        self.assertTrue(checker.ready)
+        self.assertEqual(status["status"], "ok")
+
+    async def test_critical_failure_and_timeout(self):
+        checker = HealthChecker(interval=5, timeout=0.05)
+        checker.add_check("postgres", ok)
+        checker.add_check("redis", hangs)
+        status = await checker.check()
+        self.assertFalse(checker.ready)
+        self.assertEqual(status["status"], "fail")
+        self.assertFalse(status["checks"]["redis"]["ok"])
+
+    async def test_non_critical_failure_is_degraded(self):
+        checker = HealthChecker(interval=5, timeout=0.1)
+        checker.add_check("postgres", ok)
+        checker.add_check("smtp", down, critical=False)
+        status = await checker.check()
+        self.assertTrue(checker.ready)
+        self.assertEqual(status["status"], "degraded")
+        self.assertEqual(status["checks"]["smtp"]["error"], "connection refused")
+
+    async def test_stop_marks_not_ready(self):
+        checker = HealthChecker(interval=5, timeout=0.1)
+        checker.add_check("postgres", ok)
+        await checker.start()
+        self.assertTrue(checker.ready)
+        await checker.stop()
+        self.assertFalse(checker.ready)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from src.database.profiler import QueryProfiler, row_count
+
+
+class TestQueryProfiler(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.profiler = QueryProfiler(slow_ms=0, explain=True)
+        # the request's connection: only its info may be touched
+        self.conn = SimpleNamespace(info={})
+        self.statements = []
+
+        test = self
+
+        class ExplainConnection:
+            async def execution_options(self, **options):
+                test.assertEqual(options, {"profile": False})
+                return self
+
+            async def exec_driver_sql(self, statement, parameters=None):
+                test.statements.append((statement, parameters))
+                return [("Index Scan using contacts_pkey on contacts",)]
+
+        @asynccontextmanager
+        async def connect():
+            yield ExplainConnection()
+
+        self.profiler._engine = SimpleNamespace(connect=connect)
+
+    def execute(self, cursor, statement, parameters=()):
+        self.profiler._before_cursor_execute(self.conn, cursor, statement, parameters, None, False)
+        self.profiler._after_cursor_execute(self.conn, cursor, statement, parameters, None, False)
+
+    async def test_rows_are_counted_from_rowcount(self):
+        # the asyncpg adapter takes rowcount from the command status, "SELECT 3" included
+        select = SimpleNamespace(description=[("id",)], rowcount=3)
+        server_side = SimpleNamespace(description=[("id",)], rowcount=-1)
+        self.assertEqual(row_count(select), 3)
+        self.assertEqual(row_count(server_side), 0)
+
+        self.profiler.explain = False
+        self.execute(select, "SELECT id FROM contacts")
+        self.assertEqual(self.profiler.stats["SELECT id FROM contacts"].rows, 3)
+
+    async def test_slow_selects_are_explained_on_another_connection(self):
+        cursor = SimpleNamespace(description=[("id",)], rowcount=1)
+        self.execute(cursor, "SELECT id FROM contacts WHERE id = $1::INTEGER", (7,))
+        self.execute(cursor, "SELECT id FROM contacts WHERE id = $1::INTEGER", (8,))
+        await asyncio.gather(*self.profiler._tasks)
+
+        self.assertEqual(self.statements, [
+            ("SET TRANSACTION READ ONLY", None),
+            ("EXPLAIN (ANALYZE, BUFFERS) SELECT id FROM contacts WHERE id = $1::INTEGER", (7,)),
+        ])
+        self.assertEqual(self.profiler.stats["SELECT id FROM contacts WHERE id = ?"].plan,
+                         "Index Scan using contacts_pkey on contacts")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from src.services.rate_limit import LocalLimiter
+
+
+class TestLocalLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = LocalLimiter()
+
+    def test_sliding_window(self):
+        self.assertEqual(self.limiter.sliding_window("k", 2, 1000, now_ms=0), (1, 1, 1000))
+        self.assertEqual(self.limiter.sliding_window("k", 2, 1000, now_ms=100), (1, 0, 1000))
+        self.assertEqual(self.limiter.sliding_window("k", 2, 1000, now_ms=500), (0, 0, 500))
+        self.assertEqual(self.limiter.sliding_window("k", 2, 1000, now_ms=1000)[0], 1)
+
+    def test_token_bucket(self):
+        for now in (0, 0, 0):
+            self.assertEqual(self.limiter.token_bucket("k", 3, 3000, now_ms=now)[0], 1)
+        allowed, remaining, retry = self.limiter.token_bucket("k", 3, 3000, now_ms=0)
+        self.assertEqual((allowed, remaining, retry), (0, 0, 1000))
+        self.assertEqual(self.limiter.token_bucket("k", 3, 3000, now_ms=1000)[0], 1)
+
+    def test_keys_are_independent(self):
+        self.assertEqual(self.limiter.sliding_window("a", 1, 1000, now_ms=0)[0], 1)
+        self.assertEqual(self.limiter.sliding_window("b", 1, 1000, now_ms=0)[0], 1)
+        self.assertEqual(self.limiter.sliding_window("a", 1, 1000, now_ms=0)[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,23 @@
 import unittest
 from unittest.mock import AsyncMock, MagicMock
 
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.entity.models import Contact, User
+from src.entity.models import Contact, ContactTombstone, User
 from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse
 from src.repository.contacts import (
     get_contacts,
     get_contact,
     get_contacts_by_birthday,
+    get_contacts_by_phone,
+    get_contacts_by_ids,
     create_contact,
     update_contact,
-    delete_contact
+    delete_contact,
+    get_contacts_changes
 )
 
 
@@ -23,6 +26,7 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.user = User(id=8, username='Test', password="qwerty!!", confirmation=True)
         self.session = AsyncMock(spec=AsyncSession)
+        self.session.info = {}
 
     async def test_get_contacts(self):
         limit = 10
@@ -43,6 +47,16 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
         self.session.execute.return_value = mocked_contacts
         result = await get_contacts(limit, offset, self.session, self.user)
         self.assertEqual(result, contacts)
+
+    async def test_get_contacts_fields(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.return_value = mocked_contacts
+        await get_contacts(10, 0, self.session, self.user, fields=("id", "f_name", "l_name"))
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertIn("SELECT contacts.id, contacts.f_name, contacts.l_name, contacts.user_id", sql)
+        self.assertNotIn("contacts.email", sql)
+        self.assertNotIn("JOIN users", sql)
     
     async def test_get_contacts_by_birthday(self):
         today = date.today()
@@ -63,7 +77,50 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
         self.session.execute.return_value = mocked_contacts
         result = await get_contacts_by_birthday(today, end_date, self.session, self.user)
         self.assertEqual(result, contacts)
+
+    async def test_get_contacts_by_birthday_only_returns_own_contacts(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.return_value = mocked_contacts
+        await get_contacts_by_birthday(date.today(), date.today() + timedelta(days=7), self.session, self.user)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("contacts.user_id = :user_id_1", str(stmt))
+        self.assertEqual(stmt.compile().params["user_id_1"], self.user.id)
         
+
+    async def test_get_contacts_by_phone(self):
+        contacts = [Contact(id=1, 
+                    f_name='Yarko', 
+                    l_name='Durko', 
+                    email='123@123.com',
+                    phone='0630000000',
+                    phone_e164='+380630000000',
+                    birthday=date(2024, 2, 1),
+                    user_id=8,
+                    user=self.user
+                )]
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
+        result = await get_contacts_by_phone('+380630000000', self.session, self.user)
+        self.assertEqual(result, contacts)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("contacts.phone_e164 = :phone_e164_1", str(stmt))
+        self.assertIn("contacts.user_id = :user_id_1", str(stmt))
+
+
+    async def test_get_contacts_by_ids(self):
+        contacts = [Contact(id=contact_id, f_name='', l_name='', email='', phone='', user_id=8, user=self.user)
+                    for contact_id in (3, 1)]
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        self.session.execute.return_value = mocked_contacts
+        found, missing = await get_contacts_by_ids([1, 2, 3, 1], self.session, self.user)
+        self.assertEqual([contact.id for contact in found], [1, 3])
+        self.assertEqual(missing, [2])
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("contacts.id = ANY (:ids)", str(stmt))
+        self.assertEqual(stmt.compile().params["ids"], [1, 2, 3])
         
     async def test_get_contact(self):
         contact = [Contact(id=1, 
@@ -94,6 +151,7 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.l_name, body.l_name)
         self.assertEqual(result.email, body.email)
         self.assertEqual(result.phone, body.phone)
+        self.assertEqual(result.phone_e164, "+380630000000")
         self.assertEqual(result.birthday, body.birthday)
     
     async def test_update_contact(self):
@@ -124,6 +182,31 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.phone, body.phone)
         self.assertEqual(result.birthday, body.birthday)
         
+    async def test_update_contact_normalizes_phone(self):
+        body = ContactUpdateSchema(
+            f_name="test22", 
+            l_name="test2", 
+            email="test@test.com", 
+            phone="(063)1112233", 
+            birthday=date(2024, 2, 1),
+            completed=True 
+        )
+        mocked_contact = MagicMock()
+        mocked_contact.scalar_one_or_none.return_value = Contact(
+            id=2, 
+            f_name="test22", 
+            l_name="test2", 
+            email="test@test.com", 
+            phone="+380630000000", 
+            phone_e164="+380630000000", 
+            birthday=date(2024, 2, 1),
+            user=self.user
+            )
+        self.session.execute.return_value = mocked_contact
+        result = await update_contact(2, body, self.session, self.user)
+        self.assertEqual(result.phone, "(063)1112233")
+        self.assertEqual(result.phone_e164, "+380631112233")
+        
     async def test_delete_contact(self):
         mocked_contact = MagicMock()
         mocked_contact.scalar_one_or_none.return_value = Contact(
@@ -139,7 +222,59 @@ class TestNotes(unittest.IsolatedAsyncioTestCase):
         result = await delete_contact(2, self.session, self.user)
         self.session.delete.assert_called_once()
         self.session.commit.assert_called_once()
+        tombstone = self.session.add.call_args.args[0]
+        self.assertIsInstance(tombstone, ContactTombstone)
+        self.assertEqual(tombstone.contact_id, 2)
 
         self.assertIsInstance(result, Contact)
+
+    async def test_get_contacts_changes(self):
+        since = "740:752:741,748"
+        contacts = [Contact(id=1, 
+                    f_name='Yarko', 
+                    l_name='Durko', 
+                    email='123@123.com',
+                    phone='+380630000000',
+                    birthday=date(2024, 2, 1),
+                    updated_at=datetime(2024, 2, 2, 9, 0),
+                    user_id=8,
+                    user=self.user
+                )]
+        mocked_token = MagicMock()
+        mocked_token.scalar_one.return_value = "748:760:748"
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = contacts
+        mocked_tombstones = MagicMock()
+        mocked_tombstones.scalars.return_value.all.return_value = [5]
+        self.session.execute.side_effect = [mocked_token, mocked_contacts, mocked_tombstones]
+        changed, deleted, sync_token = await get_contacts_changes(since, self.session, self.user)
+        self.assertEqual(changed, contacts)
+        self.assertEqual(deleted, [5])
+        self.assertEqual(sync_token, "748:760:748")
+        stmt = str(self.session.execute.call_args_list[1].args[0])
+        self.assertIn("contacts.change_xid >= :change_xid_1 OR contacts.change_xid IN", stmt)
+
+    async def test_get_contacts_changes_initial_sync_returns_token(self):
+        mocked_token = MagicMock()
+        mocked_token.scalar_one.return_value = "748:760:748"
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.side_effect = [mocked_token, mocked_contacts]
+        changed, deleted, sync_token = await get_contacts_changes(None, self.session, self.user)
+        self.assertEqual(changed, [])
+        self.assertEqual(deleted, [])
+        self.assertEqual(sync_token, "748:760:748")
+
+    async def test_get_contacts_changes_next_page_keeps_token(self):
+        mocked_contacts = MagicMock()
+        mocked_contacts.scalars.return_value.all.return_value = []
+        self.session.execute.side_effect = [mocked_contacts]
+        changed, deleted, sync_token = await get_contacts_changes("740:752:", self.session, self.user, limit=50,
+                                                                  after=30, sync_token="748:760:748")
+        self.assertEqual(deleted, [])
+        self.assertEqual(sync_token, "748:760:748")
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIn("contacts.id > :id_2", str(stmt))
+        self.assertEqual(stmt.compile().params["param_1"], 50)
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import User
+from src.schemas.user import UserSchema
+from src.repository.users import create_user, confirmed_email, gravatar_url
+
+
+class TestUsers(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.session = AsyncMock(spec=AsyncSession)
+        self.session.info = {}
+        self.session.expunge = MagicMock()
+        self.body = UserSchema(username="tester", email="test@example.com", password="secret1")
+
+    async def test_create_user(self):
+        user = User(id=1, username="tester", email="test@example.com", avatar=gravatar_url("test@example.com"))
+        self.session.scalars.return_value.one_or_none = MagicMock(return_value=user)
+        result = await create_user(self.body, self.session)
+        self.assertIs(result, user)
+        self.session.execute.assert_not_called()
+        self.session.expunge.assert_called_once_with(user)
+        self.session.commit.assert_awaited_once()
+        self.session.refresh.assert_not_called()
+        statement = str(self.session.scalars.call_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (email) DO NOTHING RETURNING", statement)
+
+    async def test_create_existing_user(self):
+        self.session.scalars.return_value.one_or_none = MagicMock(return_value=None)
+        self.assertIsNone(await create_user(self.body, self.session))
+        self.session.commit.assert_not_called()
+
+    async def test_confirmed_email(self):
+        self.session.execute.return_value.scalar_one_or_none = MagicMock(return_value=1)
+        self.assertTrue(await confirmed_email("test@example.com", self.session))
+        statement = str(self.session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        self.assertIn("confirmation IS NOT true RETURNING users.id", statement)
+        self.session.commit.assert_awaited_once()
+
+    async def test_confirmed_email_already_confirmed(self):
+        self.session.execute.return_value.scalar_one_or_none = MagicMock(return_value=None)
+        self.assertFalse(await confirmed_email("test@example.com", self.session))
+        self.session.commit.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
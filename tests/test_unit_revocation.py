@@ -0,0 +1,57 @@
+import time
+import unittest
+
+try:
+    from fakeredis import FakeAsyncRedis
+except ImportError:
+    FakeAsyncRedis = None
+
+from src.services.revocation import BloomFilter, RevocationList
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+        self.assertTrue(all(f"jti-{i}" in bloom for i in range(1000)))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+        false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+        self.assertLess(false_positives, 300)
+
+
+@unittest.skipIf(FakeAsyncRedis is None, "fakeredis is not installed")
+class TestRevocationList(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = FakeAsyncRedis()
+        self.revoked = RevocationList("revoked", capacity=100, error_rate=0.001, interval=60, redis=self.redis)
+
+    async def asyncTearDown(self):
+        await self.redis.flushall()
+        await self.redis.close()
+
+    async def test_revoke(self):
+        self.assertFalse(await self.revoked.is_revoked("a", None))
+        await self.revoked.revoke("a", time.time() + 60)
+        self.assertTrue(await self.revoked.is_revoked("b", "a"))
+        self.assertFalse(await self.revoked.is_revoked("b"))
+
+    async def test_sync_from_other_workers(self):
+        other = RevocationList("revoked", capacity=100, error_rate=0.001, interval=60, redis=self.redis)
+        await other.revoke("a", time.time() + 60)
+        await other.revoke("expired", time.time() - 1)
+        self.assertFalse(await self.revoked.is_revoked("a"))
+        await self.revoked.sync()
+        self.assertTrue(await self.revoked.is_revoked("a"))
+        self.assertNotIn("expired", self.revoked.bloom)
+        self.assertEqual(await self.redis.zcard("revoked"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+try:
+    from fakeredis import FakeAsyncRedis
+except ImportError:  # the Lua scripts need a Redis to run against
+    FakeAsyncRedis = None
+
+from src.services.token_store import RefreshTokenStore, REUSED, ROTATED, UNKNOWN
+
+
+@unittest.skipIf(FakeAsyncRedis is None, "fakeredis[lua] is not installed")
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis = FakeAsyncRedis()
+        self.store = RefreshTokenStore(ttl_seconds=60, redis=self.redis)
+
+    async def asyncTearDown(self):
+        await self.redis.flushall()
+        await self.redis.close()
+
+    async def test_rotate(self):
+        family, jti = await self.store.create("user@example.com", "curl/8", "10.0.0.1")
+        result, new_jti = await self.store.rotate("user@example.com", family, jti)
+        self.assertEqual(result, ROTATED)
+        self.assertNotEqual(new_jti, jti)
+        result, _ = await self.store.rotate("user@example.com", family, new_jti)
+        self.assertEqual(result, ROTATED)
+
+    async def test_reuse_revokes_family(self):
+        family, jti = await self.store.create("user@example.com")
+        _, new_jti = await self.store.rotate("user@example.com", family, jti)
+        result, _ = await self.store.rotate("user@example.com", family, jti)
+        self.assertEqual(result, REUSED)
+        result, _ = await self.store.rotate("user@example.com", family, new_jti)
+        self.assertEqual(result, UNKNOWN)
+        self.assertEqual(await self.store.sessions("user@example.com"), [])
+
+    async def test_sessions_per_device(self):
+        phone, _ = await self.store.create("user@example.com", "phone")
+        laptop, _ = await self.store.create("user@example.com", "laptop")
+        sessions = await self.store.sessions("user@example.com")
+        self.assertEqual({session["id"] for session in sessions}, {phone, laptop})
+        self.assertTrue(await self.store.revoke("user@example.com", phone))
+        self.assertFalse(await self.store.revoke("other@example.com", laptop))
+        self.assertEqual([session["device"] for session in await self.store.sessions("user@example.com")],
+                         ["laptop"])
+        self.assertEqual(await self.store.revoke_all("user@example.com"), [laptop])
+        self.assertEqual(await self.store.sessions("user@example.com"), [])
+
+    async def test_expired_sessions_are_dropped(self):
+        family, _ = await self.store.create("user@example.com")
+        self.assertGreater(await self.redis.pttl(f"rt:fam:{family}"), 0)
+        await self.redis.delete(f"rt:fam:{family}")
+        self.assertEqual(await self.store.sessions("user@example.com"), [])
+        self.assertEqual(await self.redis.scard("rt:user:user@example.com"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()